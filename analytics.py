@@ -0,0 +1,202 @@
+# analytics.py
+# Выгрузка игровых событий (выполнения заданий и покупки наград) из журнала
+# в колоночные файлы, разложенные по сезонам и дням:
+#
+#   exports/season=1/day=2026-10-18/part-000000000001.parquet
+#
+# Журнал читается потоково, строки копятся пачками и пишутся в открытый файл
+# партиции. Повторный запуск дописывает только новые события.
+#
+# Нужен pyarrow (в requirements.txt его нет — боту он не нужен):
+#   pip install pyarrow
+#   python analytics.py --out exports [--format parquet|arrow]
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Dict, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - зависит от окружения
+    pa = None
+
+from ledger import Ledger, EVENT_TASK_COMPLETED, EVENT_REWARD_PURCHASED
+from coordination import FileState
+from season import SeasonCalendar
+
+EXPORTED_EVENTS = {EVENT_TASK_COMPLETED, EVENT_REWARD_PURCHASED}
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+BATCH_ROWS = 10_000
+
+COLUMNS = [
+    "seq", "ts", "user_id", "event", "item_id", "category",
+    "difficulty", "tier", "exp", "emblems", "emblem_total",
+]
+
+
+def event_schema():
+    return pa.schema([
+        ("seq", pa.int64()),
+        ("ts", pa.timestamp("s")),
+        ("user_id", pa.int64()),
+        ("event", pa.string()),
+        ("item_id", pa.int32()),
+        ("category", pa.string()),
+        ("difficulty", pa.string()),
+        ("tier", pa.string()),
+        ("exp", pa.int32()),
+        ("emblems", pa.map_(pa.string(), pa.int32())),
+        ("emblem_total", pa.int32()),
+    ])
+
+
+def event_row(event: Dict) -> Dict:
+    meta = event.get("meta", {})
+    # Покупки хранятся в журнале как списание — в выгрузке это положительная цена.
+    sign = -1 if event["type"] == EVENT_REWARD_PURCHASED else 1
+    emblems = {emb: sign * amt for emb, amt in event["emblems"].items()}
+    return {
+        "seq": event["seq"],
+        "ts": datetime.fromisoformat(event["ts"]),
+        "user_id": event["user"],
+        "event": event["type"],
+        "item_id": meta.get("task_id", meta.get("reward_id")),
+        "category": meta.get("category"),
+        "difficulty": meta.get("difficulty"),
+        "tier": meta.get("tier"),
+        "exp": event["exp"],
+        "emblems": list(emblems.items()),
+        "emblem_total": sum(emblems.values()),
+    }
+
+
+class PartitionedWriter:
+    """Пишет строки в файл партиции пачками по BATCH_ROWS; держит открытыми только текущие партиции."""
+
+    def __init__(self, root: str, fmt: str = "parquet", batch_rows: int = BATCH_ROWS):
+        if pa is None:
+            raise RuntimeError("Для выгрузки нужен pyarrow: pip install pyarrow")
+        if fmt not in FORMATS:
+            raise ValueError(f"Неизвестный формат: {fmt}")
+        self.root = root
+        self.fmt = fmt
+        self.batch_rows = batch_rows
+        self.schema = event_schema()
+        self.rows_written = 0
+        self.files = 0
+        self._writers: Dict[tuple, object] = {}
+        self._buffers: Dict[tuple, Dict[str, list]] = {}
+
+    def write(self, season: int, day: str, row: Dict) -> None:
+        key = (season, day)
+        if key not in self._writers:
+            # События идут по времени: партиция прошлого дня больше не пополнится.
+            for old_key in [k for k in self._writers if k[1] < day]:
+                self._close(old_key)
+            self._open(key, row["seq"])
+        buffer = self._buffers[key]
+        for column in COLUMNS:
+            buffer[column].append(row[column])
+        if len(buffer["seq"]) >= self.batch_rows:
+            self._flush(key)
+
+    def close(self) -> None:
+        for key in list(self._writers):
+            self._close(key)
+
+    def _open(self, key: tuple, first_seq: int) -> None:
+        season, day = key
+        directory = os.path.join(self.root, f"season={season}", f"day={day}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{first_seq:012d}{FORMATS[self.fmt]}")
+        if self.fmt == "parquet":
+            writer = pq.ParquetWriter(path, self.schema)
+        else:
+            writer = pa.ipc.new_file(path, self.schema)
+        self._writers[key] = writer
+        self._buffers[key] = {column: [] for column in COLUMNS}
+        self.files += 1
+
+    def _flush(self, key: tuple) -> None:
+        buffer = self._buffers[key]
+        if not buffer["seq"]:
+            return
+        batch = pa.record_batch([pa.array(buffer[c], self.schema.field(c).type) for c in COLUMNS], schema=self.schema)
+        if self.fmt == "parquet":
+            self._writers[key].write_batch(batch)
+        else:
+            self._writers[key].write(batch)
+        self.rows_written += batch.num_rows
+        for column in COLUMNS:
+            buffer[column].clear()
+
+    def _close(self, key: tuple) -> None:
+        self._flush(key)
+        self._writers.pop(key).close()
+        del self._buffers[key]
+
+
+def clear_partitions(out_dir: str) -> None:
+    """Удаляет выгруженные партиции и курсор: полная выгрузка пишет их заново."""
+    if not os.path.isdir(out_dir):
+        return
+    for name in os.listdir(out_dir):
+        path = os.path.join(out_dir, name)
+        if name.startswith("season=") and os.path.isdir(path):
+            shutil.rmtree(path)
+    state_path = os.path.join(out_dir, "_state.json")
+    if os.path.exists(state_path):
+        os.remove(state_path)
+
+
+def export_events(data_dir: str, out_dir: str, fmt: str = "parquet", since_seq: Optional[int] = None) -> Dict:
+    """Выгружает новые события журнала; возвращает сводку прогона."""
+    state_path = os.path.join(out_dir, "_state.json")
+    if since_seq is None:
+        since_seq = 0
+        if os.path.exists(state_path):
+            with open(state_path, encoding="utf-8") as f:
+                since_seq = json.load(f)["last_seq"]
+    if since_seq == 0:
+        # Выгрузка с начала журнала: файлы прошлых прогонов иначе задвоили бы строки.
+        clear_partitions(out_dir)
+    calendar = SeasonCalendar(FileState(os.path.join(data_dir, "season.json")))
+    # Выгрузка только читает данные бота — календарь по умолчанию на диск не пишем.
+    asyncio.run(calendar.load(create=False))
+    ledger = Ledger(os.path.join(data_dir, "ledger"))
+    writer = PartitionedWriter(out_dir, fmt)
+    last_seq = since_seq
+    try:
+        for event in ledger.events(since_seq=since_seq):
+            last_seq = event["seq"]
+            if event["type"] not in EXPORTED_EVENTS:
+                continue
+            row = event_row(event)
+            writer.write(calendar.season_at(row["ts"]), row["ts"].strftime("%Y-%m-%d"), row)
+    finally:
+        writer.close()
+    os.makedirs(out_dir, exist_ok=True)
+    with open(state_path, "w", encoding="utf-8") as f:
+        json.dump({"last_seq": last_seq}, f)
+    return {"rows": writer.rows_written, "files": writer.files, "last_seq": last_seq}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Выгрузка игровых событий в Parquet / Arrow IPC.")
+    parser.add_argument("--data", default=os.getenv("DATA_DIR", "data"), help="каталог данных бота")
+    parser.add_argument("--out", default="exports", help="куда складывать партиции")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="parquet")
+    parser.add_argument("--full", action="store_true", help="выгрузить журнал с начала")
+    args = parser.parse_args()
+    summary = export_events(args.data, args.out, args.format, since_seq=0 if args.full else None)
+    print(f"Exported {summary['rows']} rows into {summary['files']} files (last seq {summary['last_seq']}).")
+
+
+if __name__ == "__main__":
+    main()
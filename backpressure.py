@@ -0,0 +1,94 @@
+# backpressure.py
+# Ограничение параллельности апдейтов. aiogram запускает на каждый апдейт
+# отдельную задачу без предела: при всплеске сотни рендеров списков делят
+# один event loop, и медленными становятся все ответы сразу.
+#
+# ConcurrencyLimiter делит апдейты на классы (тяжёлые рендеры списков и
+# лёгкие колбэки) и держит у каждого класса свой семафор. Если у класса уже
+# ждут max_waiting апдейтов, новый колбэк не встаёт в очередь, а сразу получает
+# тост «занят» — игрок нажмёт ещё раз, а задержка остальных не растёт.
+#
+# PollingBatch задаёт размер пачки getUpdates (aiogram его не настраивает).
+
+import asyncio
+from collections import Counter
+from contextlib import suppress
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import GetUpdates, Response, TelegramMethod
+from aiogram.types import TelegramObject, Update
+
+
+class ConcurrencyLimiter(BaseMiddleware):
+    """Outer middleware: не больше limits[класс] апдейтов класса одновременно."""
+
+    def __init__(
+        self,
+        limits: Dict[str, int],
+        classify: Callable[[Update], str],
+        max_waiting: int,
+        busy_text: str,
+    ):
+        self.limits = limits
+        self.classify = classify
+        self.max_waiting = max_waiting
+        self.busy_text = busy_text
+        self._semaphores = {kind: asyncio.Semaphore(limit) for kind, limit in limits.items()}
+        self.running: Counter = Counter()
+        self.waiting: Counter = Counter()
+        self.rejected: Counter = Counter()
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        kind = self.classify(event) if isinstance(event, Update) else None
+        semaphore = self._semaphores.get(kind)
+        if semaphore is None:
+            return await handler(event, data)
+        callback = event.callback_query
+        if callback is not None and semaphore.locked() and self.waiting[kind] >= self.max_waiting:
+            self.rejected[kind] += 1
+            # Колбэк без ответа крутит у игрока часики — отвечаем сразу.
+            with suppress(TelegramBadRequest):
+                await callback.answer(self.busy_text)
+            return None
+        self.waiting[kind] += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting[kind] -= 1
+        self.running[kind] += 1
+        try:
+            return await handler(event, data)
+        finally:
+            self.running[kind] -= 1
+            semaphore.release()
+
+    def describe(self) -> str:
+        return ", ".join(
+            f"{kind}: {self.running[kind]}/{limit}, ждут {self.waiting[kind]}, отказов {self.rejected[kind]}"
+            for kind, limit in self.limits.items()
+        )
+
+
+class PollingBatch(BaseRequestMiddleware):
+    """Сессионная middleware: limit для каждого getUpdates (Telegram принимает 1–100)."""
+
+    def __init__(self, limit: int):
+        self.limit = min(max(limit, 1), 100)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot,
+        method: TelegramMethod,
+    ) -> Response:
+        if isinstance(method, GetUpdates):
+            method.limit = self.limit
+        return await make_request(bot, method)
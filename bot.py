@@ -1,37 +1,159 @@
 
+import time
+
+# Отсчёт старта — до импорта aiogram, чтобы время готовности включало импорты.
+BOOT_STARTED = time.perf_counter()
+
 import os
+import html
+import json
 import asyncio
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+import math
+from functools import lru_cache
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 from aiogram import Bot, Dispatcher, Router, F
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
-from aiogram.filters import CommandStart, Command
+from aiogram.filters import CommandStart, Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import (
     Message,
     CallbackQuery,
     InlineKeyboardMarkup,
     InlineKeyboardButton,
+    BufferedInputFile,
+    InlineQuery,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+    Update,
 )
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from rewards import REWARDS, BP_REWARDS
-from tasks import TASKS
+from watchdog import LoopWatchdog, WatchdogMiddleware
+from shutdown import InflightTracker
+from profiler import SamplingProfiler
+from backpressure import ConcurrencyLimiter, PollingBatch
+from ledger import (
+    Ledger,
+    EVENT_TASK_COMPLETED,
+    EVENT_BP_REWARD,
+    EVENT_REWARD_PURCHASED,
+    EVENT_ADMIN_GRANT,
+    EVENT_UNDO,
+    EVENT_SEASON_RESET,
+)
+from leaderboard import Leaderboard, write_entries
+from season import SeasonCalendar
+from broadcast import Broadcaster, RateLimiter
+from coordination import FileState, LocalLock, RedisLock, RedisState, hold
+from quests import QuestRotation
+from history import CompletionHistory
+from fsm_storage import create_storage
+from search import SearchIndex, normalize_query
+from planner import LevelPlanner, RewardPlanner
+from user_store import UserStoreMiddleware, create_user_store
+from keyboards import KeyboardRegistry
+from facets import CostIndex, FacetIndex, ResultMemo
+from navstate import DIFFICULTIES, NavCodec
+from tenants import Tenant, TenantLocal, TenantMiddleware, load_tenants, set_default, use_tenant
 
 BOT_TOKEN = os.getenv("BOT_TOKEN", "PASTE_YOUR_TOKEN_HERE")
+DATA_DIR = os.getenv("DATA_DIR", "data")
+TENANTS_CONFIG = os.getenv("TENANTS")  # JSON со списком ботов, см. tenants.py
+USER_STORAGE = os.getenv("USER_STORAGE", "memory")  # memory | redis://…
+# Кэш игроков над внешним хранилищем: не больше USER_CACHE_SIZE, простаивающие
+# дольше USER_CACHE_TTL секунд вытесняются (0 — без ограничения).
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "1800"))
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")  # memory | sqlite:///data/fsm.sqlite3 | redis://…
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", "600"))
+# Сколько секунд при остановке ждать начатые апдейты (Railway даёт процессу ~30 с после SIGTERM).
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "15"))
+# Файл-сигнал готовности: появляется, когда прогрев закончен и начинается опрос.
+READY_FILE = os.getenv("READY_FILE")
+# Опрос: сколько секунд держать long polling и сколько апдейтов брать за раз (1–100).
+POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", "10"))
+POLLING_LIMIT = int(os.getenv("POLLING_LIMIT", "100"))
+# Сколько апдейтов каждого класса обрабатывается одновременно и сколько может ждать,
+# прежде чем колбэки начнут получать «занят».
+HEAVY_CONCURRENCY = int(os.getenv("HEAVY_CONCURRENCY", "8"))
+LIGHT_CONCURRENCY = int(os.getenv("LIGHT_CONCURRENCY", "64"))
+BUSY_QUEUE_DEPTH = int(os.getenv("BUSY_QUEUE_DEPTH", "100"))
+ADMIN_IDS = {
+    int(part)
+    for part in os.getenv("ADMIN_IDS", "").replace(",", " ").split()
+    if part.isdigit()
+}
+
+INFLIGHT = InflightTracker()
+
+# Колбэки, которые рендерят списки, планы и подборки, — тяжёлые; остальные лёгкие.
+HEAVY_CALLBACK_PREFIXES = ("tl:", "sl:", "tc:", "te:", "tv:", "tasks_rotation_", "plan_reward_", "bp_plan", "bp_top")
+
+def update_class(update: Update) -> str:
+    if update.callback_query is not None:
+        data = update.callback_query.data or ""
+        return "heavy" if data.startswith(HEAVY_CALLBACK_PREFIXES) else "light"
+    if update.inline_query is not None:
+        return "heavy"
+    return "light"
+
+LIMITER = ConcurrencyLimiter(
+    {"heavy": HEAVY_CONCURRENCY, "light": LIGHT_CONCURRENCY},
+    update_class,
+    max_waiting=BUSY_QUEUE_DEPTH,
+    busy_text="⏳ Бот сейчас перегружен, нажми ещё раз через пару секунд.",
+)
+WATCHDOG = LoopWatchdog(
+    threshold_ms=int(os.getenv("WATCHDOG_THRESHOLD_MS", "200")),
+    buffer_size=int(os.getenv("WATCHDOG_BUFFER", "50")),
+)
+
+PROFILER = SamplingProfiler(interval_ms=int(os.getenv("PROFILE_INTERVAL_MS", "10")))
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_MAX_SECONDS = 300
+_profile_waiter: Optional[asyncio.Task] = None
+
+# Состояние и каталог текущего бота: см. tenants.py и setup_tenant().
+TENANT = TenantLocal()
+TASKS = TenantLocal("tasks")
+REWARDS = TenantLocal("rewards")
+BP_REWARDS = TenantLocal("bp_rewards")
+ALL_EMBLEMS = TenantLocal("all_emblems")
+TASK_REWARD_EMBLEMS = TenantLocal("task_reward_emblems")
+USERS: Dict[int, Dict] = TenantLocal("users")
+USER_STORE = TenantLocal("user_store")
+LEDGER: Ledger = TenantLocal("ledger")
+LEADERBOARD: Leaderboard = TenantLocal("leaderboard")
+TASK_SEARCH: SearchIndex = TenantLocal("task_search")
+REWARD_SEARCH: SearchIndex = TenantLocal("reward_search")
+PLANNER: RewardPlanner = TenantLocal("planner")
+LEVEL_PLANNER: LevelPlanner = TenantLocal("level_planner")
+QUESTS: QuestRotation = TenantLocal("quests")
+HISTORY: CompletionHistory = TenantLocal("history")
+SEASONS: SeasonCalendar = TenantLocal("seasons")
+BROADCASTER: Broadcaster = TenantLocal("broadcaster")
+SEASON_LOCK = TenantLocal("season_lock")
+BROADCAST_LOCK = TenantLocal("broadcast_lock")
+KEYBOARDS: KeyboardRegistry = TenantLocal("keyboards")
+TASK_FACETS: FacetIndex = TenantLocal("task_facets")
+REWARD_FACETS: FacetIndex = TenantLocal("reward_facets")
+REWARD_COSTS: CostIndex = TenantLocal("reward_costs")
+TASK_NAV: NavCodec = TenantLocal("task_nav")
+SHOP_NAV: NavCodec = TenantLocal("shop_nav")
+LIST_MEMO: ResultMemo = TenantLocal("list_memo")
+
+LEDGER_SNAPSHOT_EVERY = int(os.getenv("LEDGER_SNAPSHOT_EVERY", "1000"))
+LEADERBOARD_PAGE_SIZE = 10
 
 router = Router()
 
-ALL_EMBLEMS = sorted({
-    emb
-    for entry in TASKS
-    for emb in entry.get("emblems", {}).keys()
-} | {
-    emb
-    for reward in REWARDS
-    for emb in reward.get("cost", {}).keys()
-})
+class SearchStates(StatesGroup):
+    tasks = State()
+    shop = State()
 
 TASK_ICON_BY_CATEGORY = {
     "selfcare": "💆",
@@ -58,37 +180,35 @@ TASK_ICON_BY_DIFFICULTY = {
 
 DIFFICULTY_ORDER = {"easy": 0, "normal": 1, "hard": 2}
 
-TASK_REWARD_EMBLEMS = sorted({
-    emb
-    for entry in TASKS
-    for emb in (entry.get("reward_emblems") or entry.get("emblems") or {}).keys()
-})
-
-DEFAULT_TASK_FILTERS = {
-    "category": None,
-    "query": None,
-    "sort": "id",  # id | difficulty
-    "emblem": None,
-}
+LIST_PAGE_SIZE = 10
+# Сколько последних результатов фильтров помнить на игрока.
+LIST_MEMO_PER_USER = 4
 
-DEFAULT_REWARD_FILTERS = {
-    "category": None,
-    "query": None,
-    "affordable_only": False,
-    "sort": "id",  # id | cost
-}
+PLAN_MODE_TITLES = {"count": "меньше заданий", "difficulty": "полегче"}
+INLINE_PAGE_SIZE = 20       # Telegram принимает до 50 результатов за ответ
+INLINE_CACHE_TIME = 300     # секунд, сколько Telegram кэширует ответ на тот же запрос
 
-USERS: Dict[int, Dict] = {}
+ROTATION_TITLES = {
+    "daily": "🗓 Задания дня",
+    "weekly": "📅 Задания недели",
+}
 
-CURRENT_SEASON = 1
 SEASON_DURATION_DAYS = 28
-SEASON_START_DATE = datetime.utcnow()
-SEASON_END_DATE = SEASON_START_DATE + timedelta(days=SEASON_DURATION_DAYS)
+SEASON_CHECK_INTERVAL = 60      # секунд между проверками конца сезона
+REPLICA_LOCK_TTL = 30           # секунд; через столько работу упавшей реплики подхватит другая
+ROLLOVER_CHUNK = 500            # пользователей за один проход без отдачи управления циклу
+SEASON_REMINDER_DAYS = 3
+
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_CHAT_INTERVAL = float(os.getenv("BROADCAST_CHAT_INTERVAL", "1"))
 
 MAX_LVL = 50
 BASE_XP = 50        # первый уровень
 GROWTH = 1.03       # рост сложности 3% — идеально на сезон ~27 дней
 
+def is_admin(user_id: int) -> bool:
+    return user_id in TENANT.admin_ids
+
 def get_task_icon(task: Dict) -> str:
     return TASK_ICON_BY_CATEGORY.get(
         task.get("category"),
@@ -130,14 +250,14 @@ def can_afford(user: Dict, reward: Dict) -> bool:
             return False
     return True
 
-def task_button_text(task: Dict) -> str:
+def task_button_text(task: Dict, done: bool = False) -> str:
     base = f"{get_task_icon(task)} {task['name']}"
     parts = [format_emblems_short(task_reward_emblems(task))]
     exp = task_reward_exp(task)
     if exp:
         parts.append(f"+{exp}XP")
     info = " ".join(parts)
-    return build_button_text(base, info)
+    return build_button_text(base, info, prefix="✅ " if done else "")
 
 def reward_button_text(reward: Dict, user: Dict) -> str:
     base = f"{reward['emoji']} {reward['name']}"
@@ -149,11 +269,110 @@ def xp_for_level(level: int) -> int:
     """XP для перехода с этого уровня на следующий."""
     return int(BASE_XP * (GROWTH ** (level - 1)))
 
+# TOTAL_XP[level] — сколько XP нужно всего до конца уровня; считается один раз.
+TOTAL_XP = [0]
+for _level in range(1, MAX_LVL + 1):
+    TOTAL_XP.append(TOTAL_XP[-1] + xp_for_level(_level))
+
 def total_xp_for_level(level: int) -> int:
     """Сколько XP нужно всего до конца указанного уровня."""
     if level <= 0:
         return 0
-    return sum(xp_for_level(i) for i in range(1, level + 1))
+    if level <= MAX_LVL:
+        return TOTAL_XP[level]
+    return TOTAL_XP[MAX_LVL] + sum(xp_for_level(i) for i in range(MAX_LVL + 1, level + 1))
+
+def setup_tenant(tenant: Tenant) -> Tenant:
+    """Собирает состояние бота: своё у каждого, каталожное — общее для одинаковых каталогов."""
+    tasks, rewards = tenant.tasks, tenant.rewards
+    tenant.all_emblems = tenant.shared("all_emblems", lambda: sorted(
+        {emb for entry in tasks for emb in entry.get("emblems", {})}
+        | {emb for reward in rewards for emb in reward.get("cost", {})}
+    ))
+    tenant.task_reward_emblems = tenant.shared("task_reward_emblems", lambda: sorted({
+        emb for entry in tasks for emb in (entry.get("reward_emblems") or entry.get("emblems") or {})
+    }))
+    tenant.task_facets = tenant.shared("task_facets", lambda: FacetIndex(
+        tasks,
+        facets={
+            "category": lambda t: [t["category"]],
+            "emblem": lambda t: task_reward_emblems(t).keys(),
+            "difficulty": lambda t: [t.get("difficulty")],
+            "tag": lambda t: t.get("tags", []),
+        },
+        orders={
+            "id": lambda t: t["id"],
+            "difficulty": lambda t: (DIFFICULTY_ORDER.get(t.get("difficulty"), 99), t["id"]),
+        },
+    ))
+    tenant.reward_facets = tenant.shared("reward_facets", lambda: FacetIndex(
+        rewards,
+        facets={
+            "category": lambda r: [r["category"]],
+            "tier": lambda r: [r.get("tier")],
+            "tag": lambda r: r.get("tags", []),
+        },
+        orders={
+            "id": lambda r: r["id"],
+            "cost": lambda r: sum(r["cost"].values()),
+        },
+    ))
+    tenant.reward_costs = tenant.shared("reward_costs", lambda: CostIndex(rewards))
+    tenant.task_nav = tenant.shared("task_nav", lambda: NavCodec(
+        tenant.catalog_key, sorted({t["category"] for t in tasks}), tenant.task_reward_emblems, "difficulty",
+    ))
+    tenant.shop_nav = tenant.shared("shop_nav", lambda: NavCodec(
+        tenant.catalog_key, sorted({r["category"] for r in rewards}), [], "cost",
+    ))
+    tenant.keyboards = tenant.shared("keyboards", lambda: KeyboardRegistry(
+        tasks, rewards, tenant.task_reward_emblems, ROTATION_TITLES,
+        nav=tenant.task_nav, shop_nav=tenant.shop_nav, facets=tenant.task_facets,
+    ))
+    tenant.task_search = tenant.shared("task_search", lambda: SearchIndex(tasks))
+    tenant.reward_search = tenant.shared("reward_search", lambda: SearchIndex(rewards))
+    tenant.planner = tenant.shared("planner", lambda: RewardPlanner(tasks))
+    tenant.level_planner = tenant.shared("level_planner", lambda: LevelPlanner(tasks, total_xp_for_level, MAX_LVL))
+    tenant.user_store = create_user_store(
+        USER_STORAGE,
+        prefix=f"kamigami:{tenant.name}",
+        cache_size=USER_CACHE_SIZE or None,
+        idle_ttl=USER_CACHE_TTL or None,
+        emblems=tenant.all_emblems,
+    )
+    # USERS — локальный кэш хранилища игроков.
+    tenant.users = tenant.user_store.cache
+    tenant.ledger = Ledger(tenant.path("ledger"), snapshot_every=LEDGER_SNAPSHOT_EVERY)
+    tenant.leaderboard = Leaderboard()
+    tenant.leaderboard_saving = None
+    tenant.list_memo = ResultMemo(per_user=LIST_MEMO_PER_USER)
+    tenant.quests = QuestRotation(tasks)
+    tenant.history = CompletionHistory(tenant.path("history.sqlite3"), cache_size=USER_CACHE_SIZE or None)
+    if tenant.user_store.persistent:
+        # Игроки общие для реплик — календарь, рассылка и блокировки тоже в Redis.
+        redis, prefix = tenant.user_store.redis, f"kamigami:{tenant.name}"
+        season_state = RedisState(redis, f"{prefix}:season")
+        broadcast_state = RedisState(redis, f"{prefix}:broadcast")
+        tenant.season_lock = RedisLock(redis, f"{prefix}:lock:season", REPLICA_LOCK_TTL)
+        tenant.broadcast_lock = RedisLock(redis, f"{prefix}:lock:broadcast", REPLICA_LOCK_TTL)
+    else:
+        season_state = FileState(tenant.path("season.json"))
+        broadcast_state = FileState(tenant.path("broadcast.json"))
+        tenant.season_lock = LocalLock(REPLICA_LOCK_TTL)
+        tenant.broadcast_lock = LocalLock(REPLICA_LOCK_TTL)
+    tenant.broadcast_hold = None
+    tenant.seasons = SeasonCalendar(season_state, SEASON_DURATION_DAYS)
+    tenant.broadcaster = Broadcaster(
+        broadcast_state,
+        RateLimiter(
+            rate=tenant.settings.get("broadcast_rate", BROADCAST_RATE),
+            per_chat_interval=tenant.settings.get("broadcast_chat_interval", BROADCAST_CHAT_INTERVAL),
+        ),
+    )
+    return tenant
+
+TENANTS = [setup_tenant(tenant) for tenant in load_tenants(TENANTS_CONFIG, BOT_TOKEN, DATA_DIR, ADMIN_IDS)]
+set_default(TENANTS[0])
+DIFFICULTY_TITLES = {"easy": "лёгкие", "normal": "обычные", "hard": "сложные"}
 
 def get_bp_progress(user: Dict) -> str:
     lvl = user["bp_level"]
@@ -170,16 +389,6 @@ def get_bp_progress(user: Dict) -> str:
 
     return f"Боевой пропуск: уровень {lvl} — {in_level}/{need_in_level} XP до следующего уровня."
 
-def get_task_filters(user: Dict) -> Dict:
-    if "task_filters" not in user:
-        user["task_filters"] = DEFAULT_TASK_FILTERS.copy()
-    return user["task_filters"]
-
-def get_reward_filters(user: Dict) -> Dict:
-    if "reward_filters" not in user:
-        user["reward_filters"] = DEFAULT_REWARD_FILTERS.copy()
-    return user["reward_filters"]
-
 def get_user(user_id: int) -> Dict:
     if user_id not in USERS:
         USERS[user_id] = {
@@ -188,47 +397,56 @@ def get_user(user_id: int) -> Dict:
             "exp": 0,
             "bp_level": 1,
             "bp_exp_to_next": 50,
-            "completed_tasks": [],
             "pinned_tasks": [],
             "version": 2,
-            "task_filters": DEFAULT_TASK_FILTERS.copy(),
-            "reward_filters": DEFAULT_REWARD_FILTERS.copy(),
         }
     return USERS[user_id]
 
-MAX_LVL = 50
-BASE_XP = 50        # первый уровень
-GROWTH = 1.03       # рост сложности 3% — идеально на сезон 27 дней
-
-def xp_for_level(level: int) -> int:
-    """XP для перехода С ЭТОГО уровня на следующий"""
-    return int(BASE_XP * (GROWTH ** (level - 1)))
-
-def total_xp_for_level(level: int) -> int:
-    """Сколько XP нужно всего до конца уровня"""
-    if level <= 0:
-        return 0
-    return sum(xp_for_level(i) for i in range(1, level + 1))
-
-def get_bp_progress(user: Dict) -> str:
-    lvl = user["bp_level"]
-    exp = user["exp"]
-
-    if lvl >= MAX_LVL:
-        return f"Боевой пропуск: уровень {MAX_LVL} (максимум)."
+def level_for_exp(exp: int) -> int:
+    """Уровень боевого пропуска, соответствующий накопленному XP."""
+    lvl = 1
+    while lvl < MAX_LVL and exp >= total_xp_for_level(lvl):
+        lvl += 1
+    return lvl
+
+def restore_balances(balances: Dict[int, Dict]) -> None:
+    """Переносит балансы, восстановленные из журнала, в USERS и рейтинг.
+
+    Если игроки лежат во внешнем хранилище, балансы берутся оттуда, а журнал
+    восстанавливает только рейтинг.
+    """
+    if not USER_STORE.persistent:
+        for user_id, balance in balances.items():
+            user = get_user(user_id)
+            user["emblems"].update(balance["emblems"])
+            user["exp"] = balance["exp"]
+            user["bp_level"] = level_for_exp(balance["exp"])
+    if LEADERBOARD.load(TENANT.path("leaderboard.json"), SEASONS.number):
+        # Сохранённый рейтинг отстаёт от журнала только на хвост после снапшота.
+        for user_id, balance in balances.items():
+            LEADERBOARD.update(user_id, balance["exp"])
+    else:
+        LEADERBOARD.rebuild((user_id, balance["exp"]) for user_id, balance in balances.items())
 
-    current_total = total_xp_for_level(lvl - 1)
-    next_total = total_xp_for_level(lvl)
+def save_leaderboard() -> None:
+    """Пишет рейтинг в потоке по копии счетов: у миллиона игроков это секунды, опрос не ждёт.
 
-    in_level = exp - current_total
-    need_in_level = next_total - current_total
+    Записи идут по очереди, stop_tenant дожидается последней.
+    """
+    path, season, entries = TENANT.path("leaderboard.json"), SEASONS.number, LEADERBOARD.snapshot()
+    previous = TENANT.leaderboard_saving
 
-    return f"Боевой пропуск: уровень {lvl} — {in_level}/{need_in_level} XP до следующего уровня."
+    async def write() -> None:
+        if previous is not None:
+            await asyncio.gather(previous, return_exceptions=True)
+        await asyncio.to_thread(write_entries, path, season, entries)
 
+    TENANT.leaderboard_saving = asyncio.create_task(write())
 
 def add_exp(user: Dict, amount: int) -> List[Dict]:
     rewards = []
     user["exp"] += amount
+    LEADERBOARD.update(user["id"], user["exp"])
     while user["bp_level"] < MAX_LVL:
         next_level_total = total_xp_for_level(user["bp_level"])
         if user["exp"] < next_level_total:
@@ -239,13 +457,14 @@ def add_exp(user: Dict, amount: int) -> List[Dict]:
                 rewards.append(r)
                 for emb, amt in r.get("emblems", {}).items():
                     user["emblems"][emb] = user["emblems"].get(emb, 0) + amt
+                LEDGER.append(user["id"], EVENT_BP_REWARD, emblems=r.get("emblems"), level=r["level"])
     return rewards
 
 def season_time_left() -> str:
     now = datetime.utcnow()
-    if now >= SEASON_END_DATE:
+    if SEASONS.is_over(now):
         return "Сезон завершён."
-    delta = SEASON_END_DATE - now
+    delta = SEASONS.end - now
     days = delta.days
     weeks = days // 7
     rem_days = days % 7
@@ -258,26 +477,177 @@ def season_time_left() -> str:
         parts.append("меньше суток")
     return "До конца сезона: " + " ".join(parts)
 
-def build_main_menu() -> InlineKeyboardMarkup:
-    kb = InlineKeyboardBuilder()
-    kb.button(text="📜 Задания", callback_data="menu_tasks")
-    kb.button(text="🏆 Магазин наград", callback_data="menu_shop")
-    kb.button(text="🎫 Боевой пропуск", callback_data="menu_bp")
-    kb.button(text="🎖 Мои эмблемы", callback_data="menu_emblems")
-    kb.adjust(2, 2)
-    return kb.as_markup()
-
-def build_task_categories_kb() -> InlineKeyboardMarkup:
-    kb = InlineKeyboardBuilder()
-    kb.button(text="Все задания", callback_data="tasks_cat_all")
-    used_cats = sorted(set(t["category"] for t in TASKS))
-    for c in used_cats:
-        kb.button(text=c, callback_data=f"tasks_cat_{c}")
-    kb.adjust(2)
-    kb.button(text="🔍 Поиск", callback_data="tasks_search")
-    kb.button(text="⬅️ Назад", callback_data="back_main")
-    kb.adjust(2)
-    return kb.as_markup()
+def final_standings(season: int) -> Dict[int, int]:
+    """Места игроков на конец сезона, снятые до первого обнуления.
+
+    Сброс идёт пачками и убирает игроков из рейтинга, так что читать место
+    из LEADERBOARD по ходу нельзя. Снимок пишется в файл, чтобы переход,
+    продолженный после рестарта, архивировал те же места.
+    """
+    path = TENANT.path("seasons", f"season-{season:03d}-standings.json")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return {int(uid): place for uid, place in json.load(f).items()}
+    standings = {uid: place for place, (uid, _) in enumerate(LEADERBOARD.page(0, len(LEADERBOARD)), 1)}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(standings, f)
+    os.replace(tmp_path, path)
+    return standings
+
+def archive_and_reset(user: Dict, season: int, archive, standings: Dict[int, int]) -> None:
+    """Пишет итог сезона игрока в архив и обнуляет прогресс боевого пропуска."""
+    record = {
+        "season": season,
+        "user_id": user["id"],
+        "exp": user["exp"],
+        "bp_level": user["bp_level"],
+        "rank": standings.get(user["id"]),
+    }
+    archive.write(json.dumps(record) + "\n")
+    if user["exp"]:
+        LEDGER.append(user["id"], EVENT_SEASON_RESET, exp=-user["exp"], season=season)
+    user["exp"] = 0
+    user["bp_level"] = 1
+    LEADERBOARD.update(user["id"], 0)
+
+async def run_season_rollover() -> None:
+    """Переход между сезонами пачками по ROLLOVER_CHUNK, с чекпоинтом после каждой.
+
+    Между пачками управление отдаётся циклу, так что апдейты продолжают
+    обрабатываться. После рестарта переход продолжается с сохранённого курсора.
+    """
+    state = await SEASONS.begin_rollover()
+    season = state["season"]
+    os.makedirs(TENANT.path("seasons"), exist_ok=True)
+    archive_path = TENANT.path("seasons", f"season-{season:03d}.jsonl")
+    cursor, processed = state["cursor"], state["processed"]
+    standings = final_standings(season)
+    with open(archive_path, "a", encoding="utf-8") as archive:
+        while True:
+            chunk = await USER_STORE.ids(after=cursor, limit=ROLLOVER_CHUNK)
+            if not chunk:
+                break
+            users = await USER_STORE.load_many(chunk, cold=True)
+            changed = [user for user in users.values() if user["exp"] or user["bp_level"] > 1]
+            for user in changed:
+                archive_and_reset(user, season, archive, standings)
+            archive.flush()
+            await USER_STORE.save_many(changed)
+            await USER_STORE.trim()
+            cursor = chunk[-1]
+            processed += len(chunk)
+            await SEASONS.checkpoint(chunk[-1], processed)
+            await asyncio.sleep(0)
+    await SEASONS.advance()
+    save_leaderboard()
+    print(f"Season {season} closed: {processed} users processed, season {SEASONS.number} started.")
+
+async def broadcast_targets(after: Optional[int]) -> AsyncIterator[int]:
+    """Активные игроки по возрастанию id, строго после курсора рассылки."""
+    while True:
+        chunk = await USER_STORE.ids(after=after, limit=ROLLOVER_CHUNK)
+        if not chunk:
+            return
+        users = await USER_STORE.load_many(chunk, cold=True)
+        active = [user_id for user_id in chunk if user_id in users and not users[user_id].get("inactive")]
+        # Пачка нужна только для флага inactive — не держим её в кэше, пока идёт отправка.
+        await USER_STORE.trim()
+        for user_id in active:
+            yield user_id
+        after = chunk[-1]
+
+async def load_user(user_id: int) -> Dict:
+    """Игрок не из текущего апдейта (его middleware не загружает): из хранилища или новый."""
+    return await USER_STORE.load(user_id) or get_user(user_id)
+
+async def mark_inactive(user_id: int) -> None:
+    user = await load_user(user_id)
+    user["inactive"] = True
+    await USER_STORE.save(user)
+
+async def start_broadcast(bot: Bot, text: Optional[str] = None) -> Optional[Dict]:
+    """Запускает новую рассылку или, без текста, продолжает незавершённую.
+
+    Рассылку ведёт одна реплика — взявшая BROADCAST_LOCK. None, если рассылку
+    уже ведёт другая или продолжать нечего.
+    """
+    if BROADCASTER.running or not await BROADCAST_LOCK.acquire():
+        return None
+    job = await BROADCASTER.create(text) if text is not None else await BROADCASTER.load()
+    if job is None:
+        await BROADCAST_LOCK.release()
+        return None
+    task = BROADCASTER.start(bot.send_message, broadcast_targets, mark_inactive)
+    TENANT.broadcast_hold = asyncio.create_task(hold(BROADCAST_LOCK, task))
+    return job
+
+def format_broadcast_status() -> str:
+    job = BROADCASTER.job
+    if not job:
+        return "Рассылок ещё не было."
+    if BROADCASTER.running:
+        state = "идёт"
+    elif job["finished_at"]:
+        state = f"завершена {job['finished_at']}"
+    elif job.get("stopped_at"):
+        state = f"остановлена {job['stopped_at']}"
+    else:
+        state = "идёт на другой реплике или ждёт продолжения"
+    return (
+        f"📣 Рассылка {job['id']}: {state}.\n"
+        f"Отправлено: {job['sent']}, заблокировали бота: {job['blocked']}, ошибок: {job['failed']}.\n"
+        f"Скорость: {BROADCASTER.throughput():.1f} сообщ./с за {job['elapsed']:.0f} с."
+    )
+
+async def refresh_season() -> None:
+    """Перечитывает календарь: с Redis его двигает та реплика, что ведёт переход."""
+    number = SEASONS.number
+    await SEASONS.load()
+    if SEASONS.number != number:
+        # Сезон закрыла другая реплика: игроки уже обнулены, местный рейтинг — нет.
+        LEADERBOARD.clear()
+        save_leaderboard()
+
+def season_duties_due() -> bool:
+    return SEASONS.rollover is not None or SEASONS.is_over() or SEASONS.reminder_due(SEASON_REMINDER_DAYS)
+
+async def run_season_duties(bot: Bot) -> None:
+    # Под блокировкой календарь читается заново: переход могла уже закончить другая реплика.
+    await refresh_season()
+    if SEASONS.rollover is not None or SEASONS.is_over():
+        await run_season_rollover()
+    elif SEASONS.reminder_due(SEASON_REMINDER_DAYS):
+        text = (
+            f"⏳ Сезон {SEASONS.number} закончится через {SEASON_REMINDER_DAYS} дн. "
+            "Успей добрать уровни боевого пропуска!"
+        )
+        if await start_broadcast(bot, text) is not None:
+            await SEASONS.mark_reminded()
+
+async def season_tick(bot: Bot) -> None:
+    await refresh_season()
+    # Переход и напоминание делает одна реплика — взявшая SEASON_LOCK.
+    if season_duties_due() and await SEASON_LOCK.acquire():
+        await hold(SEASON_LOCK, asyncio.create_task(run_season_duties(bot)))
+    # Рассылку упавшей реплики продолжаем, когда истечёт её блокировка.
+    await start_broadcast(bot)
+
+async def season_rollover_loop(bot: Bot) -> None:
+    while True:
+        await season_tick(bot)
+        await asyncio.sleep(SEASON_CHECK_INTERVAL)
+
+async def refresh_rotations() -> None:
+    for kind in ROTATION_TITLES:
+        if QUESTS.is_stale(kind):
+            await QUESTS.rebuild(kind, list(USERS))
+
+async def quest_rotation_loop() -> None:
+    # Подборки текущего периода собирает warmup() перед опросом; цикл ловит смену периода.
+    while True:
+        await asyncio.sleep(SEASON_CHECK_INTERVAL)
+        await refresh_rotations()
 
 def summarize_task_filters(filters: Dict) -> str:
     parts = []
@@ -287,90 +657,99 @@ def summarize_task_filters(filters: Dict) -> str:
         parts.append(f"поиск: «{filters['query']}»")
     parts.append(f"сортировка: {'сложность' if filters.get('sort') == 'difficulty' else 'id'}")
     parts.append(f"эмблема: {filters.get('emblem') or 'все'}")
+    if filters.get("difficulty"):
+        parts.append(f"сложность: {DIFFICULTY_TITLES.get(filters['difficulty'], filters['difficulty'])}")
     return "; ".join(parts)
 
-def filtered_tasks(user: Dict) -> List[Dict]:
-    filters = get_task_filters(user)
-    items = TASKS
-    if filters.get("category"):
-        items = [t for t in items if t["category"] == filters["category"]]
+def task_filter_mask(filters: Dict) -> int:
+    mask = TASK_FACETS.mask({
+        "category": filters.get("category"),
+        "emblem": filters.get("emblem"),
+        "difficulty": filters.get("difficulty"),
+    })
     if filters.get("query"):
-        q = filters["query"].lower()
-        items = [t for t in items if q in t["name"].lower() or q in t.get("description", "").lower()]
-    if filters.get("emblem"):
-        needed = filters["emblem"]
-        items = [t for t in items if needed in task_reward_emblems(t)]
-    if filters.get("sort") == "difficulty":
-        items = sorted(items, key=lambda t: (DIFFICULTY_ORDER.get(t.get("difficulty"), 99), t["id"]))
-    else:
-        items = sorted(items, key=lambda t: t["id"])
-    return items
-
-def build_tasks_list(user: Dict) -> tuple[str, InlineKeyboardMarkup]:
-    filters = get_task_filters(user)
-    tasks_list = filtered_tasks(user)
+        mask &= TASK_FACETS.positions_mask(TASK_SEARCH.positions(filters["query"]))
+    return mask
+
+TASK_FILTER_FACETS = ("category", "emblem", "difficulty", "query")
+
+def task_filter_key(filters: Dict) -> Tuple:
+    """Фильтры заданий в хешируемом виде — ключ кэшей."""
+    return tuple(filters.get(name) for name in TASK_FILTER_FACETS)
+
+@lru_cache(maxsize=1024)
+def task_facet_counts(catalog: str, facet: str, key: Tuple) -> Tuple[int, ...]:
+    """Счётчики значений facet при остальных фильтрах из key (сам facet не учитывается)."""
+    others = dict(zip(TASK_FILTER_FACETS, key))
+    others[facet] = None
+    values = KEYBOARDS.task_categories if facet == "category" else KEYBOARDS.task_emblems
+    return TASK_FACETS.counts(facet, values, task_filter_mask(others))
+
+def task_filters(user: Dict, state: Dict) -> Dict:
+    """Состояние из кнопки плюс текст поиска, который хранится у игрока."""
+    return {**state, "query": user.get("task_query") if state.get("query") else None}
+
+def reward_filters(user: Dict, state: Dict) -> Dict:
+    return {**state, "query": user.get("reward_query") if state.get("query") else None}
+
+def page_nav_buttons(prefix: str, codec: NavCodec, state: Dict, page: int, pages: int) -> List[InlineKeyboardButton]:
+    if pages <= 1:
+        return []
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton(text="◀️", callback_data=prefix + codec.pack({**state, "page": page - 1})))
+    buttons.append(InlineKeyboardButton(text=f"{page + 1}/{pages}", callback_data="noop"))
+    if page < pages - 1:
+        buttons.append(InlineKeyboardButton(text="▶️", callback_data=prefix + codec.pack({**state, "page": page + 1})))
+    return buttons
+
+def build_tasks_list(user: Dict, state: Dict) -> tuple[str, InlineKeyboardMarkup]:
+    """Список заданий целиком определяется состоянием из callback_data (см. navstate.py)."""
+    filters = task_filters(user, state)
+    mask = LIST_MEMO.get(user["id"], ("tasks", *task_filter_key(filters)), lambda: task_filter_mask(filters))
+    total = mask.bit_count()
+    pages = max(-(-total // LIST_PAGE_SIZE), 1)
+    page = min(state["page"], pages - 1)
+    state = {**state, "page": page}
+    order = "difficulty" if state["sort"] == "difficulty" else "id"
+    packed = TASK_NAV.pack(state)
     kb = InlineKeyboardBuilder()
-    for t in tasks_list:
-        kb.button(text=task_button_text(t), callback_data=f"task_view_{t['id']}")
-    kb.button(text="🔍 Поиск", callback_data="tasks_search")
-    kb.button(
-        text=f"📂 Категория: {filters.get('category') or 'все'}",
-        callback_data="tasks_filter_category_menu",
-    )
-    kb.button(
-        text=f"↕️ Сортировка: {'сложность' if filters.get('sort') == 'difficulty' else 'id'}",
-        callback_data="tasks_toggle_sort",
-    )
-    kb.button(
-        text=f"🎯 Эмблема: {filters.get('emblem') or 'все'}",
-        callback_data="tasks_filter_emblem_menu",
-    )
-    kb.button(text="♻️ Сбросить фильтры", callback_data="tasks_filters_reset")
-    kb.button(text="⬅️ Категории", callback_data="menu_tasks")
-    kb.button(text="🏠 Главное меню", callback_data="back_main")
+    for t in TASK_FACETS.page(mask, order, page, LIST_PAGE_SIZE):
+        kb.button(
+            text=task_button_text(t, HISTORY.done_today(user["id"], t["id"])),
+            callback_data=f"tv:{t['id']}:{packed}",
+        )
     kb.adjust(1)
+    nav = page_nav_buttons("tl:", TASK_NAV, state, page, pages)
+    if nav:
+        kb.row(*nav)
+    difficulty = state["difficulty"]
+    next_difficulty = DIFFICULTIES[(DIFFICULTIES.index(difficulty) + 1) % len(DIFFICULTIES)]
+    for text, data in (
+        ("🔍 Поиск", "tasks_search"),
+        (f"📂 Категория: {state['category'] or 'все'}", f"tc:{packed}"),
+        (
+            f"↕️ Сортировка: {'сложность' if order == 'difficulty' else 'id'}",
+            "tl:" + TASK_NAV.pack({**state, "sort": "id" if order == "difficulty" else "difficulty", "page": 0}),
+        ),
+        (f"🎯 Эмблема: {state['emblem'] or 'все'}", f"te:{packed}"),
+        (
+            f"🎚 Сложность: {DIFFICULTY_TITLES.get(difficulty, 'все')}",
+            "tl:" + TASK_NAV.pack({**state, "difficulty": next_difficulty, "page": 0}),
+        ),
+        ("♻️ Сбросить фильтры", "tl:" + TASK_NAV.pack(TASK_NAV.default())),
+        ("⬅️ Категории", "menu_tasks"),
+        ("🏠 Главное меню", "back_main"),
+    ):
+        kb.row(InlineKeyboardButton(text=text, callback_data=data))
     text_lines = [
         "📜 Задания",
         summarize_task_filters(filters),
         "",
-        "Выбери задание из списка:",
+        f"Найдено: {total}. Выбери задание из списка:" if total else "Ничего не найдено — ослабь фильтры.",
     ]
     return "\n".join(text_lines), kb.as_markup()
 
-def build_task_emblem_filter_kb(current: Optional[str]) -> InlineKeyboardMarkup:
-    kb = InlineKeyboardBuilder()
-    for emb in TASK_REWARD_EMBLEMS:
-        marker = "✓" if emb == current else " "
-        kb.button(text=f"{marker} {emb}", callback_data=f"tasks_set_emblem_{emb}")
-    kb.button(text="Показать все", callback_data="tasks_set_emblem_clear")
-    kb.button(text="⬅️ Назад к заданиям", callback_data="tasks_back_to_list")
-    kb.adjust(2)
-    return kb.as_markup()
-
-def build_task_category_filter_kb(current: Optional[str]) -> InlineKeyboardMarkup:
-    kb = InlineKeyboardBuilder()
-    categories = sorted(set(t["category"] for t in TASKS))
-    marker_all = "✓" if not current else " "
-    kb.button(text=f"{marker_all} все", callback_data="tasks_set_category_all")
-    for cat in categories:
-        marker = "✓" if cat == current else " "
-        kb.button(text=f"{marker} {cat}", callback_data=f"tasks_set_category_{cat}")
-    kb.button(text="⬅️ Назад к заданиям", callback_data="tasks_back_to_list")
-    kb.button(text="🏠 Главное меню", callback_data="back_main")
-    kb.adjust(2)
-    return kb.as_markup()
-
-def build_shop_categories_kb() -> InlineKeyboardMarkup:
-    kb = InlineKeyboardBuilder()
-    kb.button(text="Все награды", callback_data="shop_cat_all")
-    cats = sorted(set(r["category"] for r in REWARDS))
-    for c in cats:
-        kb.button(text=c, callback_data=f"shop_cat_{c}")
-    kb.button(text="🔍 Поиск", callback_data="shop_search")
-    kb.button(text="⬅️ Назад", callback_data="back_main")
-    kb.adjust(2)
-    return kb.as_markup()
-
 def summarize_reward_filters(filters: Dict) -> str:
     parts = []
     if filters.get("category"):
@@ -381,52 +760,97 @@ def summarize_reward_filters(filters: Dict) -> str:
     parts.append(f"сортировка: {'стоимость' if filters.get('sort') == 'cost' else 'id'}")
     return "; ".join(parts)
 
-def filtered_rewards(user: Dict) -> List[Dict]:
-    filters = get_reward_filters(user)
-    items = REWARDS
-    if filters.get("category"):
-        items = [r for r in items if r["category"] == filters["category"]]
+def reward_filter_mask(user: Dict, filters: Dict) -> int:
+    mask = REWARD_FACETS.mask({
+        "category": filters.get("category"),
+        "tier": filters.get("tier"),
+        "tag": filters.get("tag"),
+    })
     if filters.get("query"):
-        q = filters["query"].lower()
-        items = [r for r in items if q in r["name"].lower() or q in r.get("description", "").lower()]
+        mask &= REWARD_FACETS.positions_mask(REWARD_SEARCH.positions(filters["query"]))
     if filters.get("affordable_only"):
-        items = [r for r in items if can_afford(user, r)]
-    if filters.get("sort") == "cost":
-        items = sorted(items, key=lambda r: sum(r["cost"].values()))
-    else:
-        items = sorted(items, key=lambda r: r["id"])
-    return items
-
-def build_rewards_list(user: Dict) -> tuple[str, InlineKeyboardMarkup]:
-    filters = get_reward_filters(user)
-    rewards_list = filtered_rewards(user)
+        mask = REWARD_COSTS.affordable(user["emblems"], mask)
+    return mask
+
+def reward_memo_key(user: Dict, filters: Dict) -> Tuple:
+    """Балансы попадают в ключ только для «только доступные» — остальным они безразличны."""
+    balances = tuple(sorted(user["emblems"].items())) if filters.get("affordable_only") else None
+    return ("rewards", filters.get("category"), filters.get("query"), balances)
+
+def build_rewards_list(user: Dict, state: Dict) -> tuple[str, InlineKeyboardMarkup]:
+    filters = reward_filters(user, state)
+    mask = LIST_MEMO.get(user["id"], reward_memo_key(user, filters), lambda: reward_filter_mask(user, filters))
+    total = mask.bit_count()
+    pages = max(-(-total // LIST_PAGE_SIZE), 1)
+    page = min(state["page"], pages - 1)
+    state = {**state, "page": page}
+    order = "cost" if state["sort"] == "cost" else "id"
     kb = InlineKeyboardBuilder()
-    for r in rewards_list:
+    for r in REWARD_FACETS.page(mask, order, page, LIST_PAGE_SIZE):
         kb.button(
             text=reward_button_text(r, user),
             callback_data=f"reward_{r['id']}",
         )
-    kb.button(
-        text=f"✅ Доступные: {'вкл' if filters.get('affordable_only') else 'выкл'}",
-        callback_data="shop_toggle_affordable",
-    )
-    kb.button(
-        text=f"↕️ Сортировка: {'эмблемы' if filters.get('sort') == 'cost' else 'id'}",
-        callback_data="shop_toggle_sort",
-    )
-    kb.button(text="♻️ Сбросить фильтры", callback_data="shop_filters_reset")
-    kb.button(text="⬅️ Категории", callback_data="menu_shop")
     kb.adjust(1)
+    nav = page_nav_buttons("sl:", SHOP_NAV, state, page, pages)
+    if nav:
+        kb.row(*nav)
+    for text, data in (
+        (
+            f"✅ Доступные: {'вкл' if state['affordable_only'] else 'выкл'}",
+            "sl:" + SHOP_NAV.pack({**state, "affordable_only": not state["affordable_only"], "page": 0}),
+        ),
+        (
+            f"↕️ Сортировка: {'эмблемы' if order == 'cost' else 'id'}",
+            "sl:" + SHOP_NAV.pack({**state, "sort": "id" if order == "cost" else "cost", "page": 0}),
+        ),
+        ("♻️ Сбросить фильтры", "sl:" + SHOP_NAV.pack(SHOP_NAV.default())),
+        ("⬅️ Категории", "menu_shop"),
+    ):
+        kb.row(InlineKeyboardButton(text=text, callback_data=data))
     text_lines = [
         "🏆 Магазин наград",
         summarize_reward_filters(filters),
         "",
-        "Выбери награду из списка:",
+        f"Найдено: {total}. Выбери награду из списка:" if total else "Ничего не найдено — ослабь фильтры.",
     ]
     return "\n".join(text_lines), kb.as_markup()
 
+def format_streak(user: Dict) -> str:
+    streak, best = HISTORY.streak(user["id"])
+    return f"🔥 Серия: {streak} дн. подряд (рекорд {best})."
+
+def format_rank(user: Dict) -> str:
+    place = LEADERBOARD.rank(user["id"])
+    if place is None:
+        return "Рейтинг сезона: ещё нет XP."
+    return f"Рейтинг сезона: {place} место из {len(LEADERBOARD)}."
+
+def player_name(user_id: int) -> str:
+    user = USERS.get(user_id)
+    return html.escape((user or {}).get("name") or f"id{user_id}")
+
+def build_top_view(user: Dict) -> str:
+    lines = [f"🏅 Топ сезона {SEASONS.number}", ""]
+    top = LEADERBOARD.top(LEADERBOARD_PAGE_SIZE)
+    if not top:
+        lines.append("Пока никто не набрал XP.")
+    for place, (user_id, exp) in enumerate(top, 1):
+        me = " ← ты" if user_id == user["id"] else ""
+        lines.append(f"{place}. {player_name(user_id)} — {exp} XP{me}")
+    place = LEADERBOARD.rank(user["id"])
+    if place is not None and place > LEADERBOARD_PAGE_SIZE:
+        lines.append("…")
+        # Соседи по рейтингу: одно место выше и одно ниже.
+        for offset, (user_id, exp) in enumerate(LEADERBOARD.page(place - 2, 3), place - 1):
+            me = " ← ты" if user_id == user["id"] else ""
+            lines.append(f"{offset}. {player_name(user_id)} — {exp} XP{me}")
+    lines.append("")
+    lines.append(format_rank(user))
+    return "\n".join(lines)
+
 def build_bp_rewards_view(user: Dict) -> str:
-    lines = [f"🎫 Боевой пропуск — сезон {CURRENT_SEASON}", season_time_left(), ""]
+    lines = [f"🎫 Боевой пропуск — сезон {SEASONS.number}", season_time_left(), format_rank(user), ""]
     lvl = user["bp_level"]
     exp = user["exp"]
     current_total = total_xp_for_level(lvl - 1)
@@ -464,6 +888,54 @@ def build_bp_rewards_view(user: Dict) -> str:
             lines.append("    " + " | ".join(detail_parts))
     return "\n".join(lines)
 
+def season_days_left(now: Optional[datetime] = None) -> int:
+    """Сколько дней осталось до конца сезона, с округлением вверх и не меньше 1."""
+    seconds = (SEASONS.end - (now or datetime.utcnow())).total_seconds()
+    return max(math.ceil(seconds / 86400), 1)
+
+def format_level_plan(user: Dict, target_level: int) -> str:
+    plan = LEVEL_PLANNER.plan(user["exp"], target_level, season_days_left())
+    if plan is None:
+        return f"✅ Уровень {min(target_level, MAX_LVL)} уже взят."
+    mix = ", ".join(
+        f"{TASK_ICON_BY_DIFFICULTY.get(d, '')} {DIFFICULTY_TITLES.get(d, d)} ×{n}" for d, n in plan["mix"]
+    )
+    return (
+        f"🎯 До уровня {plan['target_level']}: ещё {plan['need']} XP за {plan['days']} дн.\n"
+        f"    ≈ {plan['per_day']} XP в день — например, {mix} (~{plan['mix_xp']} XP)"
+    )
+
+def build_season_plan_view(user: Dict) -> str:
+    lines = [f"🎯 План на сезон {SEASONS.number}", season_time_left(), ""]
+    upcoming = [entry["level"] for entry in BP_REWARDS if entry["level"] > user["bp_level"]][:2]
+    for level in sorted(set(upcoming + [MAX_LVL])):
+        lines.append(format_level_plan(user, level))
+    lines.append("")
+    lines.append("Набор считается по типичному XP заданий каждой сложности. Свою цель: /plan N")
+    return "\n".join(lines)
+
+def build_reward_detail(user: Dict, reward: Dict, plan_mode: str = "count") -> tuple[str, InlineKeyboardMarkup]:
+    rid = reward["id"]
+    text = (
+        f"{reward['emoji']} <b>{reward['name']}</b>\n\n"
+        f"{reward.get('description', '')}\n\n"
+        "Стоимость (эмблемы):\n"
+        f"{format_emblem_cost(user, reward['cost'])}"
+    )
+    kb = InlineKeyboardBuilder()
+    kb.button(text="🎁 Получить награду", callback_data=f"reward_buy_{rid}")
+    plan = PLANNER.plan(PLANNER.shortfall(user["emblems"], reward["cost"]), plan_mode)
+    if plan:
+        text += f"\n\n🧭 Как быстрее накопить ({PLAN_MODE_TITLES[plan_mode]}):\n"
+        for task, times in plan:
+            text += f"• {get_task_icon(task)} {task['name']}" + (f" ×{times}" if times > 1 else "") + "\n"
+            kb.button(text=task_button_text(task), callback_data=f"task_view_{task['id']}")
+        other = "difficulty" if plan_mode == "count" else "count"
+        kb.button(text=f"🧭 План: {PLAN_MODE_TITLES[other]}", callback_data=f"plan_reward_{other}_{rid}")
+    kb.button(text="⬅️ К наградам", callback_data="menu_shop")
+    kb.adjust(1)
+    return text, kb.as_markup()
+
 def format_emblem_cost(user: Dict, cost: Dict[str, int]) -> str:
     parts = []
     for emb, need in cost.items():
@@ -473,8 +945,9 @@ def format_emblem_cost(user: Dict, cost: Dict[str, int]) -> str:
     return "\n".join(parts) if parts else "—"
 
 @router.message(CommandStart())
-async def cmd_start(message: Message):
-    user = get_user(message.from_user.id)
+async def cmd_start(message: Message, user: Dict):
+    user["name"] = message.from_user.full_name
+    user.pop("inactive", None)
     text = (
         "Привет! Это твой личный мотивационный ивент.\n\n"
         "• Выполняй задания.\n"
@@ -483,13 +956,69 @@ async def cmd_start(message: Message):
         "• Качай боевой пропуск сезона.\n\n"
         f"{season_time_left()}"
     )
-    await message.answer(text, reply_markup=build_main_menu())
+    await message.answer(text, reply_markup=KEYBOARDS.main_menu)
+
+@lru_cache(maxsize=1024)
+def inline_results(catalog: str, normalized: str) -> Tuple[Tuple[str, int], ...]:
+    """Совпадения для inline-режима: сначала задания, потом награды.
+
+    catalog — ключ каталога текущего бота: у ботов с одинаковым каталогом кэш общий.
+    """
+    return tuple(
+        [("t", position) for position in TASK_SEARCH.positions(normalized)]
+        + [("r", position) for position in REWARD_SEARCH.positions(normalized)]
+    )
+
+@lru_cache(maxsize=None)
+def inline_article(catalog: str, kind: str, position: int) -> InlineQueryResultArticle:
+    if kind == "t":
+        task = TASKS[position]
+        emblems = format_emblems(task_reward_emblems(task))
+        return InlineQueryResultArticle(
+            id=f"task_{task['id']}",
+            title=f"{get_task_icon(task)} {task['name']}",
+            description=f"{emblems} • +{task_reward_exp(task)} XP",
+            input_message_content=InputTextMessageContent(
+                message_text=(
+                    f"{get_task_icon(task)} <b>{html.escape(task['name'])}</b>\n\n"
+                    f"{html.escape(task.get('description', ''))}\n\n"
+                    f"Эмблемы: {emblems}\nОпыт: +{task_reward_exp(task)} XP"
+                ),
+            ),
+        )
+    reward = REWARDS[position]
+    cost = format_emblems(reward["cost"])
+    return InlineQueryResultArticle(
+        id=f"reward_{reward['id']}",
+        title=f"{reward['emoji']} {reward['name']}",
+        description=f"{reward.get('tier', '')} • {cost}",
+        input_message_content=InputTextMessageContent(
+            message_text=(
+                f"{reward['emoji']} <b>{html.escape(reward['name'])}</b>\n\n"
+                f"{html.escape(reward.get('description', ''))}\n\n"
+                f"Стоимость: {cost}"
+            ),
+        ),
+    )
+
+@router.inline_query()
+async def inline_search(inline_query: InlineQuery):
+    results = inline_results(TENANT.catalog_key, normalize_query(inline_query.query))
+    offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+    page = results[offset:offset + INLINE_PAGE_SIZE]
+    next_offset = offset + INLINE_PAGE_SIZE
+    await inline_query.answer(
+        [inline_article(TENANT.catalog_key, kind, position) for kind, position in page],
+        cache_time=INLINE_CACHE_TIME,
+        is_personal=False,
+        next_offset=str(next_offset) if next_offset < len(results) else "",
+    )
 
 @router.callback_query(F.data == "back_main")
 async def cb_back_main(callback: CallbackQuery):
     await callback.message.edit_text(
         f"Главное меню.\n{season_time_left()}",
-        reply_markup=build_main_menu()
+        reply_markup=KEYBOARDS.main_menu
     )
     await callback.answer()
 
@@ -497,133 +1026,339 @@ async def cb_back_main(callback: CallbackQuery):
 async def cb_menu_tasks(callback: CallbackQuery):
     await callback.message.edit_text(
         "📜 Задания.\nВыбери категорию или поиск.",
-        reply_markup=build_task_categories_kb()
+        reply_markup=KEYBOARDS.task_categories_kb
     )
     await callback.answer()
 
-@router.callback_query(F.data.startswith("tasks_cat_"))
-async def cb_tasks_cat(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
-    cat = callback.data.removeprefix("tasks_cat_")
-    filters = get_task_filters(user)
-    filters["category"] = None if cat == "all" else cat
-    text, kb = build_tasks_list(user)
+@router.callback_query(F.data.startswith("tl:"))
+async def cb_tasks_list(callback: CallbackQuery, user: Dict):
+    text, kb = build_tasks_list(user, TASK_NAV.unpack(callback.data.removeprefix("tl:")))
     await callback.message.edit_text(text, reply_markup=kb)
     await callback.answer()
 
+@router.callback_query(F.data.startswith("tasks_rotation_"))
+async def cb_tasks_rotation(callback: CallbackQuery, user: Dict):
+    kind = callback.data.removeprefix("tasks_rotation_")
+    if kind not in ROTATION_TITLES:
+        await callback.answer()
+        return
+    kb = InlineKeyboardBuilder()
+    for t in QUESTS.picks(callback.from_user.id, kind):
+        kb.button(
+            text=task_button_text(t, HISTORY.done_today(user["id"], t["id"])),
+            callback_data=f"task_view_{t['id']}",
+        )
+    kb.button(text="⬅️ Категории", callback_data="menu_tasks")
+    kb.button(text="🏠 Главное меню", callback_data="back_main")
+    kb.adjust(1)
+    period = "сегодня" if kind == "daily" else "на этой неделе"
+    await callback.message.edit_text(
+        f"{ROTATION_TITLES[kind]}\nТвоя подборка {period}:",
+        reply_markup=kb.as_markup()
+    )
+    await callback.answer()
+
 @router.callback_query(F.data == "tasks_search")
-async def cb_tasks_search(callback: CallbackQuery):
+async def cb_tasks_search(callback: CallbackQuery, state: FSMContext):
     await callback.message.edit_text(
         "🔍 Введи текст для поиска по заданиям (название или описание).\n\n"
         "Пока просто отправь мне сообщение — я отфильтрую список.",
     )
-    user = get_user(callback.from_user.id)
-    user["awaiting_task_search"] = True
+    await state.set_state(SearchStates.tasks)
     await callback.answer()
 
-@router.callback_query(F.data == "tasks_toggle_sort")
-async def cb_tasks_toggle_sort(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
-    filters = get_task_filters(user)
-    filters["sort"] = "difficulty" if filters.get("sort") != "difficulty" else "id"
-    text, kb = build_tasks_list(user)
-    await callback.message.edit_text(text, reply_markup=kb)
-    await callback.answer("Сортировка обновлена.")
-
-@router.callback_query(F.data == "tasks_filters_reset")
-async def cb_tasks_filters_reset(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
-    user["task_filters"] = DEFAULT_TASK_FILTERS.copy()
-    text, kb = build_tasks_list(user)
-    await callback.message.edit_text(text, reply_markup=kb)
-    await callback.answer("Фильтры сброшены.")
+@router.callback_query(F.data == "noop")
+async def cb_noop(callback: CallbackQuery):
+    await callback.answer()
 
-@router.callback_query(F.data == "tasks_filter_emblem_menu")
-async def cb_tasks_filter_emblem_menu(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
-    current = get_task_filters(user).get("emblem")
-    kb = build_task_emblem_filter_kb(current)
+@router.callback_query(F.data.startswith("te:"))
+async def cb_tasks_filter_emblem_menu(callback: CallbackQuery, user: Dict):
+    state = TASK_NAV.unpack(callback.data.removeprefix("te:"))
+    key = task_filter_key(task_filters(user, state))
+    kb = KEYBOARDS.task_emblem_filter(state, task_facet_counts(TENANT.catalog_key, "emblem", key))
     await callback.message.edit_text(
         "🎯 Фильтр по эмблемам.\nВыбери эмблему, чтобы оставить задания с этой наградой.",
         reply_markup=kb
     )
     await callback.answer()
 
-@router.callback_query(F.data == "tasks_filter_category_menu")
-async def cb_tasks_filter_category_menu(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
-    current = get_task_filters(user).get("category")
-    kb = build_task_category_filter_kb(current)
+@router.callback_query(F.data.startswith("tc:"))
+async def cb_tasks_filter_category_menu(callback: CallbackQuery, user: Dict):
+    state = TASK_NAV.unpack(callback.data.removeprefix("tc:"))
+    key = task_filter_key(task_filters(user, state))
+    kb = KEYBOARDS.task_category_filter(state, task_facet_counts(TENANT.catalog_key, "category", key))
     await callback.message.edit_text(
         "📂 Фильтр по категориям.\nВыбери категорию, чтобы сузить список заданий.",
         reply_markup=kb
     )
     await callback.answer()
 
-@router.callback_query(F.data == "tasks_set_emblem_clear")
-async def cb_tasks_set_emblem_clear(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
-    get_task_filters(user)["emblem"] = None
-    text, kb = build_tasks_list(user)
-    await callback.message.edit_text(text, reply_markup=kb)
-    await callback.answer("Фильтр снят.")
-
-@router.callback_query(F.data.startswith("tasks_set_emblem_"))
-async def cb_tasks_set_emblem(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
-    emb = callback.data.removeprefix("tasks_set_emblem_")
-    get_task_filters(user)["emblem"] = emb
-    text, kb = build_tasks_list(user)
-    await callback.message.edit_text(text, reply_markup=kb)
-    await callback.answer(f"Эмблема {emb}")
-
-@router.callback_query(F.data.startswith("tasks_set_category_"))
-async def cb_tasks_set_category(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
-    cat = callback.data.removeprefix("tasks_set_category_")
-    get_task_filters(user)["category"] = None if cat == "all" else cat
-    text, kb = build_tasks_list(user)
-    await callback.message.edit_text(text, reply_markup=kb)
-    await callback.answer(f"Категория: {cat if cat != 'all' else 'все'}")
+@router.message(Command("top"))
+async def cmd_top(message: Message, user: Dict):
+    user["name"] = message.from_user.full_name
+    await message.answer(build_top_view(user))
 
-@router.callback_query(F.data == "tasks_back_to_list")
-async def cb_tasks_back_to_list(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
-    text, kb = build_tasks_list(user)
-    await callback.message.edit_text(text, reply_markup=kb)
-    await callback.answer()
+@router.message(Command("rank"))
+async def cmd_rank(message: Message, user: Dict):
+    await message.answer(format_rank(user))
 
-@router.message()
-async def any_text(message: Message):
-    user = get_user(message.from_user.id)
-    if user.get("awaiting_task_search"):
-        query = message.text.strip()
-        user["awaiting_task_search"] = False
-        get_task_filters(user)["query"] = query
-        text, kb = build_tasks_list(user)
-        await message.answer(text, reply_markup=kb)
+@router.message(Command("plan"))
+async def cmd_plan(message: Message, command: CommandObject, user: Dict):
+    if not command.args:
+        await message.answer(build_season_plan_view(user))
+        return
+    if not command.args.strip().isdigit() or not 1 < int(command.args) <= MAX_LVL:
+        await message.answer(f"Использование: /plan N, где N — уровень от 2 до {MAX_LVL}.")
         return
-    if user.get("awaiting_shop_search"):
-        query = message.text.strip()
-        user["awaiting_shop_search"] = False
-        get_reward_filters(user)["query"] = query
-        text, kb = build_rewards_list(user)
-        await message.answer(text, reply_markup=kb)
+    await message.answer(format_level_plan(user, int(command.args)))
+
+@router.message(Command("cache"))
+async def cmd_cache(message: Message):
+    if not is_admin(message.from_user.id):
         return
+    memo = LIST_MEMO
+    lines = [
+        f"🗂 Кэш списков: попаданий {memo.hit_rate:.0%} "
+        f"({memo.hits} из {memo.hits + memo.misses}), игроков в кэше: {len(memo)}."
+    ]
+    if USER_STORE.persistent:
+        users = USER_STORE.cache
+        lines.append(
+            f"👥 Кэш игроков: {len(users)} из {users.max_size or '∞'}, попаданий {users.hit_rate:.0%} "
+            f"({users.hits} из {users.hits + users.misses}), вытеснено {users.evictions}."
+        )
+    else:
+        lines.append(f"👥 Игроки в памяти процесса: {len(USERS)}.")
+    await message.answer("\n".join(lines))
+
+@router.message(Command("slow"))
+async def cmd_slow(message: Message):
+    if not is_admin(message.from_user.id):
+        return
+    samples = WATCHDOG.recent()
+    lines = [
+        f"🐢 Лаг цикла: сейчас {WATCHDOG.last_lag_ms:.0f} мс, максимум {WATCHDOG.max_lag_ms:.0f} мс.",
+        f"Зависаний > {WATCHDOG.threshold * 1000:.0f} мс: {WATCHDOG.stalls}.",
+        f"🚦 Апдейты — {LIMITER.describe()}.",
+    ]
+    for sample in reversed(samples):
+        stack = "\n".join(sample["stack"][-4:])
+        block = (
+            f"\n<b>{sample['at']}</b> • {sample['duration_ms']} мс • "
+            f"user {sample['user_id'] or '—'} • {html.escape(str(sample['data'] or '—'))}\n"
+            f"<pre>{html.escape(stack)}</pre>"
+        )
+        # Лимит сообщения Telegram — 4096 символов, режем по целым записям.
+        if sum(len(line) + 1 for line in lines) + len(block) > 4000:
+            break
+        lines.append(block)
+    await message.answer("\n".join(lines))
+
+async def send_profile(bot: Bot, chat_id: int) -> None:
+    PROFILER.stop()
+    caption = f"🔥 Профиль: {PROFILER.samples} сэмплов за {PROFILER.elapsed():.1f} с."
+    data = PROFILER.collapsed().encode()
+    if not data:
+        await bot.send_message(chat_id, caption)
+        return
+    filename = f"profile-{datetime.utcnow():%Y%m%d-%H%M%S}.collapsed"
+    await bot.send_document(chat_id, BufferedInputFile(data, filename=filename), caption=caption)
+
+async def finish_profile_later(bot: Bot, chat_id: int, duration: int) -> None:
+    await asyncio.sleep(duration)
+    await send_profile(bot, chat_id)
+
+@router.message(Command("profile"))
+async def cmd_profile(message: Message, command: CommandObject):
+    global _profile_waiter
+    if not is_admin(message.from_user.id):
+        return
+    args = (command.args or "").split()
+    action = args[0] if args else ""
+    if action == "start":
+        if PROFILER.running:
+            await message.answer("Профайлер уже запущен. Останови: /profile stop")
+            return
+        duration = int(args[1]) if len(args) > 1 and args[1].isdigit() else PROFILE_DEFAULT_SECONDS
+        duration = min(max(duration, 1), PROFILE_MAX_SECONDS)
+        PROFILER.start(duration)
+        _profile_waiter = asyncio.create_task(
+            finish_profile_later(message.bot, message.chat.id, duration)
+        )
+        await message.answer(f"🔥 Профайлер запущен на {duration} с.")
+        return
+    if action == "stop":
+        if _profile_waiter is None or _profile_waiter.done():
+            await message.answer("Профайлер не запущен.")
+            return
+        _profile_waiter.cancel()
+        _profile_waiter = None
+        await send_profile(message.bot, message.chat.id)
+        return
+    await message.answer("Использование: /profile start [секунд] | /profile stop")
+
+@router.message(Command("broadcast"))
+async def cmd_broadcast(message: Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        return
+    text = (command.args or "").strip()
+    if not text:
+        await message.answer("Использование: /broadcast <текст>")
+        return
+    if await start_broadcast(message.bot, text) is None:
+        await BROADCASTER.load()
+        await message.answer("Рассылка уже идёт.\n\n" + format_broadcast_status())
+        return
+    await message.answer("📣 Рассылка запущена. Статус: /broadcast_status")
+
+@router.message(Command("broadcast_status"))
+async def cmd_broadcast_status(message: Message):
+    if not is_admin(message.from_user.id):
+        return
+    await BROADCASTER.load()  # рассылку может вести другая реплика
+    await message.answer(format_broadcast_status())
+
+@router.message(Command("broadcast_stop"))
+async def cmd_broadcast_stop(message: Message):
+    if not is_admin(message.from_user.id):
+        return
+    if BROADCASTER.cancel(stop=True):
+        await BROADCASTER.wait()
+        await message.answer("Рассылка остановлена.\n\n" + format_broadcast_status())
+    else:
+        await message.answer("Сейчас рассылки нет.")
+
+@router.message(Command("grant"))
+async def cmd_grant(message: Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        return
+    args = (command.args or "").split()
+    if len(args) != 3 or not args[0].isdigit() or not args[2].lstrip("-").isdigit():
+        await message.answer("Использование: /grant <user_id> <эмблема|xp> <кол-во>")
+        return
+    user = await load_user(int(args[0]))
+    what, amount = args[1], int(args[2])
+    if what.lower() == "xp":
+        LEDGER.append(user["id"], EVENT_ADMIN_GRANT, exp=amount, admin=message.from_user.id)
+        add_exp(user, amount)
+        user["bp_level"] = level_for_exp(user["exp"])
+    elif what in ALL_EMBLEMS:
+        user["emblems"][what] = user["emblems"].get(what, 0) + amount
+        LEDGER.append(user["id"], EVENT_ADMIN_GRANT, emblems={what: amount}, admin=message.from_user.id)
+    else:
+        await message.answer(f"Неизвестная эмблема. Доступные: {' '.join(ALL_EMBLEMS)}")
+        return
+    await USER_STORE.save(user)
+    await message.answer(f"Начислено пользователю {user['id']}: {what} {amount:+d}.")
+
+def format_ledger_event(event: Dict) -> str:
+    parts = [f"#{event['seq']}", event["ts"], event["type"]]
+    if event["emblems"]:
+        parts.append(" ".join(f"{emb}{amt:+d}" for emb, amt in event["emblems"].items()))
+    if event["exp"]:
+        parts.append(f"{event['exp']:+d}XP")
+    return " • ".join(parts)
+
+@router.message(Command("ledger"))
+async def cmd_ledger(message: Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        return
+    arg = (command.args or "").strip()
+    if not arg.isdigit():
+        await message.answer("Использование: /ledger <user_id>")
+        return
+    events = LEDGER.history(int(arg), limit=20)
+    if not events:
+        await message.answer("Событий нет.")
+        return
+    await message.answer("\n".join(html.escape(format_ledger_event(e)) for e in events))
+
+def apply_undo(user: Dict, undo: Dict) -> None:
+    for emb, amt in undo["emblems"].items():
+        user["emblems"][emb] = user["emblems"].get(emb, 0) + amt
+
+def revoke_bp_rewards(user: Dict, level: int) -> List[Dict]:
+    """Отменяет неотменённые награды боевого пропуска этого сезона за уровни выше level."""
+    granted: Dict[int, Dict] = {}
+    for event in LEDGER.events(user["id"]):
+        if event["type"] == EVENT_SEASON_RESET:
+            granted.clear()
+        elif event["type"] == EVENT_BP_REWARD:
+            granted[event["seq"]] = event
+        elif event["type"] == EVENT_UNDO:
+            granted.pop(event["meta"]["undo_of"], None)
+    revoked = []
+    for seq, reward in granted.items():
+        if reward.get("meta", {}).get("level", 0) > level:
+            undo = LEDGER.undo(seq)
+            apply_undo(user, undo)
+            revoked.append(undo)
+    return revoked
+
+@router.message(Command("undo"))
+async def cmd_undo(message: Message, command: CommandObject):
+    if not is_admin(message.from_user.id):
+        return
+    arg = (command.args or "").strip()
+    if not arg.isdigit():
+        await message.answer("Использование: /undo <seq>")
+        return
+    try:
+        event = LEDGER.undo(int(arg))
+    except ValueError as exc:
+        await message.answer(str(exc))
+        return
+    user = await load_user(event["user"])
+    apply_undo(user, event)
+    user["exp"] += event["exp"]
+    level = level_for_exp(user["exp"])
+    # Уровни, которые игрок теряет, забирают и свои награды — иначе он получит их снова.
+    revoked = revoke_bp_rewards(user, level) if level < user["bp_level"] else []
+    user["bp_level"] = level
+    LEADERBOARD.update(user["id"], user["exp"])
+    await USER_STORE.save(user)
+    lines = [f"Отменено: {html.escape(format_ledger_event(event))}"]
+    lines += [f"Снята награда: {html.escape(format_ledger_event(undo))}" for undo in revoked]
+    await message.answer("\n".join(lines))
+
+@router.message(Command("status"))
+async def cmd_status(message: Message, user: Dict):
+    text = (
+        "Твой статус:\n\n"
+        f"{get_bp_progress(user)}\n"
+        f"{format_streak(user)}\n"
+        f"{season_time_left()}\n\n"
+        "Эмблемы:\n"
+    )
+    for emb, val in user["emblems"].items():
+        text += f"{emb}: {val}\n"
+    await message.answer(text)
+
+@router.message(SearchStates.tasks, F.text)
+async def search_tasks_text(message: Message, state: FSMContext, user: Dict):
+    await state.clear()
+    user["task_query"] = message.text.strip()
+    text, kb = build_tasks_list(user, TASK_NAV.default(query=True))
+    await message.answer(text, reply_markup=kb)
+
+@router.message(SearchStates.shop, F.text)
+async def search_shop_text(message: Message, state: FSMContext, user: Dict):
+    await state.clear()
+    user["reward_query"] = message.text.strip()
+    text, kb = build_rewards_list(user, SHOP_NAV.default(query=True))
+    await message.answer(text, reply_markup=kb)
+
+@router.message()
+async def any_text(message: Message):
     await message.answer(
         "Я пока понимаю только команды меню.\n"
         "Используй кнопки ниже.",
-        reply_markup=build_main_menu()
+        reply_markup=KEYBOARDS.main_menu
     )
 
-@router.callback_query(F.data.startswith("task_view_"))
-async def cb_task_detail(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
-    tid = int(callback.data.removeprefix("task_view_"))
-    task = next((t for t in TASKS if t["id"] == tid), None)
-    if not task:
-        await callback.answer("Задание не найдено.", show_alert=True)
-        return
+def build_task_detail(user: Dict, task: Dict, back: str) -> tuple[str, InlineKeyboardMarkup]:
+    """Карточка задания; back — callback_data кнопки возврата к списку."""
+    tid = task["id"]
     emblems_reward = task_reward_emblems(task)
     exp_reward = task_reward_exp(task)
     text = (
@@ -634,17 +1369,40 @@ async def cb_task_detail(callback: CallbackQuery):
     for emb, amt in emblems_reward.items():
         text += f"• {emb} × {amt}\n"
     text += f"\nОпыт: +{exp_reward} XP"
+    if HISTORY.done_today(user["id"], tid):
+        text += "\n\n✅ Сегодня уже выполнено."
     kb = InlineKeyboardBuilder()
     kb.button(text="✅ Отметить выполненным", callback_data=f"task_done_{tid}")
-    kb.button(text="⬅️ К списку заданий", callback_data="tasks_back_to_list")
+    kb.button(text="⬅️ К списку заданий", callback_data=back)
     kb.button(text="🏠 Главное меню", callback_data="back_main")
     kb.adjust(1)
-    await callback.message.edit_text(text, reply_markup=kb.as_markup())
+    return text, kb.as_markup()
+
+@router.callback_query(F.data.startswith("task_view_"))
+async def cb_task_detail(callback: CallbackQuery, user: Dict):
+    tid = int(callback.data.removeprefix("task_view_"))
+    task = next((t for t in TASKS if t["id"] == tid), None)
+    if not task:
+        await callback.answer("Задание не найдено.", show_alert=True)
+        return
+    text, kb = build_task_detail(user, task, "tl:" + TASK_NAV.pack(TASK_NAV.default()))
+    await callback.message.edit_text(text, reply_markup=kb)
+    await callback.answer()
+
+@router.callback_query(F.data.regexp(r"^tv:\d+:"))
+async def cb_task_view_from_list(callback: CallbackQuery, user: Dict):
+    tid, _, packed = callback.data.removeprefix("tv:").partition(":")
+    task = next((t for t in TASKS if t["id"] == int(tid)), None)
+    if not task:
+        await callback.answer("Задание не найдено.", show_alert=True)
+        return
+    # Возврат в тот же список: состояние переупаковывается (чужой каталог — по умолчанию).
+    text, kb = build_task_detail(user, task, "tl:" + TASK_NAV.pack(TASK_NAV.unpack(packed)))
+    await callback.message.edit_text(text, reply_markup=kb)
     await callback.answer()
 
 @router.callback_query(F.data.startswith("task_done_"))
-async def cb_task_done(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
+async def cb_task_done(callback: CallbackQuery, user: Dict):
     tid = int(callback.data.removeprefix("task_done_"))
     task = next((t for t in TASKS if t["id"] == tid), None)
     if not task:
@@ -654,7 +1412,17 @@ async def cb_task_done(callback: CallbackQuery):
     exp_reward = task_reward_exp(task)
     for emb, amt in emblems_reward.items():
         user["emblems"][emb] = user["emblems"].get(emb, 0) + amt
+    LEDGER.append(
+        user["id"],
+        EVENT_TASK_COMPLETED,
+        emblems=emblems_reward,
+        exp=exp_reward,
+        task_id=tid,
+        category=task["category"],
+        difficulty=task.get("difficulty"),
+    )
     level_rewards = add_exp(user, exp_reward)
+    HISTORY.record(user["id"], tid)
     text = (
         f"✅ Задание выполнено: <b>{task['name']}</b>\n\n"
         "Ты получил:\n"
@@ -672,127 +1440,123 @@ async def cb_task_done(callback: CallbackQuery):
             if emblem_bonus:
                 parts.append(f"Эмблемы: {emblem_bonus}")
             text += f"• Уровень {r['level']}: " + " — ".join(parts) + "\n"
-    text += f"\n{get_bp_progress(user)}"
-    await callback.message.edit_text(text, reply_markup=build_main_menu())
+    text += f"\n{get_bp_progress(user)}\n{format_streak(user)}"
+    await callback.message.edit_text(text, reply_markup=KEYBOARDS.main_menu)
     await callback.answer()
 
 @router.callback_query(F.data == "menu_shop")
 async def cb_menu_shop(callback: CallbackQuery):
     await callback.message.edit_text(
         "🏆 Магазин наград.\nВыбери категорию или поиск.",
-        reply_markup=build_shop_categories_kb()
+        reply_markup=KEYBOARDS.shop_categories_kb
     )
     await callback.answer()
 
-@router.callback_query(F.data.startswith("shop_cat_"))
-async def cb_shop_cat(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
-    cat = callback.data.removeprefix("shop_cat_")
-    filters = get_reward_filters(user)
-    filters["category"] = None if cat == "all" else cat
-    text, kb = build_rewards_list(user)
+@router.callback_query(F.data.startswith("sl:"))
+async def cb_shop_list(callback: CallbackQuery, user: Dict):
+    text, kb = build_rewards_list(user, SHOP_NAV.unpack(callback.data.removeprefix("sl:")))
     await callback.message.edit_text(text, reply_markup=kb)
     await callback.answer()
 
 @router.callback_query(F.data == "shop_search")
-async def cb_shop_search(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
-    user["awaiting_shop_search"] = True
+async def cb_shop_search(callback: CallbackQuery, state: FSMContext):
+    await state.set_state(SearchStates.shop)
     await callback.message.edit_text(
         "🔍 Введи текст для поиска по наградам (название или описание).\n\n"
         "Просто отправь мне сообщение.",
     )
     await callback.answer()
 
-@router.callback_query(F.data == "shop_toggle_affordable")
-async def cb_shop_toggle_affordable(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
-    filters = get_reward_filters(user)
-    filters["affordable_only"] = not filters.get("affordable_only")
-    text, kb = build_rewards_list(user)
-    await callback.message.edit_text(text, reply_markup=kb)
-    await callback.answer("Фильтр доступных обновлён.")
-
-@router.callback_query(F.data == "shop_toggle_sort")
-async def cb_shop_toggle_sort(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
-    filters = get_reward_filters(user)
-    filters["sort"] = "cost" if filters.get("sort") != "cost" else "id"
-    text, kb = build_rewards_list(user)
-    await callback.message.edit_text(text, reply_markup=kb)
-    await callback.answer("Сортировка обновлена.")
-
-@router.callback_query(F.data == "shop_filters_reset")
-async def cb_shop_filters_reset(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
-    user["reward_filters"] = DEFAULT_REWARD_FILTERS.copy()
-    text, kb = build_rewards_list(user)
-    await callback.message.edit_text(text, reply_markup=kb)
-    await callback.answer("Фильтры сброшены.")
-
-@router.callback_query(F.data.startswith("reward_"))
-async def cb_reward_detail(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
+@router.callback_query(F.data.regexp(r"^reward_\d+$"))
+async def cb_reward_detail(callback: CallbackQuery, user: Dict):
     rid = int(callback.data.removeprefix("reward_"))
     reward = next((r for r in REWARDS if r["id"] == rid), None)
     if not reward:
         await callback.answer("Награда не найдена.", show_alert=True)
         return
-    text = (
-        f"{reward['emoji']} <b>{reward['name']}</b>\n\n"
-        f"{reward.get('description', '')}\n\n"
-        "Стоимость (эмблемы):\n"
-        f"{format_emblem_cost(user, reward['cost'])}"
-    )
-    kb = InlineKeyboardBuilder()
-    kb.button(text="🎁 Получить награду", callback_data=f"reward_buy_{rid}")
-    kb.button(text="⬅️ К наградам", callback_data="menu_shop")
-    kb.adjust(1)
-    await callback.message.edit_text(text, reply_markup=kb.as_markup())
+    text, kb = build_reward_detail(user, reward)
+    await callback.message.edit_text(text, reply_markup=kb)
     await callback.answer()
 
+@router.callback_query(F.data.startswith("plan_reward_"))
+async def cb_plan_reward(callback: CallbackQuery, user: Dict):
+    mode, _, rid = callback.data.removeprefix("plan_reward_").partition("_")
+    reward = next((r for r in REWARDS if str(r["id"]) == rid), None)
+    if not reward or mode not in PLAN_MODE_TITLES:
+        await callback.answer("Награда не найдена.", show_alert=True)
+        return
+    text, kb = build_reward_detail(user, reward, mode)
+    await callback.message.edit_text(text, reply_markup=kb)
+    await callback.answer(f"План: {PLAN_MODE_TITLES[mode]}")
+
 @router.callback_query(F.data.startswith("reward_buy_"))
-async def cb_reward_buy(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
+async def cb_reward_buy(callback: CallbackQuery, user: Dict):
     rid = int(callback.data.removeprefix("reward_buy_"))
     reward = next((r for r in REWARDS if r["id"] == rid), None)
     if not reward:
         await callback.answer("Награда не найдена.", show_alert=True)
         return
-    for emb, need in reward["cost"].items():
-        have = user["emblems"].get(emb, 0)
-        if have < need:
-            await callback.answer("Недостаточно эмблем для этой награды.", show_alert=True)
-            return
-    for emb, need in reward["cost"].items():
-        user["emblems"][emb] -= need
+    # Проверка и списание — одна атомарная операция хранилища: две реплики
+    # или два быстрых нажатия не потратят одни и те же эмблемы дважды.
+    balances = await USER_STORE.deduct(user["id"], reward["cost"])
+    if balances is None:
+        await callback.answer("Недостаточно эмблем для этой награды.", show_alert=True)
+        return
+    # Хранилище уже обновило балансы игрока в кэше.
+    LEDGER.append(
+        user["id"],
+        EVENT_REWARD_PURCHASED,
+        emblems={emb: -need for emb, need in reward["cost"].items()},
+        reward_id=rid,
+        category=reward["category"],
+        tier=reward.get("tier"),
+    )
     text = (
         f"🎁 Ты активировал награду: <b>{reward['name']}</b>\n\n"
         f"{reward.get('description', '')}\n\n"
         "Эмблемы списаны.\n"
         "Если награда физическая — Ви получит уведомление и выполнит её в реальном мире. ❤️"
     )
-    await callback.message.edit_text(text, reply_markup=build_main_menu())
+    await callback.message.edit_text(text, reply_markup=KEYBOARDS.main_menu)
     await callback.answer()
 
 @router.callback_query(F.data == "menu_bp")
-async def cb_menu_bp(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
+async def cb_menu_bp(callback: CallbackQuery, user: Dict):
     text = build_bp_rewards_view(user)
     kb = InlineKeyboardBuilder()
+    kb.button(text="🏅 Топ сезона", callback_data="bp_top")
+    kb.button(text="🎯 План на сезон", callback_data="bp_plan")
     kb.button(text="⬅️ Назад", callback_data="back_main")
     kb.adjust(1)
     await callback.message.edit_text(text, reply_markup=kb.as_markup())
     await callback.answer()
 
+@router.callback_query(F.data == "bp_top")
+async def cb_bp_top(callback: CallbackQuery, user: Dict):
+    kb = InlineKeyboardBuilder()
+    kb.button(text="⬅️ Боевой пропуск", callback_data="menu_bp")
+    kb.button(text="🏠 Главное меню", callback_data="back_main")
+    kb.adjust(1)
+    await callback.message.edit_text(build_top_view(user), reply_markup=kb.as_markup())
+    await callback.answer()
+
+@router.callback_query(F.data == "bp_plan")
+async def cb_bp_plan(callback: CallbackQuery, user: Dict):
+    kb = InlineKeyboardBuilder()
+    kb.button(text="⬅️ Боевой пропуск", callback_data="menu_bp")
+    kb.button(text="🏠 Главное меню", callback_data="back_main")
+    kb.adjust(1)
+    await callback.message.edit_text(build_season_plan_view(user), reply_markup=kb.as_markup())
+    await callback.answer()
+
 @router.callback_query(F.data == "menu_emblems")
-async def cb_menu_emblems(callback: CallbackQuery):
-    user = get_user(callback.from_user.id)
+async def cb_menu_emblems(callback: CallbackQuery, user: Dict):
     lines = ["🎖 Твои эмблемы:", ""]
     for emb, val in user["emblems"].items():
         lines.append(f"{emb} → {val}")
     lines.append("")
     lines.append(get_bp_progress(user))
+    lines.append(format_streak(user))
     lines.append(season_time_left())
     kb = InlineKeyboardBuilder()
     kb.button(text="⬅️ Назад", callback_data="back_main")
@@ -800,28 +1564,131 @@ async def cb_menu_emblems(callback: CallbackQuery):
     await callback.message.edit_text("\n".join(lines), reply_markup=kb.as_markup())
     await callback.answer()
 
-@router.message(Command("status"))
-async def cmd_status(message: Message):
-    user = get_user(message.from_user.id)
-    text = (
-        "Твой статус:\n\n"
-        f"{get_bp_progress(user)}\n"
-        f"{season_time_left()}\n\n"
-        "Эмблемы:\n"
-    )
-    for emb, val in user["emblems"].items():
-        text += f"{emb}: {val}\n"
-    await message.answer(text)
+@router.callback_query(F.data.regexp(r"^(tasks|shop)_"))
+async def cb_legacy_list(callback: CallbackQuery, user: Dict):
+    # Кнопки старых сообщений, где состояние списка хранилось у игрока.
+    if callback.data.startswith("tasks_"):
+        text, kb = build_tasks_list(user, TASK_NAV.default())
+    else:
+        text, kb = build_rewards_list(user, SHOP_NAV.default())
+    await callback.message.edit_text(text, reply_markup=kb)
+    await callback.answer()
+
+async def start_tenant(tenant: Tenant, bot: Bot) -> List[asyncio.Task]:
+    """Открывает данные бота и запускает его фоновые циклы; они наследуют арендатора."""
+    with use_tenant(tenant):
+        os.makedirs(tenant.data_dir, exist_ok=True)
+        LEDGER.on_compact = save_leaderboard
+        TENANT.leaderboard_saving = None
+        await SEASONS.load()
+        HISTORY.open()
+        await USER_STORE.start()
+        restore_balances(LEDGER.open())
+        tasks = [
+            asyncio.create_task(season_rollover_loop(bot)),
+            asyncio.create_task(quest_rotation_loop()),
+        ]
+        await start_broadcast(bot)
+    return tasks
+
+async def stop_tenant(tenant: Tenant) -> None:
+    with use_tenant(tenant):
+        BROADCASTER.cancel()
+        await BROADCASTER.wait()
+        if TENANT.broadcast_hold is not None:
+            # Блокировка снимается сразу — другая реплика продолжит рассылку без ожидания ttl.
+            await asyncio.gather(TENANT.broadcast_hold, return_exceptions=True)
+        await LEDGER.compact()
+        LEDGER.close()
+        if TENANT.leaderboard_saving is not None:
+            await TENANT.leaderboard_saving
+        HISTORY.close()
+        await USER_STORE.close()
+
+def warm_tenant() -> None:
+    """Считает заранее то, что иначе считалось бы на первых кликах после деплоя."""
+    newcomer = {"exp": 0, "bp_level": 1, "emblems": {}}
+    # Таблица рюкзака LevelPlanner и планы до ближайших наград нового игрока.
+    build_season_plan_view(newcomer)
+    for reward in REWARDS:
+        shortfall = PLANNER.shortfall(newcomer["emblems"], reward["cost"])
+        for mode in PLAN_MODE_TITLES:
+            PLANNER.plan(shortfall, mode)
+    # Счётчики меню фильтров для списка без фильтров и первая страница inline-поиска.
+    key = task_filter_key(task_filters(newcomer, TASK_NAV.default()))
+    for facet in ("category", "emblem"):
+        task_facet_counts(TENANT.catalog_key, facet, key)
+    for kind, position in inline_results(TENANT.catalog_key, "")[:INLINE_PAGE_SIZE]:
+        inline_article(TENANT.catalog_key, kind, position)
+
+async def warmup() -> float:
+    """Прогрев перед опросом; у ботов с одинаковым каталогом кэши общие, второй прогревается даром."""
+    started = time.perf_counter()
+    for tenant in TENANTS:
+        with use_tenant(tenant):
+            warm_tenant()
+            await refresh_rotations()
+    return time.perf_counter() - started
+
+def mark_ready(ready: bool) -> None:
+    if not READY_FILE:
+        return
+    if ready:
+        with open(READY_FILE, "w", encoding="utf-8") as f:
+            f.write(str(os.getpid()))
+    elif os.path.exists(READY_FILE):
+        os.remove(READY_FILE)
+
+async def on_startup(warmup_seconds: float) -> None:
+    """Хук старта aiogram: всё собрано, дальше только опрос."""
+    mark_ready(True)
+    print(f"Bot ready in {time.perf_counter() - BOOT_STARTED:.2f}s (warmup {warmup_seconds:.2f}s).")
+
+async def shutdown(background: List[asyncio.Task]) -> None:
+    """Хук остановки aiogram: опрос уже остановлен, сессии ботов ещё открыты."""
+    mark_ready(False)
+    cancelled = await INFLIGHT.drain(SHUTDOWN_TIMEOUT)
+    if cancelled:
+        print(f"Shutdown: {cancelled} updates did not finish in {SHUTDOWN_TIMEOUT:g}s and were cancelled.")
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    # Рассылки сохраняют курсор, журнал — снапшот, хранилище игроков дописывает кэш.
+    for tenant in TENANTS:
+        await stop_tenant(tenant)
+    print(f"Shutdown: {INFLIGHT.completed} updates handled, state flushed.")
 
 async def main():
-    bot = Bot(
-        BOT_TOKEN,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-    )
-    dp = Dispatcher()
+    bots = [
+        Bot(tenant.token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+        for tenant in TENANTS
+    ]
+    for bot in bots:
+        bot.session.middleware(PollingBatch(POLLING_LIMIT))
+    dp = Dispatcher(storage=create_storage(FSM_STORAGE, FSM_STATE_TTL))
+    dp.update.outer_middleware(INFLIGHT)
+    dp.update.outer_middleware(LIMITER)
+    dp.update.outer_middleware(WatchdogMiddleware(WATCHDOG))
+    dp.update.outer_middleware(TenantMiddleware({bot.id: tenant for bot, tenant in zip(bots, TENANTS)}))
+    dp.update.outer_middleware(UserStoreMiddleware(lambda: USER_STORE, get_user))
     dp.include_router(router)
-    print("Bot started...")
-    await dp.start_polling(bot)
+    background = []
+    for tenant, bot in zip(TENANTS, bots):
+        background += await start_tenant(tenant, bot)
+    dp["background"] = background
+    dp["warmup_seconds"] = await warmup()
+    dp.startup.register(on_startup)
+    dp.shutdown.register(shutdown)
+    WATCHDOG.start()
+    print(f"Bot started: {', '.join(tenant.name for tenant in TENANTS)}")
+    try:
+        # Один цикл опрашивает все боты; FSM-ключи уже содержат id бота.
+        # SIGTERM/SIGINT останавливают опрос, затем shutdown() дренирует апдейты
+        # и сбрасывает состояние, и только потом aiogram закрывает сессии ботов.
+        await dp.start_polling(*bots, polling_timeout=POLLING_TIMEOUT)
+    finally:
+        await dp.storage.close()
+        WATCHDOG.stop()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,180 @@
+# broadcast.py
+# Рассылки всем игрокам: общий лимит скорости + пауза между сообщениями в один чат,
+# чекпоинт курсора в state — файл или ключ Redis, общий для реплик (после рестарта
+# или падения реплики рассылка продолжается), учёт заблокировавших бота.
+# Сетевые сбои и 5xx повторяются с растущей паузой; после retries попыток сообщение
+# считается неотправленным, и рассылка идёт дальше, а не падает целиком.
+
+import asyncio
+import time
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from aiogram.exceptions import (
+    TelegramAPIError,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+
+class RateLimiter:
+    """Равномерно разносит отправки: не чаще rate в секунду и per_chat_interval на чат."""
+
+    def __init__(self, rate: float = 25.0, per_chat_interval: float = 1.0):
+        self.interval = 1 / rate
+        self.per_chat_interval = per_chat_interval
+        self._next_slot = 0.0
+        self._last_by_chat: Dict[int, float] = {}
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, chat_id: int) -> None:
+        async with self._lock:
+            now = time.monotonic()
+            ready_at = max(
+                self._next_slot,
+                self._last_by_chat.get(chat_id, float("-inf")) + self.per_chat_interval,
+            )
+            if ready_at > now:
+                await asyncio.sleep(ready_at - now)
+                now = time.monotonic()
+            self._next_slot = max(self._next_slot, now) + self.interval
+            self._last_by_chat[chat_id] = now
+            if len(self._last_by_chat) > 10_000:
+                cutoff = now - self.per_chat_interval
+                self._last_by_chat = {c: t for c, t in self._last_by_chat.items() if t > cutoff}
+
+
+class Broadcaster:
+    def __init__(
+        self,
+        state,
+        limiter: RateLimiter,
+        checkpoint_every: int = 50,
+        retries: int = 3,
+        backoff: float = 1.0,
+    ):
+        self.state = state
+        self.limiter = limiter
+        self.checkpoint_every = checkpoint_every
+        self.retries = retries
+        self.backoff = backoff
+        self.job: Optional[Dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def load(self) -> Optional[Dict]:
+        """Возвращает незавершённую рассылку, если её ведущий процесс упал посреди неё.
+
+        Остановленная админом рассылка не возобновляется. Во время своей рассылки
+        не перечитывает: задание в памяти новее сохранённого.
+        """
+        if self.running:
+            return None
+        job = await self.state.read()
+        if job is not None:
+            self.job = job
+        if self.job and not self.job.get("finished_at") and not self.job.get("stopped_at"):
+            return self.job
+        return None
+
+    async def create(self, text: str) -> Dict:
+        if self.running:
+            raise RuntimeError("Рассылка уже идёт.")
+        self.job = {
+            "id": datetime.utcnow().strftime("%Y%m%d-%H%M%S"),
+            "text": text,
+            "cursor": None,
+            "sent": 0,
+            "failed": 0,
+            "blocked": 0,
+            "elapsed": 0.0,
+            "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "finished_at": None,
+            "stopped_at": None,
+        }
+        await self._save()
+        return self.job
+
+    def start(
+        self,
+        send: Callable[[int, str], Awaitable],
+        user_ids: Callable[[Optional[int]], AsyncIterator[int]],
+        on_blocked: Callable[[int], Awaitable],
+    ) -> asyncio.Task:
+        self._task = asyncio.create_task(self._run(send, user_ids, on_blocked))
+        return self._task
+
+    def cancel(self, stop: bool = False) -> bool:
+        """Прерывает рассылку; stop=True — остановка админом, без возобновления."""
+        if not self.running:
+            return False
+        if stop:
+            self.job["stopped_at"] = datetime.utcnow().isoformat(timespec="seconds")
+        self._task.cancel()
+        return True
+
+    async def wait(self) -> None:
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def throughput(self) -> float:
+        if not self.job or not self.job["elapsed"]:
+            return 0.0
+        return self.job["sent"] / self.job["elapsed"]
+
+    async def _run(
+        self,
+        send: Callable[[int, str], Awaitable],
+        user_ids: Callable[[Optional[int]], AsyncIterator[int]],
+        on_blocked: Callable[[int], Awaitable],
+    ) -> None:
+        job = self.job
+        since_checkpoint = 0
+        started = time.monotonic()
+        try:
+            async for chat_id in user_ids(job["cursor"]):
+                await self._deliver(send, chat_id, job, on_blocked)
+                job["cursor"] = chat_id
+                since_checkpoint += 1
+                if since_checkpoint >= self.checkpoint_every:
+                    job["elapsed"] += time.monotonic() - started
+                    started = time.monotonic()
+                    await self._save()
+                    since_checkpoint = 0
+            job["finished_at"] = datetime.utcnow().isoformat(timespec="seconds")
+        finally:
+            job["elapsed"] += time.monotonic() - started
+            await self._save()
+
+    async def _deliver(self, send, chat_id: int, job: Dict, on_blocked) -> None:
+        attempt = 0
+        while True:
+            await self.limiter.acquire(chat_id)
+            try:
+                await send(chat_id, job["text"])
+            except TelegramRetryAfter as exc:
+                await asyncio.sleep(exc.retry_after)
+                continue
+            except TelegramForbiddenError:
+                job["blocked"] += 1
+                await on_blocked(chat_id)
+            except (TelegramNetworkError, TelegramServerError):
+                attempt += 1
+                if attempt <= self.retries:
+                    await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+                    continue
+                job["failed"] += 1
+            except TelegramAPIError:
+                # BadRequest, «чат не найден» и прочее: повтор не поможет.
+                job["failed"] += 1
+            else:
+                job["sent"] += 1
+            return
+
+    async def _save(self) -> None:
+        await self.state.write(self.job)
@@ -0,0 +1,145 @@
+# coordination.py
+# Общее состояние и блокировки для нескольких реплик одного бота.
+#
+# Календарь сезонов и задание рассылки — маленькие JSON-документы. С одной
+# репликой они лежат в файлах (FileState), с игроками в Redis — там же, в ключах
+# {prefix}:season и {prefix}:broadcast (RedisState), чтобы все реплики видели
+# один сезон и одну рассылку.
+#
+# Переход сезона и рассылку ведёт одна реплика: та, что взяла блокировку
+# (RedisLock — SET NX с истечением, LocalLock — флаг в процессе). hold() держит
+# блокировку, пока идёт работа, и продлевает её; если продлить не вышло (реплика
+# зависла дольше ttl и блокировку взял другой), работа отменяется. Упавшая
+# реплика блокировку не снимет — она истечёт через ttl, и работу подхватит
+# следующая по сохранённому курсору.
+
+import asyncio
+import json
+import os
+import uuid
+from typing import Any, Dict, Optional
+
+# KEYS[1] — блокировка, ARGV[1] — токен владельца, ARGV[2] — новый ttl в мс.
+EXTEND_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class FileState:
+    def __init__(self, path: str):
+        self.path = path
+
+    async def read(self) -> Optional[Dict]:
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+    async def write(self, data: Dict) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class RedisState:
+    def __init__(self, redis, key: str):
+        self.redis = redis
+        self.key = key
+
+    async def read(self) -> Optional[Dict]:
+        raw = await self.redis.get(self.key)
+        return None if raw is None else json.loads(raw)
+
+    async def write(self, data: Dict) -> None:
+        await self.redis.set(self.key, json.dumps(data, ensure_ascii=False))
+
+
+class LocalLock:
+    """Блокировка в пределах процесса — для единственной реплики."""
+
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        self.held = False
+
+    async def acquire(self) -> bool:
+        if self.held:
+            return False
+        self.held = True
+        return True
+
+    async def extend(self) -> bool:
+        return self.held
+
+    async def release(self) -> None:
+        self.held = False
+
+
+class RedisLock:
+    def __init__(self, redis, key: str, ttl: float = 30.0):
+        self.redis = redis
+        self.key = key
+        self.ttl = ttl
+        self.token: Optional[str] = None
+        self._extend = redis.register_script(EXTEND_SCRIPT)
+        self._release = redis.register_script(RELEASE_SCRIPT)
+
+    @property
+    def held(self) -> bool:
+        return self.token is not None
+
+    async def acquire(self) -> bool:
+        token = uuid.uuid4().hex
+        if not await self.redis.set(self.key, token, nx=True, px=int(self.ttl * 1000)):
+            return False
+        self.token = token
+        return True
+
+    async def extend(self) -> bool:
+        if self.token is None:
+            return False
+        if await self._extend(keys=[self.key], args=[self.token, int(self.ttl * 1000)]):
+            return True
+        self.token = None
+        return False
+
+    async def release(self) -> None:
+        if self.token is not None:
+            await self._release(keys=[self.key], args=[self.token])
+            self.token = None
+
+
+async def hold(lock, task: asyncio.Task) -> Any:
+    """Ждёт task, продлевая уже взятую блокировку; снимает её, когда task закончился.
+
+    Если блокировку потеряли, task отменяется и возвращается None — цикл, который
+    вызвал hold(), продолжает работать.
+    """
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=lock.ttl / 3)
+            if done:
+                return task.result()
+            if not await lock.extend():
+                # Блокировку перехватила другая реплика — вторая копия работы не нужна.
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                return None
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        await lock.release()
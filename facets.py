@@ -0,0 +1,157 @@
+# facets.py
+# Фильтры каталога на битсетах. Для каждого значения каждого измерения
+# (категория, эмблема, сложность, тир, тег) заранее посчитана маска позиций
+# каталога: фильтр — AND масок, число результатов — popcount. Порядки сортировки
+# тоже посчитаны заранее, а в объекты превращается только видимая страница.
+# ResultMemo помнит последние результаты фильтров каждого игрока.
+
+import bisect
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class FacetIndex:
+    def __init__(
+        self,
+        items: List[Dict],
+        facets: Dict[str, Callable[[Dict], Iterable[Any]]],
+        orders: Dict[str, Callable[[Dict], Any]],
+    ):
+        self.items = items
+        self.full = (1 << len(items)) - 1
+        # измерение -> значение -> маска позиций
+        self.facets: Dict[str, Dict[Any, int]] = {name: {} for name in facets}
+        for position, item in enumerate(items):
+            bit = 1 << position
+            for name, values in facets.items():
+                masks = self.facets[name]
+                for value in values(item):
+                    masks[value] = masks.get(value, 0) | bit
+        # порядок -> позиции каталога в этом порядке
+        self.orders: Dict[str, List[int]] = {
+            name: sorted(range(len(items)), key=lambda p, key=key: key(items[p]))
+            for name, key in orders.items()
+        }
+        self.positions_mask = lru_cache(maxsize=256)(self._positions_mask)
+
+    def values(self, facet: str) -> List[Any]:
+        return sorted(self.facets[facet])
+
+    def mask(self, selected: Dict[str, Any]) -> int:
+        """AND масок выбранных значений; None в измерении — без ограничения."""
+        mask = self.full
+        for facet, value in selected.items():
+            if value is not None:
+                mask &= self.facets[facet].get(value, 0)
+        return mask
+
+    def counts(self, facet: str, values: List[Any], mask: int) -> Tuple[int, ...]:
+        """Сколько элементов маски у каждого значения — popcount, без обхода каталога."""
+        masks = self.facets[facet]
+        return tuple((mask & masks.get(value, 0)).bit_count() for value in values)
+
+    @staticmethod
+    def _positions_mask(positions: Tuple[int, ...]) -> int:
+        mask = 0
+        for position in positions:
+            mask |= 1 << position
+        return mask
+
+    def page(self, mask: int, order: str, page: int, size: int) -> List[Dict]:
+        """Элементы маски в заданном порядке, только страница page (с нуля)."""
+        skip = page * size
+        result: List[Dict] = []
+        if not mask:
+            return result
+        for position in self.orders[order]:
+            if not mask >> position & 1:
+                continue
+            if skip:
+                skip -= 1
+                continue
+            result.append(self.items[position])
+            if len(result) == size:
+                break
+        return result
+
+
+class CostIndex:
+    """Маска наград, на которые хватает эмблем: бинарный поиск по порогам каждой эмблемы."""
+
+    def __init__(self, items: List[Dict], cost: Callable[[Dict], Dict[str, int]] = lambda item: item["cost"]):
+        self.full = (1 << len(items)) - 1
+        by_emblem: Dict[str, List[Tuple[int, int]]] = {}
+        for position, item in enumerate(items):
+            for emb, need in cost(item).items():
+                by_emblem.setdefault(emb, []).append((need, position))
+        # эмблема -> (пороги цены, маска «цена ≤ порога» для каждого, маска «эмблема не нужна»)
+        self._emblems: Dict[str, Tuple[List[int], List[int], int]] = {}
+        for emb, entries in by_emblem.items():
+            entries.sort()
+            thresholds: List[int] = []
+            masks: List[int] = []
+            needs_it = 0
+            for need, position in entries:
+                needs_it |= 1 << position
+                if thresholds and thresholds[-1] == need:
+                    masks[-1] |= 1 << position
+                else:
+                    thresholds.append(need)
+                    masks.append((masks[-1] if masks else 0) | 1 << position)
+            self._emblems[emb] = (thresholds, masks, self.full & ~needs_it)
+
+    def affordable(self, have: Dict[str, int], within: Optional[int] = None) -> int:
+        mask = self.full if within is None else within
+        for emb, (thresholds, masks, free) in self._emblems.items():
+            index = bisect.bisect_right(thresholds, have.get(emb, 0))
+            mask &= free | (masks[index - 1] if index else 0)
+            if not mask:
+                break
+        return mask
+
+
+class ResultMemo:
+    """Последние результаты фильтров каждого игрока: ключ фильтра -> маска.
+
+    Листание страниц и возврат из карточки не пересчитывают фильтр. Ключ
+    включает всё, от чего зависит результат (для «только доступные» — балансы),
+    поэтому смена фильтра или баланса просто даёт другой ключ, а старые
+    записи вытесняются: у игрока их не больше per_user.
+    """
+
+    def __init__(self, per_user: int = 4, max_users: int = 10000):
+        self.per_user = per_user
+        self.max_users = max_users
+        self._users: "OrderedDict[int, OrderedDict[Tuple, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: int, key: Tuple, compute: Callable[[], Any]) -> Any:
+        entries = self._users.get(user_id)
+        if entries is None:
+            entries = self._users[user_id] = OrderedDict()
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        if key in entries:
+            self.hits += 1
+            entries.move_to_end(key)
+            return entries[key]
+        self.misses += 1
+        value = entries[key] = compute()
+        if len(entries) > self.per_user:
+            entries.popitem(last=False)
+        return value
+
+    def forget(self, user_id: int) -> None:
+        self._users.pop(user_id, None)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def __len__(self) -> int:
+        return len(self._users)
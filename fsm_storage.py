@@ -0,0 +1,125 @@
+# fsm_storage.py
+# Хранилища состояний aiogram FSM с истечением по TTL: память, SQLite, Redis.
+#
+# Состояние «жду текст поиска» живёт не дольше TTL; пустые записи сразу удаляются,
+# так что неактивные игроки не копятся ни в памяти, ни на диске.
+
+import json
+import sqlite3
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+
+def _state_name(state: StateType) -> Optional[str]:
+    return state.state if isinstance(state, State) else state
+
+
+class TTLMemoryStorage(BaseStorage):
+    def __init__(self, ttl: float = 600):
+        self.ttl = ttl
+        # key -> (state, data, expires_at)
+        self.records: Dict[StorageKey, Tuple[Optional[str], Dict[str, Any], float]] = {}
+        self._next_sweep = time.monotonic() + ttl
+
+    def _get(self, key: StorageKey) -> Tuple[Optional[str], Dict[str, Any]]:
+        record = self.records.get(key)
+        if record is None:
+            return None, {}
+        if record[2] <= time.monotonic():
+            del self.records[key]
+            return None, {}
+        return record[0], record[1]
+
+    def _put(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]) -> None:
+        now = time.monotonic()
+        if state is None and not data:
+            self.records.pop(key, None)
+        else:
+            self.records[key] = (state, data, now + self.ttl)
+        if now >= self._next_sweep:
+            self.records = {k: r for k, r in self.records.items() if r[2] > now}
+            self._next_sweep = now + self.ttl
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        self._put(key, _state_name(state), self._get(key)[1])
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return self._get(key)[0]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        self._put(key, self._get(key)[0], data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return self._get(key)[1].copy()
+
+    async def close(self) -> None:
+        self.records.clear()
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, path: str, ttl: float = 600):
+        self.ttl = ttl
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS fsm_expires ON fsm (expires_at)")
+        self._next_sweep = time.time() + ttl
+
+    def _get(self, key: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        row = self._db.execute(
+            "SELECT state, data FROM fsm WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None, {}
+        return row[0], json.loads(row[1])
+
+    def _put(self, key: str, state: Optional[str], data: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._db:
+            if state is None and not data:
+                self._db.execute("DELETE FROM fsm WHERE key = ?", (key,))
+            else:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO fsm (key, state, data, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, state, json.dumps(data, ensure_ascii=False), now + self.ttl),
+                )
+            if now >= self._next_sweep:
+                self._db.execute("DELETE FROM fsm WHERE expires_at <= ?", (now,))
+                self._next_sweep = now + self.ttl
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        raw = self.key_builder.build(key)
+        self._put(raw, _state_name(state), self._get(raw)[1])
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return self._get(self.key_builder.build(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        raw = self.key_builder.build(key)
+        self._put(raw, self._get(raw)[0], data)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return self._get(self.key_builder.build(key))[1]
+
+    async def close(self) -> None:
+        self._db.close()
+
+
+def create_storage(url: str, ttl: float = 600) -> BaseStorage:
+    """memory | sqlite:///путь/к/файлу | redis://host:port/db (нужен пакет redis)."""
+    if url == "memory":
+        return TTLMemoryStorage(ttl)
+    if url.startswith("sqlite:///"):
+        return SQLiteStorage(url.removeprefix("sqlite:///"), ttl)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        from aiogram.fsm.storage.redis import RedisStorage
+
+        return RedisStorage.from_url(url, state_ttl=int(ttl), data_ttl=int(ttl))
+    raise ValueError(f"Неизвестное хранилище FSM: {url}")
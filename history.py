@@ -0,0 +1,140 @@
+# history.py
+# История выполненных заданий: одна строка SQLite на (игрок, день) с битсетом id заданий.
+#
+# В памяти держим только «сегодня» и счётчики серии для недавно заходивших игроков,
+# годы истории остаются на диске и читаются по запросу. Оба кэша — LRU не больше
+# cache_size записей, а «сегодня» сбрасывается целиком, когда наступает новый день:
+# всё уже записано в SQLite, так что вытеснение ничего не теряет.
+
+import sqlite3
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Iterator, List, Optional, Tuple
+
+_EPOCH = date(1970, 1, 1)
+
+
+def day_number(now: Optional[datetime] = None) -> int:
+    """Номер дня (UTC) от 1970-01-01 — ключ строки истории."""
+    return ((now or datetime.utcnow()).date() - _EPOCH).days
+
+
+def bits_to_ids(bits: int) -> List[int]:
+    ids = []
+    while bits:
+        low = bits & -bits
+        ids.append(low.bit_length() - 1)
+        bits ^= low
+    return ids
+
+
+class CompletionHistory:
+    def __init__(self, path: str, cache_size: Optional[int] = 10_000):
+        self.path = path
+        self.cache_size = cache_size
+        self._db: Optional[sqlite3.Connection] = None
+        # user_id -> [день, битсет] и user_id -> [последний день, серия, рекорд]
+        self._today: "OrderedDict[int, List[int]]" = OrderedDict()
+        self._streaks: "OrderedDict[int, List[int]]" = OrderedDict()
+        self._day = -1
+
+    def open(self) -> None:
+        self._db = sqlite3.connect(self.path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS completions (
+                user_id INTEGER NOT NULL,
+                day INTEGER NOT NULL,
+                bits BLOB NOT NULL,
+                PRIMARY KEY (user_id, day)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS streaks (
+                user_id INTEGER PRIMARY KEY,
+                last_day INTEGER NOT NULL,
+                streak INTEGER NOT NULL,
+                best INTEGER NOT NULL
+            );
+            """
+        )
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def _remember(self, cache: "OrderedDict[int, List[int]]", user_id: int, value: List[int]) -> None:
+        cache[user_id] = value
+        cache.move_to_end(user_id)
+        while self.cache_size and len(cache) > self.cache_size:
+            cache.popitem(last=False)
+
+    def _today_bits(self, user_id: int, today: int) -> List[int]:
+        if today > self._day:
+            # Вчерашние битсеты больше не спросят: done_today смотрит только на сегодня.
+            self._today.clear()
+            self._day = today
+        entry = self._today.get(user_id)
+        if entry is None or entry[0] != today:
+            row = self._db.execute(
+                "SELECT bits FROM completions WHERE user_id = ? AND day = ?", (user_id, today)
+            ).fetchone()
+            entry = [today, int.from_bytes(row[0], "little") if row else 0]
+        self._remember(self._today, user_id, entry)
+        return entry
+
+    def _streak_state(self, user_id: int) -> List[int]:
+        state = self._streaks.get(user_id)
+        if state is None:
+            row = self._db.execute(
+                "SELECT last_day, streak, best FROM streaks WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            state = list(row) if row else [-1, 0, 0]
+        self._remember(self._streaks, user_id, state)
+        return state
+
+    def done_today(self, user_id: int, task_id: int, today: Optional[int] = None) -> bool:
+        today = day_number() if today is None else today
+        return bool(self._today_bits(user_id, today)[1] >> task_id & 1)
+
+    def record(self, user_id: int, task_id: int, today: Optional[int] = None) -> None:
+        """Отмечает задание выполненным сегодня и двигает серию дней."""
+        today = day_number() if today is None else today
+        entry = self._today_bits(user_id, today)
+        entry[1] |= 1 << task_id
+        state = self._streak_state(user_id)
+        if state[0] != today:
+            state[1] = state[1] + 1 if state[0] == today - 1 else 1
+            state[0] = today
+            state[2] = max(state[2], state[1])
+        with self._db:
+            self._db.execute(
+                "INSERT INTO completions (user_id, day, bits) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id, day) DO UPDATE SET bits = excluded.bits",
+                (user_id, today, entry[1].to_bytes((entry[1].bit_length() + 7) // 8, "little")),
+            )
+            self._db.execute(
+                "INSERT INTO streaks (user_id, last_day, streak, best) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (user_id) DO UPDATE SET "
+                "last_day = excluded.last_day, streak = excluded.streak, best = excluded.best",
+                (user_id, *state),
+            )
+
+    def streak(self, user_id: int, today: Optional[int] = None) -> Tuple[int, int]:
+        """(текущая серия, рекорд). Серия живёт, пока пропущено не больше «сегодня»."""
+        today = day_number() if today is None else today
+        last_day, streak, best = self._streak_state(user_id)
+        if last_day < today - 1:
+            streak = 0
+        return streak, best
+
+    def days(self, user_id: int, since: int, until: Optional[int] = None) -> Iterator[Tuple[int, List[int]]]:
+        """Дни с выполненными заданиями в диапазоне [since, until], по одному с диска."""
+        until = day_number() if until is None else until
+        cursor = self._db.execute(
+            "SELECT day, bits FROM completions WHERE user_id = ? AND day BETWEEN ? AND ? ORDER BY day",
+            (user_id, since, until),
+        )
+        for day, bits in cursor:
+            yield day, bits_to_ids(int.from_bytes(bits, "little"))
@@ -0,0 +1,165 @@
+# keyboards.py
+# Статичные клавиатуры: главное меню, категории, меню фильтров. Они не зависят
+# от игрока, поэтому собираются один раз на каталог и отдаются всем готовыми.
+# Меню фильтров зависят от состояния списка (его несут кнопки, см. navstate.py)
+# и счётчиков; варианты для списка без фильтров собраны сразу, остальные кэшируются.
+
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from aiogram.types import InlineKeyboardMarkup
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from pydantic import ConfigDict
+
+from facets import FacetIndex
+from navstate import NavCodec
+
+
+class FrozenMarkup(InlineKeyboardMarkup):
+    """Общая на всех разметка: случайная правка атрибута упадёт, а не испортит меню всем."""
+
+    model_config = ConfigDict(frozen=True)
+
+
+def freeze(kb: InlineKeyboardBuilder) -> FrozenMarkup:
+    return FrozenMarkup(inline_keyboard=kb.export())
+
+
+def build_main_menu() -> FrozenMarkup:
+    kb = InlineKeyboardBuilder()
+    kb.button(text="📜 Задания", callback_data="menu_tasks")
+    kb.button(text="🏆 Магазин наград", callback_data="menu_shop")
+    kb.button(text="🎫 Боевой пропуск", callback_data="menu_bp")
+    kb.button(text="🎖 Мои эмблемы", callback_data="menu_emblems")
+    kb.adjust(2, 2)
+    return freeze(kb)
+
+
+def build_task_categories_kb(
+    categories: List[str], rotation_titles: Dict[str, str], datas: Tuple[str, ...],
+) -> FrozenMarkup:
+    """datas — callback_data списков: «все задания» и по одному на категорию."""
+    kb = InlineKeyboardBuilder()
+    for kind, title in rotation_titles.items():
+        kb.button(text=title, callback_data=f"tasks_rotation_{kind}")
+    kb.button(text="Все задания", callback_data=datas[0])
+    for index, c in enumerate(categories):
+        kb.button(text=c, callback_data=datas[index + 1])
+    kb.adjust(2)
+    kb.button(text="🔍 Поиск", callback_data="tasks_search")
+    kb.button(text="⬅️ Назад", callback_data="back_main")
+    kb.adjust(2)
+    return freeze(kb)
+
+
+def facet_label(value: str, count: Optional[int]) -> str:
+    return value if count is None else f"{value} ({count})"
+
+
+def build_task_emblem_filter_kb(
+    emblems: List[str],
+    current: Optional[str],
+    counts: Optional[Tuple[int, ...]],
+    datas: Tuple[str, ...],
+) -> FrozenMarkup:
+    """datas — callback_data кнопок: по одной на эмблему, «показать все», «назад»."""
+    kb = InlineKeyboardBuilder()
+    for index, emb in enumerate(emblems):
+        marker = "✓" if emb == current else " "
+        label = facet_label(emb, counts[index] if counts else None)
+        kb.button(text=f"{marker} {label}", callback_data=datas[index])
+    kb.button(text="Показать все", callback_data=datas[-2])
+    kb.button(text="⬅️ Назад к заданиям", callback_data=datas[-1])
+    kb.adjust(2)
+    return freeze(kb)
+
+
+def build_task_category_filter_kb(
+    categories: List[str],
+    current: Optional[str],
+    counts: Optional[Tuple[int, ...]],
+    datas: Tuple[str, ...],
+) -> FrozenMarkup:
+    """datas — callback_data кнопок: «все», по одной на категорию, «назад»."""
+    kb = InlineKeyboardBuilder()
+    marker_all = "✓" if not current else " "
+    total = sum(counts) if counts else None
+    kb.button(text=f"{marker_all} {facet_label('все', total)}", callback_data=datas[0])
+    for index, cat in enumerate(categories):
+        marker = "✓" if cat == current else " "
+        label = facet_label(cat, counts[index] if counts else None)
+        kb.button(text=f"{marker} {label}", callback_data=datas[index + 1])
+    kb.button(text="⬅️ Назад к заданиям", callback_data=datas[-1])
+    kb.button(text="🏠 Главное меню", callback_data="back_main")
+    kb.adjust(2)
+    return freeze(kb)
+
+
+def build_shop_categories_kb(categories: List[str], datas: Tuple[str, ...]) -> FrozenMarkup:
+    kb = InlineKeyboardBuilder()
+    kb.button(text="Все награды", callback_data=datas[0])
+    for index, c in enumerate(categories):
+        kb.button(text=c, callback_data=datas[index + 1])
+    kb.button(text="🔍 Поиск", callback_data="shop_search")
+    kb.button(text="⬅️ Назад", callback_data="back_main")
+    kb.adjust(2)
+    return freeze(kb)
+
+
+class KeyboardRegistry:
+    def __init__(
+        self,
+        tasks: List[Dict],
+        rewards: List[Dict],
+        task_emblems: List[str],
+        rotation_titles: Dict[str, str],
+        nav: NavCodec,
+        shop_nav: NavCodec,
+        facets: Optional[FacetIndex] = None,
+        cache_size: int = 512,
+    ):
+        self.task_categories = sorted({t["category"] for t in tasks})
+        self.task_emblems = list(task_emblems)
+        self.reward_categories = sorted({r["category"] for r in rewards})
+        self.main_menu = build_main_menu()
+        self.nav = nav
+        self.task_categories_kb = build_task_categories_kb(self.task_categories, rotation_titles, tuple(
+            "tl:" + nav.pack(nav.default(category=category)) for category in [None, *self.task_categories]
+        ))
+        self.shop_categories_kb = build_shop_categories_kb(self.reward_categories, tuple(
+            "sl:" + shop_nav.pack(shop_nav.default(category=category)) for category in [None, *self.reward_categories]
+        ))
+        self._category_filter = lru_cache(maxsize=cache_size)(
+            lambda current, counts, datas: build_task_category_filter_kb(self.task_categories, current, counts, datas)
+        )
+        self._emblem_filter = lru_cache(maxsize=cache_size)(
+            lambda current, counts, datas: build_task_emblem_filter_kb(self.task_emblems, current, counts, datas)
+        )
+        # Варианты для списка без других фильтров нужны чаще всего — собираем их сразу.
+        if facets is not None:
+            category_counts = facets.counts("category", self.task_categories, facets.full)
+            emblem_counts = facets.counts("emblem", self.task_emblems, facets.full)
+            for current in [None, *self.task_categories]:
+                self.task_category_filter(nav.default(category=current), category_counts)
+            for current in [None, *self.task_emblems]:
+                self.task_emblem_filter(nav.default(emblem=current), emblem_counts)
+
+    def task_category_filter(self, state: Dict, counts: Optional[Tuple[int, ...]] = None) -> FrozenMarkup:
+        """Меню категорий для списка в состоянии state: каждая кнопка несёт новое состояние.
+
+        counts — число заданий в каждой категории (в порядке task_categories).
+        """
+        datas = tuple(
+            "tl:" + self.nav.pack({**state, "category": category, "page": 0})
+            for category in [None, *self.task_categories]
+        ) + ("tl:" + self.nav.pack(state),)
+        current = state.get("category") if state.get("category") in self.task_categories else None
+        return self._category_filter(current, counts, datas)
+
+    def task_emblem_filter(self, state: Dict, counts: Optional[Tuple[int, ...]] = None) -> FrozenMarkup:
+        datas = tuple(
+            "tl:" + self.nav.pack({**state, "emblem": emblem, "page": 0})
+            for emblem in [*self.task_emblems, None]
+        ) + ("tl:" + self.nav.pack(state),)
+        current = state.get("emblem") if state.get("emblem") in self.task_emblems else None
+        return self._emblem_filter(current, counts, datas)
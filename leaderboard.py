@@ -0,0 +1,172 @@
+# leaderboard.py
+# Рейтинг сезона: индексируемый skip list по ключу (-xp, user_id).
+# Обновление, место игрока и доступ по позиции — O(log n), срез топа — O(log n + k).
+
+import json
+import os
+import random
+from typing import Dict, Iterable, List, Optional, Tuple
+
+MAX_LEVELS = 24  # хватает на ~16 млн игроков при p = 1/2
+
+Key = Tuple[float, int]
+
+_NIL_KEY: Key = (float("inf"), 0)
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key: Key, levels: int):
+        self.key = key
+        self.next: List[Optional["_Node"]] = [None] * levels
+        self.width: List[int] = [1] * levels
+
+
+def _random_levels() -> int:
+    # Геометрическое распределение с p = 1/2: число младших нулевых бит + 1.
+    bits = random.getrandbits(MAX_LEVELS - 1)
+    return (bits & -bits).bit_length() if bits else MAX_LEVELS
+
+
+class Leaderboard:
+    def __init__(self):
+        self.scores: Dict[int, int] = {}
+        self._nil = _Node(_NIL_KEY, 0)
+        self._head = _Node((float("-inf"), 0), MAX_LEVELS)
+        self._head.next = [self._nil] * MAX_LEVELS
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def update(self, user_id: int, score: int) -> None:
+        """Ставит игроку новый счёт; нулевой и отрицательный убирают его из рейтинга."""
+        old = self.scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            self._remove((-old, user_id))
+            del self.scores[user_id]
+        if score > 0:
+            self._insert((-score, user_id))
+            self.scores[user_id] = score
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """Место игрока (с 1) или None, если его нет в рейтинге."""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        key = (-score, user_id)
+        position = 0
+        node = self._head
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        return position + 1
+
+    def page(self, offset: int, limit: int) -> List[Tuple[int, int]]:
+        """Срез рейтинга [(user_id, xp), ...] начиная с позиции offset (с 0)."""
+        if offset >= len(self.scores) or limit <= 0:
+            return []
+        remaining = offset + 1
+        node = self._head
+        for level in reversed(range(MAX_LEVELS)):
+            while node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        result = []
+        while node is not self._nil and len(result) < limit:
+            result.append((node.key[1], -node.key[0]))
+            node = node.next[0]
+        return result
+
+    def top(self, limit: int = 10) -> List[Tuple[int, int]]:
+        return self.page(0, limit)
+
+    def clear(self) -> None:
+        self.scores = {}
+        self._head.next = [self._nil] * MAX_LEVELS
+        self._head.width = [1] * MAX_LEVELS
+
+    def rebuild(self, scores: Iterable[Tuple[int, int]]) -> None:
+        """Строит рейтинг целиком: сортировка + линейная сборка уровней."""
+        self.clear()
+        entries = sorted(((-score, uid) for uid, score in scores if score > 0))
+        last = [self._head] * MAX_LEVELS
+        last_index = [0] * MAX_LEVELS
+        for index, key in enumerate(entries, 1):
+            node = _Node(key, _random_levels())
+            for level in range(len(node.next)):
+                last[level].next[level] = node
+                last[level].width[level] = index - last_index[level]
+                last[level] = node
+                last_index[level] = index
+            self.scores[key[1]] = -key[0]
+        for level in range(MAX_LEVELS):
+            last[level].next[level] = self._nil
+            last[level].width[level] = len(entries) + 1 - last_index[level]
+
+    def save(self, path: str, season: int) -> None:
+        write_entries(path, season, self.snapshot())
+
+    def snapshot(self) -> List[Tuple[int, int]]:
+        """Копия счетов для записи вне цикла; порядок не важен — load сортирует заново."""
+        return list(self.scores.items())
+
+    def load(self, path: str, season: int) -> bool:
+        """Загружает сохранённый рейтинг; False, если файла нет или он от другого сезона."""
+        if not os.path.exists(path):
+            return False
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("season") != season:
+            return False
+        self.rebuild((uid, score) for uid, score in data["entries"])
+        return True
+
+    def _insert(self, key: Key) -> None:
+        chain = [self._head] * MAX_LEVELS
+        steps_at_level = [0] * MAX_LEVELS
+        node = self._head
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level].key <= key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+        new = _Node(key, _random_levels())
+        steps = 0
+        for level in range(len(new.next)):
+            prev = chain[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(len(new.next), MAX_LEVELS):
+            chain[level].width[level] += 1
+
+    def _remove(self, key: Key) -> None:
+        chain = [self._head] * MAX_LEVELS
+        node = self._head
+        for level in reversed(range(MAX_LEVELS)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+        target = chain[0].next[0]
+        if target.key != key:
+            raise KeyError(key)
+        for level in range(len(target.next)):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(len(target.next), MAX_LEVELS):
+            chain[level].width[level] -= 1
+
+
+def write_entries(path: str, season: int, entries: List[Tuple[int, int]]) -> None:
+    """Пишет рейтинг атомарно; работает с копией, так что годится для потока."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"season": season, "entries": entries}, f)
+    os.replace(tmp_path, path)
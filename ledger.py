@@ -0,0 +1,284 @@
+# ledger.py
+# Append-only журнал начислений и списаний эмблем/XP.
+#
+# Балансы = последний снапшот + проигрывание хвоста журнала. При компакции
+# текущий сегмент уезжает в archive/ (для аудита и выгрузок), а снапшот
+# фиксирует балансы на момент последнего события в нём.
+#
+# Снапшот миллиона игроков пишется секундами, поэтому append только ротирует
+# сегмент, а сам снапшот пишет фоновая задача пачками по SNAPSHOT_CHUNK, отдавая
+# управление циклу. Пока она пишет, балансы меняются: перед первым изменением
+# игрока его баланс копируется (copy-on-write), и в снапшот попадает копия.
+# Упади процесс до конца записи — при старте проиграются и архивные сегменты
+# после прошлого снапшота.
+
+import asyncio
+import glob
+import json
+import os
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional
+
+SNAPSHOT_CHUNK = 5000
+
+EVENT_TASK_COMPLETED = "task_completed"
+EVENT_BP_REWARD = "bp_reward"
+EVENT_REWARD_PURCHASED = "reward_purchased"
+EVENT_ADMIN_GRANT = "admin_grant"
+EVENT_UNDO = "undo"
+EVENT_SEASON_RESET = "season_reset"
+
+EVENT_TYPES = {
+    EVENT_TASK_COMPLETED,
+    EVENT_BP_REWARD,
+    EVENT_REWARD_PURCHASED,
+    EVENT_ADMIN_GRANT,
+    EVENT_UNDO,
+    EVENT_SEASON_RESET,
+}
+
+
+def empty_balance() -> Dict:
+    return {"emblems": {}, "exp": 0}
+
+
+def apply_to_balance(balance: Dict, event: Dict) -> None:
+    emblems = balance["emblems"]
+    for emb, amt in event.get("emblems", {}).items():
+        emblems[emb] = emblems.get(emb, 0) + amt
+    balance["exp"] += event.get("exp", 0)
+
+
+class Ledger:
+    def __init__(self, directory: str, snapshot_every: int = 1000):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.segment_path = os.path.join(directory, "ledger.jsonl")
+        self.snapshot_path = os.path.join(directory, "snapshot.json")
+        self.archive_dir = os.path.join(directory, "archive")
+        self.balances: Dict[int, Dict] = {}
+        self.seq = 0
+        self.snapshot_seq = 0
+        self._since_snapshot = 0
+        self._file = None
+        # Фоновая запись снапшота и балансы на её момент у игроков, изменённых с тех пор.
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._frozen: Optional[Dict[int, Dict]] = None
+        # Вызывается после каждого снапшота — чтобы рядом сохранить производное состояние.
+        self.on_compact: Optional[Callable[[], None]] = None
+
+    def open(self) -> Dict[int, Dict]:
+        """Восстанавливает балансы (снапшот + хвост) и открывает сегмент на запись."""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        for stale in glob.glob(self.snapshot_path + ".*.tmp"):
+            os.remove(stale)  # недописанный фоновый снапшот
+        self.balances = {}
+        self.seq = self.snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self.seq = self.snapshot_seq = snapshot["seq"]
+            self.balances = {int(uid): bal for uid, bal in snapshot["balances"].items()}
+        self._since_snapshot = 0
+        self._truncate_torn_tail()
+        # Хвост — архивные сегменты, снапшот которых не успел записаться, и текущий.
+        for event in self.events(since_seq=self.snapshot_seq):
+            apply_to_balance(self.balances.setdefault(event["user"], empty_balance()), event)
+            self.seq = event["seq"]
+            self._since_snapshot += 1
+        self._file = open(self.segment_path, "a", encoding="utf-8")
+        return self.balances
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def append(
+        self,
+        user_id: int,
+        event_type: str,
+        emblems: Optional[Dict[str, int]] = None,
+        exp: int = 0,
+        **meta,
+    ) -> Dict:
+        if event_type not in EVENT_TYPES:
+            raise ValueError(f"Неизвестный тип события: {event_type}")
+        if self._file is None:
+            raise RuntimeError("Журнал не открыт.")
+        self.seq += 1
+        event = {
+            "seq": self.seq,
+            "ts": datetime.utcnow().isoformat(timespec="seconds"),
+            "type": event_type,
+            "user": user_id,
+            "emblems": {emb: amt for emb, amt in (emblems or {}).items() if amt},
+            "exp": exp,
+        }
+        if meta:
+            event["meta"] = meta
+        self._file.write(json.dumps(event, ensure_ascii=False) + "\n")
+        self._file.flush()
+        if self._frozen is not None and user_id not in self._frozen:
+            balance = self.balances.get(user_id)
+            if balance is not None:
+                self._frozen[user_id] = {"emblems": dict(balance["emblems"]), "exp": balance["exp"]}
+        apply_to_balance(self.balances.setdefault(user_id, empty_balance()), event)
+        self._since_snapshot += 1
+        if self._since_snapshot >= self.snapshot_every and self._snapshot_task is None:
+            self._compact_in_background()
+        return event
+
+    def _compact_in_background(self) -> None:
+        """Ротирует сегмент сразу, а снапшот на этот момент пишет фоновой задачей."""
+        self._rotate()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Без event loop (скрипты) ждать некому — пишем сразу.
+            self._write_snapshot()
+            return
+        self._frozen = {}
+        self._snapshot_task = loop.create_task(self._snapshot_later(self.seq, list(self.balances)))
+
+    async def _snapshot_later(self, seq: int, user_ids: List[int]) -> None:
+        steps = self._snapshot_steps(seq, user_ids, f"{self.snapshot_path}.{seq}.tmp")
+        try:
+            for _ in steps:
+                await asyncio.sleep(0)
+        finally:
+            steps.close()
+            self._frozen = None
+            self._snapshot_task = None
+        if self.on_compact is not None:
+            self.on_compact()
+
+    async def compact(self) -> None:
+        """Снапшот на текущий момент целиком (при остановке); фоновый отменяется."""
+        if self._snapshot_task is not None:
+            self._snapshot_task.cancel()
+            await asyncio.gather(self._snapshot_task, return_exceptions=True)
+            self._snapshot_task, self._frozen = None, None
+        if self._file is None or self.seq == self.snapshot_seq:
+            return
+        if self._since_snapshot:
+            self._rotate()
+        self._write_snapshot()
+
+    def _write_snapshot(self) -> None:
+        for _ in self._snapshot_steps(self.seq, list(self.balances), self.snapshot_path + ".tmp"):
+            pass
+        if self.on_compact is not None:
+            self.on_compact()
+
+    def _rotate(self) -> None:
+        """Отправляет текущий сегмент в архив (имя — номер последнего события) и начинает новый."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(
+            self.segment_path,
+            os.path.join(self.archive_dir, f"ledger-{self.seq:012d}.jsonl"),
+        )
+        self._file = open(self.segment_path, "a", encoding="utf-8")
+        self._since_snapshot = 0
+
+    def _snapshot_steps(self, seq: int, user_ids: List[int], tmp_path: str) -> Iterator[None]:
+        """Пишет балансы на момент seq пачками; после каждой пачки — yield."""
+        frozen = self._frozen if self._frozen is not None else {}
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                header = json.dumps({"seq": seq, "ts": datetime.utcnow().isoformat(timespec="seconds")})
+                f.write(header[:-1] + ', "balances": {')
+                separator = ""
+                for start in range(0, len(user_ids), SNAPSHOT_CHUNK):
+                    chunk = {
+                        str(uid): frozen.get(uid) or self.balances[uid]
+                        for uid in user_ids[start:start + SNAPSHOT_CHUNK]
+                    }
+                    f.write(separator + json.dumps(chunk, ensure_ascii=False)[1:-1])
+                    separator = ", "
+                    yield
+                f.write("}}")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            self.snapshot_seq = max(self.snapshot_seq, seq)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def segments(self) -> List[str]:
+        archived = sorted(
+            os.path.join(self.archive_dir, name)
+            for name in os.listdir(self.archive_dir)
+            if name.endswith(".jsonl")
+        ) if os.path.isdir(self.archive_dir) else []
+        return archived + [self.segment_path]
+
+    def events(self, user_id: Optional[int] = None, since_seq: int = 0) -> Iterator[Dict]:
+        """Все события по порядку (архив, затем текущий сегмент), с номером больше since_seq."""
+        if self._file is not None:
+            self._file.flush()
+        for path in self.segments():
+            name = os.path.basename(path)
+            if name.startswith("ledger-") and int(name[7:-6]) <= since_seq:
+                # Имя архивного сегмента — номер его последнего события.
+                continue
+            for event in self._read_segment(path):
+                if event["seq"] <= since_seq:
+                    continue
+                if user_id is None or event["user"] == user_id:
+                    yield event
+
+    def history(self, user_id: int, limit: int = 10) -> List[Dict]:
+        tail: List[Dict] = []
+        for event in self.events(user_id):
+            tail.append(event)
+            if len(tail) > limit:
+                tail.pop(0)
+        return tail
+
+    def undo(self, seq: int) -> Dict:
+        """Добавляет компенсирующее событие для события `seq`."""
+        target = None
+        for event in self.events():
+            if event["seq"] == seq:
+                target = event
+            elif event["type"] == EVENT_UNDO and event.get("meta", {}).get("undo_of") == seq:
+                raise ValueError(f"Событие #{seq} уже отменено.")
+        if target is None:
+            raise ValueError(f"Событие #{seq} не найдено.")
+        if target["type"] == EVENT_UNDO:
+            raise ValueError("Отмену отменить нельзя.")
+        return self.append(
+            target["user"],
+            EVENT_UNDO,
+            emblems={emb: -amt for emb, amt in target["emblems"].items()},
+            exp=-target["exp"],
+            undo_of=seq,
+        )
+
+    def _truncate_torn_tail(self) -> None:
+        """Отрезает недописанную последнюю строку, чтобы новые события не склеились с ней."""
+        if not os.path.exists(self.segment_path):
+            return
+        with open(self.segment_path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    @staticmethod
+    def _read_segment(path: str) -> Iterator[Dict]:
+        if not os.path.exists(path):
+            return
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # Оборванная последняя строка после падения процесса.
+                    break
@@ -0,0 +1,89 @@
+# navstate.py
+# Состояние списков (фильтры, сортировка, страница) целиком в callback_data:
+# шесть байт, упакованных struct и закодированных base64url. Хендлеры списков
+# не читают и не пишут состояние на сервере — на кнопку ответит любая реплика,
+# а одинаковые состояния дают одинаковые ответы.
+#
+#   tl:<b64>        список заданий        sl:<b64>  список наград
+#   tc:<b64>        меню категорий        te:<b64>  меню эмблем
+#   tv:<id>:<b64>   задание с возвратом в тот же список
+#
+# Байты: тег каталога, категория и эмблема (0 — все, иначе индекс + 1), флаги
+# (альтернативная сортировка, только доступные, применить поиск, сложность),
+# страница (uint16). Текст поиска в 64 байта не влезает и остаётся у игрока.
+
+import base64
+import binascii
+import struct
+from typing import Dict, List, Optional, Tuple
+
+NAV_FORMAT = struct.Struct(">BBBBH")
+DIFFICULTIES: Tuple[Optional[str], ...] = (None, "easy", "normal", "hard")
+
+FLAG_ALT_SORT = 0x01
+FLAG_AFFORDABLE = 0x02
+FLAG_QUERY = 0x04
+DIFFICULTY_SHIFT = 3
+
+DEFAULT_STATE = {
+    "category": None,
+    "emblem": None,
+    "difficulty": None,
+    "sort": "id",
+    "affordable_only": False,
+    "query": False,
+    "page": 0,
+}
+
+
+class NavCodec:
+    def __init__(self, catalog_key: str, categories: List[str], emblems: List[str], alt_sort: str):
+        # Тег каталога: кнопки со старым каталогом (после смены заданий) не
+        # превратятся в чужие категории, а откроют список по умолчанию.
+        self.tag = int(catalog_key[:2], 16)
+        self.categories = list(categories)
+        self.emblems = list(emblems)
+        self.alt_sort = alt_sort
+        self._category_index = {c: i + 1 for i, c in enumerate(self.categories)}
+        self._emblem_index = {e: i + 1 for i, e in enumerate(self.emblems)}
+
+    def default(self, **changes) -> Dict:
+        state = dict(DEFAULT_STATE)
+        state.update(changes)
+        return state
+
+    def pack(self, state: Dict) -> str:
+        flags = DIFFICULTIES.index(state.get("difficulty")) << DIFFICULTY_SHIFT
+        if state.get("sort") == self.alt_sort:
+            flags |= FLAG_ALT_SORT
+        if state.get("affordable_only"):
+            flags |= FLAG_AFFORDABLE
+        if state.get("query"):
+            flags |= FLAG_QUERY
+        raw = NAV_FORMAT.pack(
+            self.tag,
+            self._category_index.get(state.get("category"), 0),
+            self._emblem_index.get(state.get("emblem"), 0),
+            flags,
+            min(state.get("page", 0), 0xFFFF),
+        )
+        return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+    def unpack(self, encoded: str) -> Dict:
+        """Состояние из callback_data; испорченное или от другого каталога — по умолчанию."""
+        try:
+            raw = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+            tag, category, emblem, flags, page = NAV_FORMAT.unpack(raw)
+        except (binascii.Error, struct.error, ValueError):
+            return self.default()
+        if tag != self.tag or category > len(self.categories) or emblem > len(self.emblems):
+            return self.default()
+        return {
+            "category": self.categories[category - 1] if category else None,
+            "emblem": self.emblems[emblem - 1] if emblem else None,
+            "difficulty": DIFFICULTIES[(flags >> DIFFICULTY_SHIFT) & 0x03],
+            "sort": self.alt_sort if flags & FLAG_ALT_SORT else "id",
+            "affordable_only": bool(flags & FLAG_AFFORDABLE),
+            "query": bool(flags & FLAG_QUERY),
+            "page": page,
+        }
@@ -0,0 +1,156 @@
+# planner.py
+# Планировщики поверх каталога заданий.
+#
+# RewardPlanner — «как быстрее накопить на награду»: минимальный набор заданий,
+# чьи эмблемы покрывают нехватку. Задания можно повторять, так что это задача
+# о покрытии с повторениями; решаем мемоизированным перебором по вектору нехватки.
+#
+# LevelPlanner — «дойти до уровня N к концу сезона»: сколько XP нужно в день и
+# какой дневной набор заданий по сложности даёт его с наименьшими усилиями.
+
+import math
+import statistics
+from functools import lru_cache, reduce
+from typing import Callable, Dict, List, Optional, Tuple
+
+DIFFICULTY_WEIGHT = {"easy": 1, "normal": 2, "hard": 3}
+PLAN_MODES = ("count", "difficulty")
+
+
+class RewardPlanner:
+    def __init__(self, tasks: List[Dict], cache_size: int = 4096):
+        self.tasks = tasks
+        self._emblems = [task.get("reward_emblems") or task.get("emblems") or {} for task in tasks]
+        self._weights = [DIFFICULTY_WEIGHT.get(task.get("difficulty"), 2) for task in tasks]
+        self._solve = lru_cache(maxsize=cache_size)(self._solve_uncached)
+
+    def shortfall(self, have: Dict[str, int], cost: Dict[str, int]) -> Dict[str, int]:
+        return {emb: need - have.get(emb, 0) for emb, need in cost.items() if have.get(emb, 0) < need}
+
+    def plan(self, shortfall: Dict[str, int], mode: str = "count") -> List[Tuple[Dict, int]]:
+        """[(задание, сколько раз)] с минимальным числом заданий или суммарной сложностью."""
+        if mode not in PLAN_MODES:
+            raise ValueError(f"Неизвестный режим: {mode}")
+        key = tuple(sorted((emb, amt) for emb, amt in shortfall.items() if amt > 0))
+        if not key:
+            return []
+        positions = self._solve(key, mode)
+        if positions is None:
+            return []
+        counts: Dict[int, int] = {}
+        for position in positions:
+            counts[position] = counts.get(position, 0) + 1
+        return [(self.tasks[position], times) for position, times in counts.items()]
+
+    def cache_info(self):
+        return self._solve.cache_info()
+
+    def _candidates(self, emblems: Tuple[str, ...], need: Tuple[int, ...], mode: str) -> List[Tuple[int, Tuple[int, ...], int]]:
+        """Задания, полезные для нехватки, без доминируемых: (позиция, вклад, цена)."""
+        options = []
+        for position, rewards in enumerate(self._emblems):
+            gain = tuple(min(rewards.get(emb, 0), amt) for emb, amt in zip(emblems, need))
+            if any(gain):
+                cost = 1 if mode == "count" else self._weights[position]
+                options.append((position, gain, cost))
+        kept = []
+        for option in sorted(options, key=lambda o: (o[2], [-g for g in o[1]], o[0])):
+            dominated = any(
+                other[2] <= option[2] and all(a >= b for a, b in zip(other[1], option[1]))
+                for other in kept
+            )
+            if not dominated:
+                kept.append(option)
+        return kept
+
+    def _solve_uncached(self, key: Tuple[Tuple[str, int], ...], mode: str):
+        emblems = tuple(emb for emb, _ in key)
+        need = tuple(amt for _, amt in key)
+        options = self._candidates(emblems, need, mode)
+        memo: Dict[Tuple[int, ...], Tuple[float, Tuple[int, ...]]] = {}
+
+        def best(rest: Tuple[int, ...]) -> Tuple[float, Tuple[int, ...]]:
+            first = next((i for i, amt in enumerate(rest) if amt > 0), None)
+            if first is None:
+                return 0, ()
+            if rest in memo:
+                return memo[rest]
+            result: Tuple[float, Tuple[int, ...]] = (float("inf"), ())
+            # Какое-то задание обязано закрыть первую непокрытую эмблему — перебираем только их.
+            for position, gain, cost in options:
+                if not gain[first]:
+                    continue
+                sub_cost, sub_plan = best(tuple(max(r - g, 0) for r, g in zip(rest, gain)))
+                if cost + sub_cost < result[0]:
+                    result = (cost + sub_cost, (position,) + sub_plan)
+            memo[rest] = result
+            return result
+
+        total, plan = best(need)
+        return plan if total != float("inf") else None
+
+
+class LevelPlanner:
+    def __init__(
+        self,
+        tasks: List[Dict],
+        total_xp_for_level: Callable[[int], int],
+        max_level: int,
+        cache_size: int = 4096,
+    ):
+        self.total_xp_for_level = total_xp_for_level
+        self.max_level = max_level
+        by_difficulty: Dict[str, List[int]] = {}
+        for task in tasks:
+            xp = task.get("reward_exp") or task.get("xp") or 0
+            if xp:
+                by_difficulty.setdefault(task.get("difficulty"), []).append(xp)
+        # Типичное задание каждой сложности: медианный XP и вес усилий.
+        self.classes = [
+            (difficulty, int(statistics.median(xps)), DIFFICULTY_WEIGHT.get(difficulty, 2))
+            for difficulty, xps in sorted(by_difficulty.items(), key=lambda kv: DIFFICULTY_WEIGHT.get(kv[0], 2))
+        ]
+        # Таблица рюкзака в единицах НОД(XP): effort[u] — минимум усилий набрать ≥ u единиц.
+        self._unit = reduce(math.gcd, (xp for _, xp, _ in self.classes), 0) or 1
+        self._effort = [0]
+        self._choice: List[Optional[int]] = [None]
+        self.plan = lru_cache(maxsize=cache_size)(self._plan_uncached)
+
+    def _extend(self, units: int) -> None:
+        for u in range(len(self._effort), units + 1):
+            best, choice = float("inf"), None
+            for index, (_, xp, weight) in enumerate(self.classes):
+                cost = weight + self._effort[max(u - xp // self._unit, 0)]
+                if cost < best:
+                    best, choice = cost, index
+            self._effort.append(best)
+            self._choice.append(choice)
+
+    def daily_mix(self, xp_per_day: int) -> Tuple[Tuple[str, int], ...]:
+        """Набор ((сложность, сколько заданий), ...) на день с минимумом усилий."""
+        units = -(-xp_per_day // self._unit)
+        self._extend(units)
+        counts = [0] * len(self.classes)
+        while units > 0:
+            index = self._choice[units]
+            counts[index] += 1
+            units -= self.classes[index][1] // self._unit
+        return tuple((self.classes[i][0], n) for i, n in enumerate(counts) if n)
+
+    def _plan_uncached(self, exp: int, target_level: int, days_left: int) -> Optional[Dict]:
+        target_level = min(target_level, self.max_level)
+        need = self.total_xp_for_level(target_level - 1) - exp
+        if need <= 0:
+            return None
+        days = max(days_left, 1)
+        per_day = -(-need // days)
+        mix = self.daily_mix(per_day)
+        xp_by_difficulty = {difficulty: xp for difficulty, xp, _ in self.classes}
+        return {
+            "target_level": target_level,
+            "need": need,
+            "days": days,
+            "per_day": per_day,
+            "mix": mix,
+            "mix_xp": sum(xp_by_difficulty[d] * n for d, n in mix),
+        }
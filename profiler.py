@@ -0,0 +1,80 @@
+# profiler.py
+# Сэмплирующий профайлер живого процесса: раз в N мс снимает стек
+# потока event loop и копит collapsed stacks (формат flamegraph.pl / speedscope).
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+MAX_STACK_DEPTH = 64
+
+
+def frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, interval_ms: int = 10):
+        self.interval = interval_ms / 1000
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self._target: Optional[int] = None
+        self._deadline: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration_s: float, thread_id: Optional[int] = None) -> None:
+        """Запускает окно сэмплирования; по умолчанию профилирует текущий поток."""
+        if self.running:
+            raise RuntimeError("Профайлер уже запущен.")
+        self.stacks = Counter()
+        self.samples = 0
+        self._target = thread_id or threading.get_ident()
+        self.started_at = time.monotonic()
+        self.stopped_at = None
+        self._deadline = self.started_at + duration_s
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            if time.monotonic() >= self._deadline:
+                break
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                break
+            labels = []
+            while frame is not None and len(labels) < MAX_STACK_DEPTH:
+                labels.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            # Ссылку на фрейм не держим — иначе продлеваем жизнь локальным переменным.
+            frame = None
+            labels.reverse()
+            self.stacks[";".join(labels)] += 1
+            self.samples += 1
+        self.stopped_at = time.monotonic()
+
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.stopped_at or time.monotonic()) - self.started_at
+
+    def collapsed(self) -> str:
+        """Одна строка на уникальный стек: `a;b;c <count>`."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
@@ -0,0 +1,100 @@
+# quests.py
+# Ротация заданий: каждому игроку на день и на неделю — своя подборка из TASKS.
+#
+# Подборка детерминирована (seed = период + user_id), сбалансирована по сложности
+# (квоты ниже) и по типам эмблем. Считается пачкой один раз за период и хранится
+# компактно: array('H') с позициями заданий в каталоге, по два байта на задание.
+
+import asyncio
+import random
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+# Сколько перемешанных кандидатов смотрим при выборе очередного задания.
+SELECTION_WINDOW = 8
+
+ROTATION_QUOTAS = {
+    "daily": {"easy": 2, "normal": 2, "hard": 1},
+    "weekly": {"normal": 3, "hard": 3},
+}
+
+
+def period_key(kind: str, now: Optional[datetime] = None) -> str:
+    now = now or datetime.utcnow()
+    if kind == "daily":
+        return now.strftime("%Y-%m-%d")
+    year, week, _ = now.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+class QuestRotation:
+    def __init__(self, tasks: List[Dict], quotas: Dict[str, Dict[str, int]] = ROTATION_QUOTAS):
+        self.tasks = tasks
+        self.quotas = quotas
+        self._by_difficulty: Dict[str, List[int]] = {}
+        for position, task in enumerate(tasks):
+            self._by_difficulty.setdefault(task.get("difficulty"), []).append(position)
+        bit_by_emblem: Dict[str, int] = {}
+        for task in tasks:
+            for emb in task.get("emblems", {}):
+                bit_by_emblem.setdefault(emb, 1 << len(bit_by_emblem))
+        # Набор эмблем задания — битовая маска, «новые эмблемы» считаются popcount'ом.
+        self._emblem_masks = [
+            sum(bit_by_emblem[emb] for emb in task.get("emblems", {})) for task in tasks
+        ]
+        # kind -> (период, {user_id: array('H') позиций})
+        self._picks: Dict[str, tuple] = {}
+
+    def select(self, user_id: int, kind: str, period: str) -> array:
+        """Подборка на период: по квоте каждой сложности, жадно по новым типам эмблем."""
+        rng = random.Random(f"{kind}:{period}:{user_id}")
+        masks = self._emblem_masks
+        covered = 0
+        picked = array("H")
+        for difficulty, count in self.quotas[kind].items():
+            candidates = list(self._by_difficulty.get(difficulty, ()))
+            rng.shuffle(candidates)
+            for _ in range(min(count, len(candidates))):
+                # Из первых перемешанных кандидатов берём тот, что добавляет больше новых эмблем.
+                window = range(min(SELECTION_WINDOW, len(candidates)))
+                best = max(window, key=lambda i: (masks[candidates[i]] & ~covered).bit_count())
+                position = candidates.pop(best)
+                covered |= masks[position]
+                picked.append(position)
+        return picked
+
+    def _store(self, kind: str, period: str) -> Dict[int, array]:
+        stored = self._picks.get(kind)
+        if stored is None or stored[0] != period:
+            stored = (period, {})
+            self._picks[kind] = stored
+        return stored[1]
+
+    def picks(self, user_id: int, kind: str, now: Optional[datetime] = None) -> List[Dict]:
+        period = period_key(kind, now)
+        store = self._store(kind, period)
+        packed = store.get(user_id)
+        if packed is None:
+            # Новый игрок после пакетного пересчёта — досчитываем только его.
+            packed = store[user_id] = self.select(user_id, kind, period)
+        return [self.tasks[position] for position in packed]
+
+    def is_stale(self, kind: str, now: Optional[datetime] = None) -> bool:
+        stored = self._picks.get(kind)
+        return stored is None or stored[0] != period_key(kind, now)
+
+    async def rebuild(self, kind: str, user_ids: Iterable[int], chunk: int = 200) -> int:
+        """Пакетный пересчёт на новый период; отдаёт управление циклу между пачками."""
+        period = period_key(kind)
+        fresh: Dict[int, array] = {}
+        for count, user_id in enumerate(user_ids, 1):
+            fresh[user_id] = self.select(user_id, kind, period)
+            if count % chunk == 0:
+                await asyncio.sleep(0)
+        # Игроки, досчитанные по запросу во время пересчёта, уже лежат в текущем хранилище.
+        current = self._picks.get(kind)
+        if current is not None and current[0] == period:
+            fresh.update(current[1])
+        self._picks[kind] = (period, fresh)
+        return len(fresh)
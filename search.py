@@ -0,0 +1,54 @@
+# search.py
+# Поисковый индекс по каталогу: префиксный инвертированный индекс по словам
+# названия и описания. Результаты кэшируются по нормализованному запросу.
+
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Set, Tuple
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower().replace("ё", "е"))
+
+
+def normalize_query(query: str) -> str:
+    """Запрос в каноничной форме: слова в нижнем регистре через пробел."""
+    return " ".join(tokenize(query))
+
+
+class SearchIndex:
+    def __init__(self, items: List[Dict], fields: Iterable[str] = ("name", "description"), cache_size: int = 1024):
+        self.items = items
+        # префикс слова -> позиции элементов каталога, где есть слово с таким началом
+        self._prefixes: Dict[str, Set[int]] = {}
+        for position, item in enumerate(items):
+            for field in fields:
+                for word in tokenize(str(item.get(field, ""))):
+                    for end in range(1, len(word) + 1):
+                        self._prefixes.setdefault(word[:end], set()).add(position)
+        self._lookup = lru_cache(maxsize=cache_size)(self._lookup_uncached)
+
+    def search(self, query: str) -> List[Dict]:
+        """Элементы, где каждое слово запроса — начало какого-то слова; в порядке каталога."""
+        return [self.items[position] for position in self._lookup(normalize_query(query))]
+
+    def positions(self, query: str) -> Tuple[int, ...]:
+        return self._lookup(normalize_query(query))
+
+    def _lookup_uncached(self, normalized: str) -> Tuple[int, ...]:
+        words = normalized.split()
+        if not words:
+            return tuple(range(len(self.items)))
+        # Начинаем с самого редкого слова — пересечения короче.
+        sets = sorted((self._prefixes.get(word, set()) for word in words), key=len)
+        matched = set(sets[0])
+        for other in sets[1:]:
+            matched &= other
+            if not matched:
+                break
+        return tuple(sorted(matched))
+
+    def cache_info(self):
+        return self._lookup.cache_info()
@@ -0,0 +1,112 @@
+# season.py
+# Календарь сезонов: номер, начало и конец текущего сезона, история прошлых и
+# курсор незавершённого перехода между сезонами. Хранится в state — файле или
+# ключе Redis, общем для реплик (см. coordination.py).
+
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+
+class SeasonCalendar:
+    def __init__(self, state, duration_days: int = 28):
+        self.state = state
+        self.duration = timedelta(days=duration_days)
+        now = datetime.utcnow()
+        # Пока календарь не загружен — временный первый сезон от текущего момента.
+        self.seasons = [{"number": 1, "start": now, "end": now + self.duration}]
+        self.rollover: Optional[Dict] = None
+
+    @property
+    def current(self) -> Dict:
+        return self.seasons[-1]
+
+    @property
+    def number(self) -> int:
+        return self.current["number"]
+
+    @property
+    def start(self) -> datetime:
+        return self.current["start"]
+
+    @property
+    def end(self) -> datetime:
+        return self.current["end"]
+
+    def season_at(self, moment: datetime) -> int:
+        """Номер сезона, к которому относится момент времени."""
+        for entry in reversed(self.seasons):
+            if moment >= entry["start"]:
+                return entry["number"]
+        return self.seasons[0]["number"]
+
+    def is_over(self, now: Optional[datetime] = None) -> bool:
+        return (now or datetime.utcnow()) >= self.end
+
+    async def load(self, create: bool = True) -> None:
+        """Читает календарь; при первом запуске сохраняет текущий сезон.
+
+        create=False — только чтение: без сохранённого календаря остаётся временный
+        сезон в памяти. Повторный load подтягивает изменения других реплик.
+        """
+        data = await self.state.read()
+        if data is None:
+            if create:
+                await self.save()
+            return
+        self.seasons = [
+            {
+                "number": entry["number"],
+                "start": datetime.fromisoformat(entry["start"]),
+                "end": datetime.fromisoformat(entry["end"]),
+                "reminded": entry.get("reminded", False),
+            }
+            for entry in data["seasons"]
+        ]
+        self.rollover = data.get("rollover")
+
+    async def save(self) -> None:
+        await self.state.write({
+            "seasons": [
+                {
+                    "number": entry["number"],
+                    "start": entry["start"].isoformat(timespec="seconds"),
+                    "end": entry["end"].isoformat(timespec="seconds"),
+                    "reminded": entry.get("reminded", False),
+                }
+                for entry in self.seasons
+            ],
+            "rollover": self.rollover,
+        })
+
+    def reminder_due(self, days: int, now: Optional[datetime] = None) -> bool:
+        """Пора ли напомнить о скором конце сезона (один раз за сезон)."""
+        now = now or datetime.utcnow()
+        return not self.current.get("reminded") and self.end - now <= timedelta(days=days) and now < self.end
+
+    async def mark_reminded(self) -> None:
+        self.current["reminded"] = True
+        await self.save()
+
+    async def begin_rollover(self) -> Dict:
+        """Отмечает начало перехода (или возвращает незавершённый после рестарта)."""
+        if self.rollover is None or self.rollover["season"] != self.number:
+            self.rollover = {"season": self.number, "cursor": None, "processed": 0}
+            await self.save()
+        return self.rollover
+
+    async def checkpoint(self, cursor: int, processed: int) -> None:
+        self.rollover["cursor"] = cursor
+        self.rollover["processed"] = processed
+        await self.save()
+
+    async def advance(self, now: Optional[datetime] = None) -> Dict:
+        """Закрывает переход и открывает следующий сезон."""
+        now = now or datetime.utcnow()
+        start = self.end
+        if now >= start + self.duration:
+            # Бот простоял дольше целого сезона — не плодим пустые сезоны.
+            start = now
+        self.seasons.append({"number": self.number + 1, "start": start, "end": start + self.duration})
+        self.rollover = None
+        await self.save()
+        return self.current
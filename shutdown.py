@@ -0,0 +1,49 @@
+# shutdown.py
+# Мягкая остановка. По SIGTERM/SIGINT aiogram перестаёт забирать апдейты, но
+# уже начатые хендлеры работают отдельными задачами — сессии ботов закроются
+# прямо под ними. InflightTracker помнит задачи апдейтов, а drain дожидается
+# их до дедлайна: покупка или начисление не обрываются посередине, и игрок
+# успевает записаться. Опоздавшие отменяются — finally у middleware всё равно
+# сохраняет то, что они успели изменить.
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Set
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+
+class InflightTracker(BaseMiddleware):
+    """Outer middleware: множество задач, которые сейчас обрабатывают апдейты."""
+
+    def __init__(self):
+        self.tasks: Set[asyncio.Task] = set()
+        self.completed = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        try:
+            return await handler(event, data)
+        finally:
+            self.tasks.discard(task)
+            self.completed += 1
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+    async def drain(self, timeout: float) -> int:
+        """Ждёт начатые апдейты не дольше timeout секунд; остальные отменяет. Возвращает число отменённых."""
+        pending = self.tasks - {asyncio.current_task()}
+        if not pending:
+            return 0
+        _, pending = await asyncio.wait(pending, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        return len(pending)
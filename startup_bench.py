@@ -0,0 +1,86 @@
+# startup_bench.py
+# Замер холодного старта бота без Telegram: каждый прогон — отдельный процесс.
+#
+#   python startup_bench.py                 # 5 прогонов, медианы фаз
+#   python startup_bench.py --imports 15    # плюс разбивка импорта по пакетам
+#
+# Фазы: import (модули + сборка индексов каталога при импорте bot.py) и warmup
+# (то, что без прогрева считалось бы на первых кликах). Разбивка импорта берётся
+# из `python -X importtime`: собственное время модулей, сложенное по пакетам.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+from typing import Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PHASES_SCRIPT = """
+import time
+started = time.perf_counter()
+import asyncio, json, bot
+imported = time.perf_counter()
+for tenant in bot.TENANTS:
+    with bot.use_tenant(tenant):
+        asyncio.run(bot.SEASONS.load())
+warmup = asyncio.run(bot.warmup())
+print(json.dumps({"import": imported - started, "warmup": warmup, "total": time.perf_counter() - started}))
+"""
+
+
+def bench_env(data_dir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault("BOT_TOKEN", "123456:BENCH")
+    env["DATA_DIR"] = data_dir
+    env["PYTHONPATH"] = HERE + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def run_phases(env: Dict[str, str]) -> Dict[str, float]:
+    out = subprocess.run(
+        [sys.executable, "-c", PHASES_SCRIPT], env=env, cwd=HERE, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def import_breakdown(env: Dict[str, str]) -> Counter:
+    """Собственное время импорта (мкс), сложенное по пакету верхнего уровня."""
+    err = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import bot"],
+        env=env, cwd=HERE, check=True, capture_output=True, text=True,
+    ).stderr
+    totals: Counter = Counter()
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        totals[name.strip().split(".")[0]] += int(self_us)
+    return totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Замер холодного старта бота.")
+    parser.add_argument("--runs", type=int, default=5, help="сколько раз запускать процесс")
+    parser.add_argument("--imports", type=int, default=0, metavar="N", help="показать N самых дорогих пакетов")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = bench_env(data_dir)
+        runs: List[Dict[str, float]] = [run_phases(env) for _ in range(args.runs)]
+        for phase in ("import", "warmup", "total"):
+            values = [run[phase] for run in runs]
+            print(f"{phase:>7}: median {statistics.median(values) * 1000:8.1f} ms, max {max(values) * 1000:8.1f} ms")
+        if args.imports:
+            totals = import_breakdown(env)
+            overall = sum(totals.values()) or 1
+            print(f"\nimport by package (one run, {overall / 1000:.0f} ms total):")
+            for name, us in totals.most_common(args.imports):
+                print(f"  {name:<24} {us / 1000:8.1f} ms  {us / overall:5.1%}")
+
+
+if __name__ == "__main__":
+    main()
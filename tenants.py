@@ -0,0 +1,181 @@
+# tenants.py
+# Несколько ботов в одном процессе. У каждого арендатора (tenant) свой токен,
+# каталог заданий и наград, каталог данных и список админов.
+#
+# Код бота по-прежнему обращается к «глобальным» USERS, LEDGER, TASKS…, но это
+# прокси TenantLocal: они смотрят в арендатора текущего апдейта, которого
+# выставляет TenantMiddleware. Объекты, зависящие только от каталога (поисковые
+# индексы, планировщики), общие для арендаторов с одинаковым каталогом.
+#
+# Конфиг — JSON-файл из переменной TENANTS:
+#   [
+#     {"name": "home", "token": "123:AAA", "data_dir": "data"},
+#     {"name": "kids", "token": "456:BBB", "tasks": "tasks_kids", "admins": [111]}
+#   ]
+# tasks / rewards — имена модулей с TASKS и REWARDS + BP_REWARDS (по умолчанию
+# tasks.py и rewards.py), data_dir по умолчанию — DATA_DIR/<name>.
+
+import contextvars
+import hashlib
+import importlib
+import json
+import os
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+_CURRENT: contextvars.ContextVar[Optional["Tenant"]] = contextvars.ContextVar("tenant", default=None)
+_DEFAULT: Optional["Tenant"] = None
+# (ключ каталога, имя) -> объект, общий для арендаторов с одинаковым каталогом
+_SHARED: Dict[tuple, Any] = {}
+
+
+def catalog_key(*catalogs: Any) -> str:
+    """Отпечаток содержимого каталога: одинаковые каталоги дают одинаковый ключ."""
+    raw = json.dumps(catalogs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+
+class Tenant:
+    def __init__(
+        self,
+        name: str,
+        token: str,
+        data_dir: str,
+        tasks_module: str = "tasks",
+        rewards_module: str = "rewards",
+        admin_ids: Iterable[int] = (),
+        settings: Optional[Dict[str, Any]] = None,
+    ):
+        self.name = name
+        self.token = token
+        self.data_dir = data_dir
+        self.admin_ids = set(admin_ids)
+        self.settings = settings or {}
+        rewards = importlib.import_module(rewards_module)
+        self.tasks: List[Dict] = importlib.import_module(tasks_module).TASKS
+        self.rewards: List[Dict] = rewards.REWARDS
+        self.bp_rewards: List[Dict] = rewards.BP_REWARDS
+        self.catalog_key = catalog_key(self.tasks, self.rewards, self.bp_rewards)
+
+    def __repr__(self) -> str:
+        return f"Tenant({self.name!r})"
+
+    def path(self, *parts: str) -> str:
+        return os.path.join(self.data_dir, *parts)
+
+    def shared(self, name: str, factory: Callable[[], Any]) -> Any:
+        """Объект, зависящий только от каталога: строится один раз на каталог."""
+        key = (self.catalog_key, name)
+        if key not in _SHARED:
+            _SHARED[key] = factory()
+        return _SHARED[key]
+
+
+def load_tenants(path: Optional[str], token: str, data_dir: str, admin_ids: Iterable[int] = ()) -> List[Tenant]:
+    """Арендаторы из конфига; без конфига — один бот из BOT_TOKEN и DATA_DIR, как раньше."""
+    if not path:
+        return [Tenant("default", token, data_dir, admin_ids=admin_ids)]
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    tenants = []
+    for entry in entries:
+        tenants.append(Tenant(
+            entry["name"],
+            entry["token"],
+            entry.get("data_dir") or os.path.join(data_dir, entry["name"]),
+            tasks_module=entry.get("tasks", "tasks"),
+            rewards_module=entry.get("rewards", "rewards"),
+            admin_ids=entry.get("admins", admin_ids),
+            settings=entry.get("settings"),
+        ))
+    names = [tenant.name for tenant in tenants]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Имена арендаторов повторяются: {names}")
+    return tenants
+
+
+def set_default(tenant: Tenant) -> None:
+    """Арендатор вне апдейтов: при импорте, в консоли, у однобототного запуска."""
+    global _DEFAULT
+    _DEFAULT = tenant
+
+
+def current_tenant() -> Tenant:
+    tenant = _CURRENT.get() or _DEFAULT
+    if tenant is None:
+        raise RuntimeError("Нет текущего арендатора")
+    return tenant
+
+
+@contextmanager
+def use_tenant(tenant: Tenant) -> Iterator[Tenant]:
+    """Делает арендатора текущим; задачи, созданные внутри, наследуют его."""
+    token = _CURRENT.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _CURRENT.reset(token)
+
+
+class TenantLocal:
+    """Прокси к атрибуту текущего арендатора (или к самому арендатору, если attr не задан)."""
+
+    __slots__ = ("_attr",)
+
+    def __init__(self, attr: Optional[str] = None):
+        object.__setattr__(self, "_attr", attr)
+
+    def _target(self) -> Any:
+        tenant = current_tenant()
+        return tenant if self._attr is None else getattr(tenant, self._attr)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._target(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._target(), name, value)
+
+    def __getitem__(self, key: Any) -> Any:
+        return self._target()[key]
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        self._target()[key] = value
+
+    def __delitem__(self, key: Any) -> None:
+        del self._target()[key]
+
+    def __contains__(self, item: Any) -> bool:
+        return item in self._target()
+
+    def __iter__(self) -> Iterator:
+        return iter(self._target())
+
+    def __len__(self) -> int:
+        return len(self._target())
+
+    def __bool__(self) -> bool:
+        return bool(self._target())
+
+    def __repr__(self) -> str:
+        return f"TenantLocal({self._attr!r})"
+
+
+class TenantMiddleware(BaseMiddleware):
+    """Выставляет арендатора по боту, получившему апдейт."""
+
+    def __init__(self, tenants_by_bot_id: Dict[int, Tenant]):
+        self.tenants_by_bot_id = tenants_by_bot_id
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        tenant = self.tenants_by_bot_id[data["bot"].id]
+        data["tenant"] = tenant
+        with use_tenant(tenant):
+            return await handler(event, data)
@@ -0,0 +1,13 @@
+# Общая настройка тестов: бот импортируется с фиктивным токеном и данными во
+# временном каталоге, чтобы тесты не трогали data/ рабочего бота.
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("BOT_TOKEN", "123456:TEST")
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="kamigami-tests-")
+os.environ.pop("TENANTS", None)
+os.environ["USER_STORAGE"] = "memory"
@@ -0,0 +1,35 @@
+import os
+
+import pytest
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+from analytics import export_events  # noqa: E402
+from ledger import EVENT_TASK_COMPLETED, Ledger  # noqa: E402
+
+
+def append_events(data_dir: str, count: int) -> None:
+    ledger = Ledger(os.path.join(data_dir, "ledger"))
+    ledger.open()
+    for i in range(count):
+        ledger.append(1, EVENT_TASK_COMPLETED, emblems={"X": 1}, exp=10, task_id=i, category="c")
+    ledger.close()
+
+
+def exported_rows(out_dir: str) -> int:
+    rows = 0
+    for root, _, files in os.walk(out_dir):
+        rows += sum(pq.read_metadata(os.path.join(root, name)).num_rows for name in files if name.endswith(".parquet"))
+    return rows
+
+
+def test_full_export_replaces_incremental_parts(tmp_path):
+    data_dir, out_dir = str(tmp_path / "data"), str(tmp_path / "exports")
+    append_events(data_dir, 5)
+    export_events(data_dir, out_dir)
+    append_events(data_dir, 5)
+    export_events(data_dir, out_dir)
+    assert exported_rows(out_dir) == 10
+    export_events(data_dir, out_dir, since_seq=0)
+    assert exported_rows(out_dir) == 10
+    assert not os.path.exists(os.path.join(data_dir, "season.json"))
@@ -0,0 +1,46 @@
+import asyncio
+import os
+import tempfile
+
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramServerError
+from aiogram.methods import SendMessage
+
+from broadcast import Broadcaster, RateLimiter
+from coordination import FileState
+
+
+def test_transient_errors_are_retried_and_do_not_stop_broadcast():
+    method = SendMessage(chat_id=0, text="")
+    failures = {
+        1: [TelegramNetworkError(method, "timeout")],
+        2: [TelegramServerError(method, "bad gateway")] * 10,
+        3: [TelegramBadRequest(method, "chat not found")],
+    }
+    delivered = []
+
+    async def send(chat_id, text):
+        pending = failures.get(chat_id)
+        if pending:
+            raise pending.pop()
+        delivered.append(chat_id)
+
+    async def user_ids(cursor):
+        for chat_id in (1, 2, 3, 4):
+            if cursor is None or chat_id > cursor:
+                yield chat_id
+
+    async def on_blocked(chat_id):
+        pass
+
+    async def scenario():
+        path = os.path.join(tempfile.mkdtemp(), "broadcast.json")
+        broadcaster = Broadcaster(FileState(path), RateLimiter(rate=1000, per_chat_interval=0), retries=2, backoff=0.001)
+        await broadcaster.create("привет")
+        await broadcaster.start(send, user_ids, on_blocked)
+        return broadcaster.job
+
+    job = asyncio.run(scenario())
+    assert delivered == [1, 4]
+    assert (job["sent"], job["failed"], job["blocked"]) == (2, 2, 0)
+    assert job["finished_at"]
+    assert len(failures[2]) == 7  # первая попытка и два повтора
@@ -0,0 +1,34 @@
+import asyncio
+
+import bot
+from aiogram import Bot
+from aiogram.types import Message
+from tenants import use_tenant
+
+
+def test_status_is_not_swallowed_by_catch_all(monkeypatch):
+    tg_bot = Bot("123456:TEST")
+    message = Message.model_validate({
+        "message_id": 1,
+        "date": 1700000000,
+        "chat": {"id": 3001, "type": "private"},
+        "from": {"id": 3001, "is_bot": False, "first_name": "p"},
+        "text": "/status",
+    }).as_(tg_bot)
+    answers = []
+
+    async def answer(self, text, **kwargs):
+        answers.append(text)
+
+    async def scenario():
+        with use_tenant(bot.TENANTS[0]):
+            await bot.SEASONS.load()
+            bot.HISTORY.open()
+            try:
+                await bot.router.message.trigger(message, bot=tg_bot, user=bot.get_user(3001), raw_state=None)
+            finally:
+                bot.HISTORY.close()
+
+    monkeypatch.setattr(Message, "answer", answer)
+    asyncio.run(scenario())
+    assert answers and answers[0].startswith("Твой статус")
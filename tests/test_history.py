@@ -0,0 +1,23 @@
+import os
+import tempfile
+
+from history import CompletionHistory
+
+
+def test_caches_are_bounded_and_reload_from_disk():
+    history = CompletionHistory(os.path.join(tempfile.mkdtemp(), "history.sqlite3"), cache_size=3)
+    history.open()
+    for user_id in range(10):
+        history.record(user_id, task_id=user_id % 4, today=100)
+    assert len(history._today) == 3
+    assert len(history._streaks) == 3
+
+    # Вытесненные игроки читаются с диска без потерь.
+    assert history.done_today(0, 0, today=100)
+    assert history.streak(0, today=100) == (1, 1)
+
+    history.record(0, task_id=1, today=101)
+    assert list(history._today) == [0]
+    assert history.streak(0, today=101) == (2, 2)
+    assert not history.done_today(0, 0, today=101)
+    history.close()
@@ -0,0 +1,38 @@
+import asyncio
+import json
+import os
+
+import ledger as ledger_module
+from ledger import EVENT_ADMIN_GRANT, Ledger
+
+
+def test_background_snapshot_is_consistent_and_recoverable(tmp_path, monkeypatch):
+    monkeypatch.setattr(ledger_module, "SNAPSHOT_CHUNK", 1)
+    directory = str(tmp_path / "ledger")
+
+    async def scenario():
+        ledger = Ledger(directory, snapshot_every=6)
+        ledger.open()
+        for user_id in (1, 2, 3, 1, 2, 3):
+            ledger.append(user_id, EVENT_ADMIN_GRANT, exp=10)
+        # Снапшот на seq 6 пишется в фоне; следующие события его не меняют.
+        assert ledger._snapshot_task is not None
+        ledger.append(1, EVENT_ADMIN_GRANT, exp=5)
+        ledger.append(4, EVENT_ADMIN_GRANT, exp=7)
+        # Падение до конца записи: новый процесс проигрывает архивный сегмент.
+        recovered = Ledger(directory).open()
+        assert {uid: bal["exp"] for uid, bal in recovered.items()} == {1: 25, 2: 20, 3: 20, 4: 7}
+        await ledger._snapshot_task
+        with open(ledger.snapshot_path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+        assert snapshot["seq"] == 6
+        assert {uid: bal["exp"] for uid, bal in snapshot["balances"].items()} == {"1": 20, "2": 20, "3": 20}
+        await ledger.compact()
+        ledger.close()
+        assert not [name for name in os.listdir(directory) if name.endswith(".tmp")]
+        reopened = Ledger(directory)
+        assert {uid: bal["exp"] for uid, bal in reopened.open().items()} == {1: 25, 2: 20, 3: 20, 4: 7}
+        assert reopened.snapshot_seq == 8
+        reopened.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,16 @@
+import asyncio
+
+from quests import QuestRotation
+
+
+def test_large_catalog_rotation():
+    difficulties = ("easy", "normal", "hard")
+    tasks = [
+        {"id": position, "difficulty": difficulties[position % 3], "emblems": {f"E{position % 7}": 1}}
+        for position in range(1000)
+    ]
+    rotation = QuestRotation(tasks)
+    assert asyncio.run(rotation.rebuild("daily", range(50))) == 50
+    picks = rotation.picks(3, "daily")
+    assert len(picks) == 5
+    assert any(task["id"] >= 256 for user_id in range(50) for task in rotation.picks(user_id, "daily"))
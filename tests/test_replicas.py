@@ -0,0 +1,102 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+import bot  # noqa: E402
+from broadcast import Broadcaster, RateLimiter  # noqa: E402
+from coordination import RedisLock, RedisState, hold  # noqa: E402
+from season import SeasonCalendar  # noqa: E402
+from tenants import Tenant, use_tenant  # noqa: E402
+
+PLAYERS = range(7001, 7011)
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append(chat_id)
+
+
+def make_replica(name, redis, tmp_path):
+    """Реплика с игроками в памяти, но с календарём, рассылкой и блокировками в общем Redis."""
+    tenant = bot.setup_tenant(Tenant(name, "123456:TEST", str(tmp_path / name)))
+    tenant.seasons = SeasonCalendar(RedisState(redis, "t:season"), bot.SEASON_DURATION_DAYS)
+    tenant.broadcaster = Broadcaster(RedisState(redis, "t:broadcast"), RateLimiter(rate=1000, per_chat_interval=0))
+    tenant.season_lock = RedisLock(redis, "t:lock:season", ttl=5)
+    tenant.broadcast_lock = RedisLock(redis, "t:lock:broadcast", ttl=5)
+    with use_tenant(tenant):
+        for user_id in PLAYERS:
+            bot.get_user(user_id)["exp"] = 100
+    return tenant
+
+
+async def tick(tenant, tg_bot):
+    with use_tenant(tenant):
+        tenant.ledger.open()
+        try:
+            await tenant.seasons.load()
+            await bot.season_tick(tg_bot)
+            await tenant.broadcaster.wait()
+        finally:
+            tenant.ledger.close()
+
+
+def test_season_reminder_goes_out_once(tmp_path):
+    async def scenario():
+        redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        replicas = [make_replica(name, redis, tmp_path) for name in ("a", "b")]
+        now = datetime.utcnow()
+        calendar = SeasonCalendar(RedisState(redis, "t:season"))
+        calendar.seasons = [{"number": 1, "start": now - timedelta(days=27), "end": now + timedelta(days=1)}]
+        await calendar.save()
+        bots = [FakeBot(), FakeBot()]
+        await asyncio.gather(*(tick(tenant, tg_bot) for tenant, tg_bot in zip(replicas, bots)))
+        await calendar.load()
+        return calendar, bots
+
+    calendar, bots = asyncio.run(scenario())
+    assert calendar.current["reminded"]
+    assert sorted(bots[0].sent + bots[1].sent) == list(PLAYERS)
+
+
+def test_season_rolls_over_once(tmp_path):
+    async def scenario():
+        redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        replicas = [make_replica(name, redis, tmp_path) for name in ("a", "b")]
+        now = datetime.utcnow()
+        calendar = SeasonCalendar(RedisState(redis, "t:season"))
+        calendar.seasons = [{"number": 1, "start": now - timedelta(days=29), "end": now - timedelta(days=1)}]
+        await calendar.save()
+        await asyncio.gather(*(tick(tenant, FakeBot()) for tenant in replicas))
+        # Следующая проверка: вторая реплика видит новый сезон и ничего не переводит.
+        await asyncio.gather(*(tick(tenant, FakeBot()) for tenant in replicas))
+        await calendar.load()
+        return calendar, replicas
+
+    calendar, replicas = asyncio.run(scenario())
+    assert [entry["number"] for entry in calendar.seasons] == [1, 2]
+    assert all(replica.seasons.number == 2 for replica in replicas)
+
+
+def test_lost_lock_cancels_the_work():
+    async def scenario():
+        redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        mine, theirs = RedisLock(redis, "t:lock", ttl=0.3), RedisLock(redis, "t:lock", ttl=0.3)
+        assert await mine.acquire()
+        assert not await theirs.acquire()
+        work = asyncio.create_task(asyncio.sleep(10))
+        holder = asyncio.create_task(hold(mine, work))
+        await asyncio.sleep(0.5)
+        assert not await theirs.acquire()  # продлевается, пока работа идёт
+        await redis.delete("t:lock")  # блокировка истекла, пока реплика висела
+        assert await theirs.acquire()
+        assert await holder is None
+        assert work.cancelled()
+        assert await redis.get("t:lock") == theirs.token
+
+    asyncio.run(scenario())
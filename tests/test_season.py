@@ -0,0 +1,25 @@
+import asyncio
+import json
+
+import bot
+
+
+def test_rollover_archives_final_ranks():
+    tenant = bot.TENANTS[0]
+    with bot.use_tenant(tenant):
+        asyncio.run(bot.SEASONS.load())
+        bot.LEDGER.open()
+        try:
+            season = bot.SEASONS.number
+            for user_id, exp in ((101, 300), (102, 200), (103, 100)):
+                user = bot.get_user(user_id)
+                user["exp"] = exp
+                user["bp_level"] = bot.level_for_exp(exp)
+                bot.LEADERBOARD.update(user_id, exp)
+            asyncio.run(bot.run_season_rollover())
+            with open(tenant.path("seasons", f"season-{season:03d}.jsonl"), encoding="utf-8") as f:
+                ranks = {row["user_id"]: row["rank"] for row in map(json.loads, f)}
+        finally:
+            bot.LEDGER.close()
+    assert ranks == {101: 1, 102: 2, 103: 3}
+    assert all(bot.USERS[uid]["exp"] == 0 for uid in ranks)
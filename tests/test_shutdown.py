@@ -0,0 +1,94 @@
+import asyncio
+import os
+import signal
+
+import bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import AnswerCallbackQuery, GetMe, GetUpdates
+from aiogram.types import Update, User
+from ledger import EVENT_TASK_COMPLETED, Ledger
+
+USERS = range(2001, 2021)
+UPDATES = 200
+
+
+class FakeTelegram(BaseSession):
+    """Отдаёт пачку колбэков «задание выполнено» и медленно отвечает на остальное."""
+
+    def __init__(self):
+        super().__init__()
+        self.delivered = 0
+        self.busy = 0
+
+    async def make_request(self, tg_bot, method, timeout=None):
+        if isinstance(method, GetMe):
+            return User(id=tg_bot.id, is_bot=True, first_name="test", username="test_bot")
+        if isinstance(method, GetUpdates):
+            offset = method.offset or 1
+            if offset > UPDATES:
+                await asyncio.sleep(0.5)
+                return []
+            updates = [self.update(update_id) for update_id in range(offset, min(offset + 50, UPDATES + 1))]
+            self.delivered += len(updates)
+            return updates
+        if isinstance(method, AnswerCallbackQuery) and method.text and "перегружен" in method.text:
+            self.busy += 1
+            return True
+        await asyncio.sleep(0.2)  # апдейты висят в полёте, пока приходит SIGTERM
+        return True
+
+    @staticmethod
+    def update(update_id: int) -> Update:
+        user_id = USERS[update_id % len(USERS)]
+        return Update.model_validate({
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": {"id": user_id, "is_bot": False, "first_name": "p"},
+                "chat_instance": "c",
+                "data": "task_done_1",
+                "message": {"message_id": 1, "date": 1700000000, "chat": {"id": user_id, "type": "private"}},
+            },
+        })
+
+    async def close(self):
+        pass
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+
+def test_sigterm_during_load_loses_no_mutations(monkeypatch):
+    session = FakeTelegram()
+    real_bot = bot.Bot
+    monkeypatch.setattr(bot, "Bot", lambda token, **kwargs: real_bot(token, session=session, **kwargs))
+    monkeypatch.setattr(bot, "SHUTDOWN_TIMEOUT", 20.0)
+    in_flight_at_signal = []
+
+    async def send_sigterm():
+        while session.delivered < UPDATES:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        in_flight_at_signal.append(len(bot.INFLIGHT))
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    async def scenario():
+        killer = asyncio.create_task(send_sigterm())
+        await bot.main()
+        await killer
+
+    asyncio.run(scenario())
+    assert in_flight_at_signal[0] > 0
+
+    tenant = bot.TENANTS[0]
+    ledger = Ledger(tenant.path("ledger"))
+    balances = ledger.open()
+    completed = sum(
+        1 for user_id in USERS for event in ledger.history(user_id, limit=10 ** 6)
+        if event["type"] == EVENT_TASK_COMPLETED
+    )
+    ledger.close()
+    # Каждое принятое нажатие записано; «занят» получили только не начатые.
+    assert completed == UPDATES - session.busy
+    for user_id in USERS:
+        assert balances[user_id]["exp"] == bot.USERS[user_id]["exp"]
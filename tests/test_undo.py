@@ -0,0 +1,37 @@
+import asyncio
+from types import SimpleNamespace
+
+import bot
+from ledger import EVENT_TASK_COMPLETED
+
+
+def test_undo_of_level_up_revokes_battle_pass_rewards(monkeypatch):
+    monkeypatch.setattr(bot, "is_admin", lambda user_id: True)
+    answers = []
+
+    async def answer(text, **kwargs):
+        answers.append(text)
+
+    async def scenario():
+        user = bot.get_user(5001)
+        before = dict(user["emblems"])
+        exp = bot.total_xp_for_level(2)
+        event = bot.LEDGER.append(user["id"], EVENT_TASK_COMPLETED, exp=exp, task_id=1)
+        rewards = bot.add_exp(user, exp)
+        assert [reward["level"] for reward in rewards] == [2]
+        message = SimpleNamespace(from_user=SimpleNamespace(id=1), answer=answer)
+        await bot.cmd_undo(message, SimpleNamespace(args=str(event["seq"])))
+        return user, before
+
+    with bot.use_tenant(bot.TENANTS[0]):
+        asyncio.run(bot.SEASONS.load())
+        bot.LEDGER.open()
+        try:
+            user, before = asyncio.run(scenario())
+            balances = {uid: bal for uid, bal in bot.LEDGER.balances.items() if uid == 5001}
+        finally:
+            bot.LEDGER.close()
+    assert (user["exp"], user["bp_level"]) == (0, 1)
+    assert user["emblems"] == before
+    assert all(amount == 0 for amount in balances[5001]["emblems"].values())
+    assert "Снята награда" in answers[0]
@@ -0,0 +1,118 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("redis")
+
+from user_store import DEDUCT_SCRIPT, RedisUserStore, UserStoreMiddleware  # noqa: E402
+
+
+def make_store(server) -> RedisUserStore:
+    store = RedisUserStore("redis://localhost", prefix="test")
+    store.redis = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    store._deduct = store.redis.register_script(DEDUCT_SCRIPT)
+    return store
+
+
+def new_user(user_id: int, **emblems) -> dict:
+    return {"id": user_id, "emblems": dict(emblems), "exp": 0}
+
+
+def test_stale_write_back_keeps_remote_deduction():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        a, b = make_store(server), make_store(server)
+        a.cache[1] = new_user(1, X=11)
+        await a.save(a.cache[1])
+        await b.load(1)
+        assert await b.deduct(1, {"X": 11}) == {"X": 0}
+        # У A устаревшая копия с X=11; она меняет другое поле и записывается.
+        a.cache[1]["exp"] = 5
+        a.cache[1]["emblems"]["X"] += 1
+        await a.save(a.cache[1])
+        raw = await a.redis.hgetall("test:user:1")
+        assert raw["e:X"] == "1"
+        assert raw["j:exp"] == "5"
+        assert a.cache[1]["emblems"]["X"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_invalidation_while_pinned_is_applied_on_release():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        a, b = make_store(server), make_store(server)
+        await a.start()
+        a.cache[1] = new_user(1)
+        await a.save(a.cache[1])
+        middleware = UserStoreMiddleware(lambda: a, lambda uid: a.cache[uid])
+
+        async def slow_view(event, data):
+            user = await b.load(1)
+            user["exp"] = 50
+            await b.save(user)
+            await asyncio.sleep(0.05)  # инвалидация приходит, пока игрок занят
+
+        await middleware(slow_view, None, {"event_from_user": SimpleNamespace(id=1)})
+        assert (await a.load(1))["exp"] == 50
+        await a.close()
+
+    asyncio.run(scenario())
+
+
+def test_inline_query_does_not_create_a_player():
+    from aiogram.types import Update
+
+    async def scenario():
+        store = make_store(fakeredis.FakeServer())
+        middleware = UserStoreMiddleware(lambda: store, lambda uid: store.cache.setdefault(uid, new_user(uid)))
+        update = Update.model_validate({
+            "update_id": 1,
+            "inline_query": {"id": "1", "from": {"id": 7, "is_bot": False, "first_name": "p"}, "query": "", "offset": ""},
+        })
+        seen = []
+
+        async def inline_handler(event, data):
+            seen.append(data["user"])
+
+        await middleware(inline_handler, update, {"event_from_user": update.inline_query.from_user})
+        assert seen == [None]
+        assert await store.load(7) is None
+        assert await store.redis.zcard("test:users") == 0
+
+    asyncio.run(scenario())
+
+
+def test_zero_emblems_survive_a_reload():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        a = make_store(server)
+        a.emblems = ["X", "Y", "Z"]
+        a.cache[1] = new_user(1, X=0, Y=2, Z=0)
+        await a.save(a.cache[1])
+        b = make_store(server)
+        b.emblems = a.emblems
+        assert (await b.load(1))["emblems"] == {"X": 0, "Y": 2, "Z": 0}
+        assert (await b.load_many([1]))[1]["emblems"] == {"X": 0, "Y": 2, "Z": 0}
+
+    asyncio.run(scenario())
+
+
+def test_scan_does_not_flush_the_working_set():
+    async def scenario():
+        server = fakeredis.FakeServer()
+        writer = make_store(server)
+        await writer.save_many([new_user(uid, X=uid) for uid in range(1, 15)])
+        store = make_store(server)
+        store.cache.max_size = 3
+        for uid in (1, 2, 3):
+            await store.load(uid)
+        users = await store.load_many(range(1, 15), cold=True)
+        assert len(users) == 14
+        await store.trim()
+        assert sorted(store.cache) == [1, 2, 3]
+        assert sorted(store._synced) == [1, 2, 3]
+
+    asyncio.run(scenario())
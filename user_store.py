@@ -0,0 +1,502 @@
+# user_store.py
+# Хранилище игроков. Бот работает с локальным словарём USERS — это кэш
+# хранилища: перед апдейтом игрок дочитывается, после апдейта записывается,
+# если хендлер его изменил.
+#
+# MemoryUserStore — всё в процессе, как раньше (балансы восстанавливает журнал).
+# RedisUserStore — общее для нескольких реплик состояние в Redis:
+#   {prefix}:user:<id>  — хеш игрока: e:<эмблема> -> int, j:<поле> -> JSON;
+#   {prefix}:users      — sorted set id игроков (обход по курсору для сезона и рассылок);
+#   {prefix}:inval      — канал инвалидации: реплика, записавшая игрока, публикует
+#                         «<реплика>:<id>», остальные выкидывают его из своего кэша.
+# Чтения и записи пачек идут одним пайплайном, списание эмблем — Lua-скриптом,
+# так что две реплики не потратят одни и те же эмблемы дважды. Запись игрока
+# шлёт только изменённые поля, а эмблемы — приращениями HINCRBY относительно
+# последней синхронизации: устаревшая копия на другой реплике не вернёт
+# потраченные эмблемы и не затрёт чужие поля. Кэш реплики —
+# UserCache: ограничен по размеру и времени простоя, лишние игроки вытесняются.
+
+import asyncio
+import bisect
+import json
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+EMBLEM_PREFIX = "e:"
+FIELD_PREFIX = "j:"
+
+# KEYS[1] — хеш игрока; ARGV — пары (эмблема, цена). Возвращает новые балансы или nil.
+DEDUCT_SCRIPT = """
+for i = 1, #ARGV, 2 do
+    local have = tonumber(redis.call('HGET', KEYS[1], 'e:' .. ARGV[i]) or '0')
+    if have < tonumber(ARGV[i + 1]) then
+        return nil
+    end
+end
+local balances = {}
+for i = 1, #ARGV, 2 do
+    balances[#balances + 1] = redis.call('HINCRBY', KEYS[1], 'e:' .. ARGV[i], -tonumber(ARGV[i + 1]))
+end
+return balances
+"""
+
+
+def encode_user(user: Dict) -> Dict[str, str]:
+    fields = {}
+    for key, value in user.items():
+        if key == "emblems":
+            for emb, amount in value.items():
+                fields[EMBLEM_PREFIX + emb] = str(amount)
+        else:
+            fields[FIELD_PREFIX + key] = json.dumps(value, ensure_ascii=False)
+    return fields
+
+
+def decode_user(fields: Dict[str, str], emblems: Iterable[str] = ()) -> Dict:
+    """Обратное encode_user. Нулевые балансы не пишутся (см. save_many), поэтому
+    эмблемы каталога, которых нет в хеше, восстанавливаются нулями."""
+    user: Dict[str, Any] = {"emblems": dict.fromkeys(emblems, 0)}
+    for field, raw in fields.items():
+        if field.startswith(EMBLEM_PREFIX):
+            user["emblems"][field[len(EMBLEM_PREFIX):]] = int(raw)
+        elif field.startswith(FIELD_PREFIX):
+            user[field[len(FIELD_PREFIX):]] = json.loads(raw)
+    return user
+
+
+class UserCache(MutableMapping):
+    """Рабочий набор игроков над хранилищем: LRU не больше max_size записей,
+    игроки без обращений дольше idle_ttl секунд вытесняются.
+
+    Игрок, добавленный в обход хранилища (новый из get_user), считается
+    грязным, пока хранилище его не запишет; такие при вытеснении
+    возвращаются из evict для записи.
+    """
+
+    def __init__(
+        self,
+        max_size: Optional[int] = None,
+        idle_ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.clock = clock
+        # Порядок — по последнему обращению, самые давние в начале.
+        self._data: "OrderedDict[int, Dict]" = OrderedDict()
+        self._touched: Dict[int, float] = {}
+        self.dirty: Set[int] = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _touch(self, user_id: int) -> None:
+        self._data.move_to_end(user_id)
+        self._touched[user_id] = self.clock()
+
+    def __getitem__(self, user_id: int) -> Dict:
+        user = self._data[user_id]
+        self._touch(user_id)
+        return user
+
+    def __setitem__(self, user_id: int, user: Dict) -> None:
+        self.put(user_id, user)
+        self.dirty.add(user_id)
+
+    def __delitem__(self, user_id: int) -> None:
+        del self._data[user_id]
+        del self._touched[user_id]
+        self.dirty.discard(user_id)
+
+    def __contains__(self, user_id: object) -> bool:
+        return user_id in self._data
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self._data))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def put(self, user_id: int, user: Dict, cold: bool = False) -> None:
+        """Игрок, прочитанный из хранилища, — чистый.
+
+        cold — прочитан обходом (сезон, рассылка), а не апдейтом: ставится первым
+        на вытеснение, чтобы обход всех игроков не вытеснил рабочий набор.
+        """
+        self._data[user_id] = user
+        if cold:
+            self._data.move_to_end(user_id, last=False)
+            self._touched[user_id] = self.clock()
+        else:
+            self._touch(user_id)
+
+    def evict(self, pinned: Dict[int, int]) -> Tuple[List[int], List[Dict]]:
+        """Вытесняет лишних и простаивающих (кроме pinned); возвращает их id и грязных из них."""
+        now = self.clock()
+        evicted: List[int] = []
+        dirty = []
+        for user_id in list(self._data):
+            over = self.max_size is not None and len(self._data) > self.max_size
+            idle = self.idle_ttl is not None and now - self._touched[user_id] > self.idle_ttl
+            if not over and not idle:
+                break
+            if user_id in pinned:
+                continue
+            user = self._data.pop(user_id)
+            del self._touched[user_id]
+            if user_id in self.dirty:
+                self.dirty.discard(user_id)
+                dirty.append(user)
+            evicted.append(user_id)
+            self.evictions += 1
+        return evicted, dirty
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class MemoryUserStore:
+    """Игроки только в памяти процесса: кэш и есть хранилище."""
+
+    persistent = False
+
+    def __init__(self):
+        self.cache: Dict[int, Dict] = {}
+        # Отсортированные id для обхода по курсору; игроки отсюда не удаляются,
+        # так что пересортировка нужна, только когда их стало больше.
+        self._sorted_ids: List[int] = []
+
+    async def start(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def load(self, user_id: int) -> Optional[Dict]:
+        return self.cache.get(user_id)
+
+    async def load_many(self, user_ids: Iterable[int], cold: bool = False) -> Dict[int, Dict]:
+        return {uid: self.cache[uid] for uid in user_ids if uid in self.cache}
+
+    async def trim(self) -> None:
+        pass
+
+    async def save(self, user: Dict) -> None:
+        self.cache[user["id"]] = user
+
+    async def save_many(self, users: Iterable[Dict]) -> None:
+        for user in users:
+            self.cache[user["id"]] = user
+
+    async def deduct(self, user_id: int, cost: Dict[str, int]) -> Optional[Dict[str, int]]:
+        emblems = self.cache[user_id]["emblems"]
+        if any(emblems.get(emb, 0) < need for emb, need in cost.items()):
+            return None
+        for emb, need in cost.items():
+            emblems[emb] = emblems.get(emb, 0) - need
+        return {emb: emblems[emb] for emb in cost}
+
+    async def ids(self, after: Optional[int] = None, limit: Optional[int] = None) -> List[int]:
+        if len(self._sorted_ids) != len(self.cache):
+            self._sorted_ids = sorted(self.cache)
+        start = 0 if after is None else bisect.bisect_right(self._sorted_ids, after)
+        end = None if limit is None else start + limit
+        return self._sorted_ids[start:end]
+
+
+class RedisUserStore:
+    persistent = True
+
+    def __init__(
+        self,
+        url: str,
+        prefix: str = "kamigami",
+        cache_size: Optional[int] = None,
+        idle_ttl: Optional[float] = None,
+        emblems: Iterable[str] = (),
+    ):
+        from redis.asyncio import Redis
+
+        self.redis = Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self.emblems = list(emblems)
+        self.instance = uuid.uuid4().hex[:8]
+        self.cache = UserCache(cache_size, idle_ttl)
+        self._deduct = self.redis.register_script(DEDUCT_SCRIPT)
+        self._listener: Optional[asyncio.Task] = None
+        self._sweeper: Optional[asyncio.Task] = None
+        # id -> сколько апдейтов сейчас держат игрока; таких не выкидываем из кэша,
+        # иначе хендлер создал бы пустого игрока и записал его поверх настоящего.
+        self.pinned: Dict[int, int] = {}
+        # Инвалидации, пришедшие, пока игрок был занят: выкидываем его при unpin.
+        self._stale: Set[int] = set()
+        # id -> поля хеша в Redis на момент последнего чтения или записи.
+        self._synced: Dict[int, Dict[str, str]] = {}
+
+    def _key(self, user_id: int) -> str:
+        return f"{self.prefix}:user:{user_id}"
+
+    @property
+    def _index(self) -> str:
+        return f"{self.prefix}:users"
+
+    @property
+    def _channel(self) -> str:
+        return f"{self.prefix}:inval"
+
+    async def start(self) -> None:
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(self._channel)
+        self._listener = asyncio.create_task(self._listen(pubsub))
+        if self.cache.idle_ttl is not None:
+            self._sweeper = asyncio.create_task(self._sweep(max(self.cache.idle_ttl / 4, 1)))
+
+    async def close(self) -> None:
+        for task in (self._listener, self._sweeper):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        dirty = [self.cache[uid] for uid in list(self.cache.dirty) if uid in self.cache]
+        if dirty:
+            await self.save_many(dirty)
+        await self.redis.aclose()
+
+    def pin(self, user_id: int) -> None:
+        self.pinned[user_id] = self.pinned.get(user_id, 0) + 1
+
+    def unpin(self, user_id: int) -> None:
+        if self.pinned[user_id] > 1:
+            self.pinned[user_id] -= 1
+            return
+        del self.pinned[user_id]
+        if user_id in self._stale:
+            # Пока игрок был занят, его записала другая реплика — следующий апдейт перечитает.
+            self._stale.discard(user_id)
+            self._forget(user_id)
+
+    def _forget(self, user_id: int) -> None:
+        self.cache.pop(user_id, None)
+        self._synced.pop(user_id, None)
+
+    async def trim(self) -> None:
+        """Вытесняет лишних из кэша; грязных перед этим записывает (write-back)."""
+        evicted, dirty = self.cache.evict(self.pinned)
+        if dirty:
+            await self.save_many(dirty)
+        for user_id in evicted:
+            self._synced.pop(user_id, None)
+
+    async def _sweep(self, interval: float) -> None:
+        # Простаивающие игроки уходят из кэша, даже если новых апдейтов нет.
+        while True:
+            await asyncio.sleep(interval)
+            await self.trim()
+
+    async def _listen(self, pubsub) -> None:
+        try:
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                instance, _, user_id = message["data"].partition(":")
+                if instance == self.instance:
+                    continue
+                if int(user_id) in self.pinned:
+                    self._stale.add(int(user_id))
+                else:
+                    self._forget(int(user_id))
+        finally:
+            await pubsub.aclose()
+
+    async def load(self, user_id: int) -> Optional[Dict]:
+        """Игрок из кэша, а если его там нет — из Redis (read-through)."""
+        user = self.cache.get(user_id)
+        if user is not None:
+            self.cache.hits += 1
+            return user
+        self.cache.misses += 1
+        fields = await self.redis.hgetall(self._key(user_id))
+        if fields:
+            user = decode_user(fields, self.emblems)
+            self.cache.put(user_id, user)
+            self._synced[user_id] = fields
+        return user
+
+    async def load_many(self, user_ids: Iterable[int], cold: bool = False) -> Dict[int, Dict]:
+        """Пачка игроков одним пайплайном. Обходы читают с cold=True и после пачки
+        зовут trim(): дочитанные игроки уходят из кэша первыми."""
+        user_ids = list(user_ids)
+        found = {uid: self.cache[uid] for uid in user_ids if uid in self.cache}
+        missing = [uid for uid in user_ids if uid not in found]
+        self.cache.hits += len(found)
+        self.cache.misses += len(missing)
+        if missing:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for uid in missing:
+                    pipe.hgetall(self._key(uid))
+                for uid, fields in zip(missing, await pipe.execute()):
+                    if fields:
+                        found[uid] = decode_user(fields, self.emblems)
+                        self.cache.put(uid, found[uid], cold)
+                        self._synced[uid] = fields
+        return found
+
+    async def save(self, user: Dict) -> None:
+        await self.save_many([user])
+
+    async def save_many(self, users: Iterable[Dict]) -> None:
+        """Пишет изменения с последней синхронизации: поля — HSET, эмблемы — HINCRBY."""
+        writes = []
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for user in users:
+                key = self._key(user["id"])
+                fields = encode_user(user)
+                synced = self._synced.get(user["id"], {})
+                changed = {
+                    field: value for field, value in fields.items()
+                    if not field.startswith(EMBLEM_PREFIX) and synced.get(field) != value
+                }
+                removed = [field for field in synced if field.startswith(FIELD_PREFIX) and field not in fields]
+                deltas = {
+                    field: int(value) - int(synced.get(field, 0)) for field, value in fields.items()
+                    if field.startswith(EMBLEM_PREFIX)
+                }
+                deltas = {field: delta for field, delta in deltas.items() if delta}
+                if changed:
+                    pipe.hset(key, mapping=changed)
+                if removed:
+                    pipe.hdel(key, *removed)
+                for field, delta in deltas.items():
+                    pipe.hincrby(key, field, delta)
+                pipe.zadd(self._index, {str(user["id"]): user["id"]})
+                pipe.publish(self._channel, f"{self.instance}:{user['id']}")
+                writes.append((user, fields, list(deltas), bool(changed) + bool(removed)))
+            results = await pipe.execute()
+        position = 0
+        for user, fields, emblem_fields, skipped in writes:
+            position += skipped
+            for field in emblem_fields:
+                # HINCRBY вернул баланс в Redis с учётом чужих списаний; локальные
+                # изменения, сделанные за время записи, сохраняются поверх.
+                emb = field[len(EMBLEM_PREFIX):]
+                written = int(fields[field])
+                balance = results[position]
+                user["emblems"][emb] = balance + user["emblems"].get(emb, 0) - written
+                fields[field] = str(balance)
+                position += 1
+            position += 2
+            if user["id"] in self.cache:
+                self._synced[user["id"]] = fields
+            self.cache.dirty.discard(user["id"])
+
+    async def deduct(self, user_id: int, cost: Dict[str, int]) -> Optional[Dict[str, int]]:
+        """Атомарно списывает эмблемы, если хватает всех; возвращает новые балансы или None."""
+        args = [item for emb, need in cost.items() for item in (emb, need)]
+        balances = await self._deduct(keys=[self._key(user_id)], args=args)
+        if balances is None:
+            return None
+        balances = dict(zip(cost, (int(value) for value in balances)))
+        user = self.cache.get(user_id)
+        synced = self._synced.setdefault(user_id, {})
+        for emb, balance in balances.items():
+            field = EMBLEM_PREFIX + emb
+            if user is not None:
+                # Несохранённые локальные изменения остаются поверх нового баланса.
+                pending = user["emblems"].get(emb, 0) - int(synced.get(field, 0))
+                user["emblems"][emb] = balance + pending
+            synced[field] = str(balance)
+        await self.redis.publish(self._channel, f"{self.instance}:{user_id}")
+        return balances
+
+    async def ids(self, after: Optional[int] = None, limit: Optional[int] = None) -> List[int]:
+        low = "-inf" if after is None else f"({after}"
+        if limit is None:
+            raw = await self.redis.zrangebyscore(self._index, low, "+inf")
+        else:
+            raw = await self.redis.zrangebyscore(self._index, low, "+inf", start=0, num=limit)
+        return [int(uid) for uid in raw]
+
+
+def create_user_store(
+    url: str,
+    prefix: str = "kamigami",
+    cache_size: Optional[int] = None,
+    idle_ttl: Optional[float] = None,
+    emblems: Iterable[str] = (),
+):
+    """memory | redis://host:port/db (нужен пакет redis).
+
+    cache_size и idle_ttl ограничивают кэш только у внешнего хранилища: в памяти
+    процесса вытесненного игрока было бы негде взять обратно. emblems — все
+    эмблемы каталога, их нулевые балансы достраиваются при чтении.
+    """
+    if url == "memory":
+        return MemoryUserStore()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisUserStore(url, prefix, cache_size, idle_ttl, emblems)
+    raise ValueError(f"Неизвестное хранилище игроков: {url}")
+
+
+class UserStoreMiddleware(BaseMiddleware):
+    """Один раз на апдейт достаёт игрока и передаёт его хендлеру аргументом user.
+
+    Хендлеры больше не ищут игрока сами. После хендлера игрок записывается в
+    хранилище, только если хендлер его изменил: сравниваются закодированные
+    поля до и после, так что просмотр меню не стоит ни одной записи.
+
+    Игрок заводится только по сообщениям и кнопкам. Inline-запрос может прислать
+    кто угодно, не нажимавший /start, — такие апдейты получают user=None и не
+    попадают ни в хранилище, ни в рассылки.
+    """
+
+    PLAYER_EVENTS = ("message", "callback_query")
+
+    def __init__(self, store_fn: Callable[[], Any], user_fn: Callable[[int], Dict]):
+        self.store_fn = store_fn
+        # user_fn(id) — игрок из кэша хранилища, новый создаётся по умолчанию.
+        self.user_fn = user_fn
+        self.saved = 0
+        self.skipped = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        from_user = data.get("event_from_user")
+        if from_user is None:
+            return await handler(event, data)
+        if isinstance(event, Update) and event.event_type not in self.PLAYER_EVENTS:
+            data["user"] = None
+            return await handler(event, data)
+        store = self.store_fn()
+        user_id = from_user.id
+        if not store.persistent:
+            data["user"] = self.user_fn(user_id)
+            return await handler(event, data)
+        store.pin(user_id)
+        user, before = None, None
+        try:
+            stored = await store.load(user_id)
+            user = data["user"] = self.user_fn(user_id)
+            # Новый игрок записывается в любом случае — иначе его не будет в индексе.
+            before = encode_user(user) if stored is not None else None
+            return await handler(event, data)
+        finally:
+            try:
+                if user is not None and encode_user(user) != before:
+                    await store.save(user)
+                    self.saved += 1
+                elif user is not None:
+                    self.skipped += 1
+            finally:
+                store.unpin(user_id)
+            await store.trim()
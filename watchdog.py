@@ -0,0 +1,136 @@
+# watchdog.py
+# Сторож event loop: меряет лаг цикла и ловит апдейты, которые надолго
+# занимают его синхронным кодом (рендер клавиатур, тексты и т.п.).
+
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+STACK_DEPTH = 12
+
+
+class LoopWatchdog:
+    """Heartbeat-корутина в цикле + поток-наблюдатель снаружи.
+
+    Если heartbeat не тикал дольше порога, поток снимает стек потока
+    event loop и запоминает, какой апдейт сейчас выполняется.
+    """
+
+    def __init__(self, threshold_ms: int = 200, interval_ms: int = 50, buffer_size: int = 50):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.samples: Deque[Dict] = deque(maxlen=buffer_size)
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.stalls = 0
+        self._updates: Dict[asyncio.Task, Dict] = {}
+        self._beat = time.monotonic()
+        self._pending: Optional[Dict] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._heartbeat_task = self._loop.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag_ms = max(now - expected, 0.0) * 1000
+            self.last_lag_ms = lag_ms
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            pending = self._pending
+            if pending is not None:
+                # Цикл снова живой — фиксируем полную длительность зависания.
+                pending["duration_ms"] = round((now - pending["_since"]) * 1000)
+                self._pending = None
+            self._beat = now
+
+    def _monitor(self) -> None:
+        while not self._stop.wait(self.interval / 2):
+            beat = self._beat
+            blocked = time.monotonic() - beat
+            if blocked < self.threshold or self._pending is not None:
+                continue
+            if self.samples and self.samples[-1]["_since"] == beat:
+                continue
+            self._capture(beat, blocked)
+
+    def _capture(self, beat: float, blocked: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame)[-STACK_DEPTH:] if frame else []
+        task = asyncio.current_task(self._loop) if self._loop else None
+        context = self._updates.get(task, {}) if task else {}
+        sample = {
+            "_since": beat,
+            "at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+            "duration_ms": round(blocked * 1000),
+            "user_id": context.get("user_id"),
+            "data": context.get("data"),
+            "stack": [line.rstrip() for line in stack],
+        }
+        self.stalls += 1
+        self.samples.append(sample)
+        self._pending = sample
+
+    def track(self, user_id: Optional[int], data: Optional[str]) -> None:
+        task = asyncio.current_task()
+        if task is not None:
+            self._updates[task] = {"user_id": user_id, "data": data}
+
+    def untrack(self) -> None:
+        task = asyncio.current_task()
+        if task is not None:
+            self._updates.pop(task, None)
+
+    def recent(self, limit: int = 5) -> List[Dict]:
+        return list(self.samples)[-limit:]
+
+
+class WatchdogMiddleware(BaseMiddleware):
+    """Outer middleware: привязывает текущий апдейт к asyncio-задаче."""
+
+    def __init__(self, watchdog: LoopWatchdog):
+        self.watchdog = watchdog
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user_id, payload = None, None
+        if isinstance(event, Update):
+            inner = event.event
+            from_user = getattr(inner, "from_user", None)
+            user_id = from_user.id if from_user else None
+            payload = getattr(inner, "data", None) or getattr(inner, "text", None)
+        self.watchdog.track(user_id, payload)
+        try:
+            return await handler(event, data)
+        finally:
+            self.watchdog.untrack()